@@ -0,0 +1,154 @@
+"""
+Calibra os parâmetros do Argon2 para o host do deploy e grava no .env
+(ARGON2_TIME_COST, ARGON2_MEMORY_COST, ARGON2_PARALLELISM), lidos por
+src/passwords.py.
+
+Uso (no diretório backend/, na mesma máquina/container que vai servir a API):
+    python calibrate_argon2.py [--target-ms 250] [--max-memory-mib 64] [--dry-run]
+
+Começa pela maior memória permitida e sobe o time_cost enquanto a mediana de
+um hash couber em --target-ms; se nem time_cost=1 couber, divide a memória
+por dois (até --min-memory-mib). Depois mede, com os parâmetros escolhidos, o
+pico de memória de um hash (num processo separado) e a vazão com todos os
+hashes simultâneos que o deploy permite (PASSWORD_POOL_SIZE x --workers).
+
+Hashes antigos continuam válidos: cada usuário ganha o hash novo no próximo
+login, depois da resposta.
+"""
+import argparse
+import os
+import secrets
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from argon2 import PasswordHasher
+
+ENV_KEYS = ("ARGON2_TIME_COST", "ARGON2_MEMORY_COST", "ARGON2_PARALLELISM")
+MAX_TIME_COST = 20
+
+# VmHWM (pico de RSS do processo) e não ru_maxrss, que no Linux herda o pico do processo pai no fork
+RSS_PROBE = """
+import sys
+from argon2 import PasswordHasher
+def peak():
+    with open("/proc/self/status") as status:
+        return next(int(line.split()[1]) for line in status if line.startswith("VmHWM:"))
+hasher = PasswordHasher(time_cost=int(sys.argv[1]), memory_cost=int(sys.argv[2]), parallelism=int(sys.argv[3]))
+before = peak()
+hasher.hash("calibration")
+print(peak() - before)
+"""
+
+def median_ms(hasher, samples):
+    password = secrets.token_urlsafe(16)
+    times = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        hasher.hash(password)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+def calibrate(target_ms, max_memory_kib, min_memory_kib, parallelism, samples):
+    """Retorna (time_cost, memory_cost, ms) da configuração mais cara que cabe em target_ms, ou None"""
+    memory_cost = max_memory_kib
+    while memory_cost >= max(min_memory_kib, 8 * parallelism):
+        best = None
+        for time_cost in range(1, MAX_TIME_COST + 1):
+            ms = median_ms(PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism), samples)
+            print(f"  t={time_cost:<3} m={memory_cost // 1024:>5} MiB  p={parallelism}  {ms:8.1f} ms")
+            if ms > target_ms:
+                break
+            best = (time_cost, memory_cost, ms)
+        if best:
+            return best
+        memory_cost //= 2
+    return None
+
+def peak_rss_kib(time_cost, memory_cost, parallelism):
+    """Quanto um hash aumenta o pico de memória de um processo novo; None fora do Linux"""
+    result = subprocess.run([sys.executable, "-c", RSS_PROBE, str(time_cost), str(memory_cost), str(parallelism)],
+                            capture_output=True, text=True)
+    return int(result.stdout.strip()) if result.returncode == 0 else None
+
+def concurrent_rate(hasher, concurrency, rounds=3):
+    """Hashes por segundo com concurrency hashes ao mesmo tempo (threads, como o pool)"""
+    password = secrets.token_urlsafe(16)
+    total = concurrency * rounds
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda _: hasher.hash(password), range(total)))
+    return total / (time.perf_counter() - start)
+
+def physical_memory_kib():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 1024
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def write_env(path, values):
+    """Atualiza (ou acrescenta) as chaves no .env, mantendo o resto do arquivo"""
+    lines = []
+    if os.path.exists(path):
+        with open(path) as env_file:
+            lines = env_file.read().splitlines()
+
+    pending = dict(values)
+    for i, line in enumerate(lines):
+        key = line.split("=", 1)[0].strip()
+        if key in pending:
+            lines[i] = f"{key}={pending.pop(key)}"
+    lines += [f"{key}={value}" for key, value in pending.items()]
+
+    with open(path, "w") as env_file:
+        env_file.write("\n".join(lines) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-ms", type=float, default=250, help="tempo máximo de um hash (mediana)")
+    parser.add_argument("--max-memory-mib", type=int, default=64)
+    parser.add_argument("--min-memory-mib", type=int, default=19, help="piso recomendado pela OWASP para Argon2id")
+    parser.add_argument("--parallelism", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--samples", type=int, default=5, help="hashes medidos por configuração")
+    parser.add_argument("--workers", type=int, default=3, help="workers do gunicorn (entrypoint.sh)")
+    parser.add_argument("--pool-size", type=int, default=int(os.getenv("PASSWORD_POOL_SIZE", "1")))
+    parser.add_argument("--env-file", default=".env")
+    parser.add_argument("--dry-run", action="store_true", help="só mostra o resultado, sem gravar")
+    args = parser.parse_args()
+
+    print(f"Calibrating Argon2id for {args.target_ms:.0f} ms per hash ({os.cpu_count()} CPUs)")
+    chosen = calibrate(args.target_ms, args.max_memory_mib * 1024, args.min_memory_mib * 1024, args.parallelism, args.samples)
+    if chosen is None:
+        print(f"No configuration with at least {args.min_memory_mib} MiB fits in {args.target_ms:.0f} ms; "
+              f"raise --target-ms or lower --min-memory-mib")
+        sys.exit(1)
+
+    time_cost, memory_cost, ms = chosen
+    hasher = PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=args.parallelism)
+    concurrency = max(1, args.pool_size * args.workers)
+    rss = peak_rss_kib(time_cost, memory_cost, args.parallelism)
+    rate = concurrent_rate(hasher, concurrency)
+
+    print()
+    print(f"chosen: time_cost={time_cost} memory_cost={memory_cost} KiB ({memory_cost // 1024} MiB) parallelism={args.parallelism}")
+    print(f"  one hash:            {ms:.1f} ms median" + (f", peak RSS +{rss // 1024} MiB" if rss is not None else ""))
+    print(f"  {concurrency} concurrent hashes: {rate:.1f} hashes/s ({args.workers} workers x pool {args.pool_size})")
+
+    physical = physical_memory_kib()
+    worst_case = memory_cost * concurrency
+    if physical:
+        print(f"  Argon2 memory at full pool: {worst_case // 1024} MiB of {physical // 1024} MiB")
+        if worst_case > physical // 2:
+            print("  warning: more than half of the host memory; lower --max-memory-mib or PASSWORD_POOL_SIZE")
+
+    values = dict(zip(ENV_KEYS, (time_cost, memory_cost, args.parallelism)))
+    if args.dry_run:
+        print("\n" + "\n".join(f"{key}={value}" for key, value in values.items()))
+        return
+
+    write_env(args.env_file, values)
+    print(f"\nwritten to {args.env_file}; restart the API to apply")
+
+if __name__ == "__main__":
+    main()
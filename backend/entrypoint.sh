@@ -15,4 +15,5 @@ flask db migrate || true
 flask db upgrade
 
 echo "Iniciando servidor..."
-exec gunicorn --bind 0.0.0.0:8000 src.wsgi:app --workers 3
\ No newline at end of file
+# Workers com threads (gthread): enquanto uma thread espera o pool de Argon2 (src/passwords.py) as outras seguem atendendo
+exec gunicorn --bind 0.0.0.0:8000 src.wsgi:app --workers 3 --threads ${GUNICORN_THREADS:-8}
\ No newline at end of file
@@ -0,0 +1,64 @@
+"""Friendship canonical pair key
+
+Revision ID: 5b1e7f3c9a20
+Revises: ca94a4212d1d
+Create Date: 2026-10-18 10:12:41.506213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e7f3c9a20'
+down_revision = 'ca94a4212d1d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('friendships', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('user_low_id', sa.UUID(), nullable=True))
+        batch_op.add_column(sa.Column('user_high_id', sa.UUID(), nullable=True))
+
+    op.execute("""
+        UPDATE friendships SET
+            user_low_id = CASE WHEN requester_id < addressee_id THEN requester_id ELSE addressee_id END,
+            user_high_id = CASE WHEN requester_id < addressee_id THEN addressee_id ELSE requester_id END
+    """)
+
+    # Pedidos nos dois sentidos viram o mesmo par: fica a linha aprovada, senão a mais recente
+    op.execute("""
+        DELETE FROM friendships f
+        USING friendships g
+        WHERE f.user_low_id = g.user_low_id
+          AND f.user_high_id = g.user_high_id
+          AND f.requester_id <> g.requester_id
+          AND (
+              (g.status = 'APPROVED' AND f.status <> 'APPROVED')
+              OR ((g.status = 'APPROVED') = (f.status = 'APPROVED')
+                  AND (g.created_at, g.requester_id) > (f.created_at, f.requester_id))
+          )
+    """)
+
+    with op.batch_alter_table('friendships', schema=None) as batch_op:
+        batch_op.alter_column('user_low_id', existing_type=sa.UUID(), nullable=False)
+        batch_op.alter_column('user_high_id', existing_type=sa.UUID(), nullable=False)
+        batch_op.drop_constraint('friendships_pkey', type_='primary')
+        batch_op.create_primary_key('friendships_pkey', ['user_low_id', 'user_high_id'])
+        batch_op.create_foreign_key('friendships_user_low_id_fkey', 'users', ['user_low_id'], ['id'], ondelete='CASCADE')
+        batch_op.create_foreign_key('friendships_user_high_id_fkey', 'users', ['user_high_id'], ['id'], ondelete='CASCADE')
+        batch_op.create_check_constraint('ck_friend_pair_order', 'user_low_id < user_high_id')
+        batch_op.create_index('ix_friend_high', ['user_high_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('friendships', schema=None) as batch_op:
+        batch_op.drop_index('ix_friend_high')
+        batch_op.drop_constraint('ck_friend_pair_order', type_='check')
+        batch_op.drop_constraint('friendships_user_high_id_fkey', type_='foreignkey')
+        batch_op.drop_constraint('friendships_user_low_id_fkey', type_='foreignkey')
+        batch_op.drop_constraint('friendships_pkey', type_='primary')
+        batch_op.create_primary_key('friendships_pkey', ['requester_id', 'addressee_id'])
+        batch_op.drop_column('user_high_id')
+        batch_op.drop_column('user_low_id')
@@ -0,0 +1,44 @@
+"""Attachments
+
+Revision ID: a9c3e1f7b5d4
+Revises: f2b8d6a4c1e3
+Create Date: 2026-10-18 21:37:12.804165
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c3e1f7b5d4'
+down_revision = 'f2b8d6a4c1e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('attachments',
+    sa.Column('blob_hash', sa.String(length=64), nullable=False),
+    sa.Column('chat_id', sa.UUID(), nullable=False),
+    sa.Column('chat_type', sa.String(length=8), nullable=False),
+    sa.Column('uploader_id', sa.UUID(), nullable=True),
+    sa.Column('recipient_id', sa.UUID(), nullable=True),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('content_type', sa.String(length=127), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.CheckConstraint("chat_type IN ('group', 'dm')", name='ck_attachment_chat_type'),
+    sa.ForeignKeyConstraint(['recipient_id'], ['users.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['uploader_id'], ['users.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('blob_hash', 'chat_id')
+    )
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('attachment', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_column('attachment')
+
+    op.drop_table('attachments')
@@ -0,0 +1,36 @@
+"""Refresh token reaper indexes
+
+Revision ID: b4d8f2a6c9e1
+Revises: a9c3e1f7b5d4
+Create Date: 2026-10-18 23:41:09.318522
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d8f2a6c9e1'
+down_revision = 'a9c3e1f7b5d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    context = op.get_context()
+    if context.dialect.name == 'postgresql':
+        # CONCURRENTLY: a tabela continua atendendo o /auth/refresh enquanto os índices são criados
+        with context.autocommit_block():
+            op.create_index('ix_refresh_tokens_expires_at', 'refresh_tokens', ['expires_at'], unique=False,
+                            postgresql_concurrently=True)
+            op.create_index('ix_refresh_tokens_invalid', 'refresh_tokens', ['expires_at'], unique=False,
+                            postgresql_where=sa.text('NOT is_valid'), postgresql_concurrently=True)
+    else:
+        op.create_index('ix_refresh_tokens_expires_at', 'refresh_tokens', ['expires_at'], unique=False)
+        op.create_index('ix_refresh_tokens_invalid', 'refresh_tokens', ['expires_at'], unique=False,
+                        sqlite_where=sa.text('is_valid = 0'))
+
+
+def downgrade():
+    op.drop_index('ix_refresh_tokens_invalid', table_name='refresh_tokens')
+    op.drop_index('ix_refresh_tokens_expires_at', table_name='refresh_tokens')
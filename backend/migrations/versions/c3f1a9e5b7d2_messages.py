@@ -0,0 +1,40 @@
+"""Messages table
+
+Revision ID: c3f1a9e5b7d2
+Revises: 8d2c4e6f1a37
+Create Date: 2026-10-18 16:41:05.318270
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f1a9e5b7d2'
+down_revision = '8d2c4e6f1a37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('messages',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+    sa.Column('message_id', sa.UUID(), nullable=False),
+    sa.Column('chat_type', sa.String(length=8), nullable=False),
+    sa.Column('chat_id', sa.UUID(), nullable=False),
+    sa.Column('sender_id', sa.UUID(), nullable=True),
+    sa.Column('recipient_id', sa.UUID(), nullable=True),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('sent_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('edited_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True),
+    sa.CheckConstraint("chat_type IN ('group', 'dm')", name='ck_message_chat_type'),
+    sa.ForeignKeyConstraint(['recipient_id'], ['users.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['sender_id'], ['users.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('message_id')
+    )
+
+
+def downgrade():
+    op.drop_table('messages')
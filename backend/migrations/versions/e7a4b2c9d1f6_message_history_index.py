@@ -0,0 +1,29 @@
+"""Message history index
+
+Revision ID: e7a4b2c9d1f6
+Revises: c3f1a9e5b7d2
+Create Date: 2026-10-18 18:22:47.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a4b2c9d1f6'
+down_revision = 'c3f1a9e5b7d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.create_index(
+            'ix_messages_chat_history', ['chat_id', 'sent_at', 'id'], unique=False,
+            postgresql_include=['message_id', 'sender_id', 'edited_at', 'deleted_at']
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_chat_history')
@@ -0,0 +1,52 @@
+"""Sync change tracking
+
+Revision ID: f2b8d6a4c1e3
+Revises: e7a4b2c9d1f6
+Create Date: 2026-10-18 20:14:36.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8d6a4c1e3'
+down_revision = 'e7a4b2c9d1f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('changed_at', sa.DateTime(timezone=True), nullable=True))
+
+    op.execute("UPDATE messages SET changed_at = COALESCE(deleted_at, edited_at, sent_at)")
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.alter_column('changed_at', existing_type=sa.DateTime(timezone=True), nullable=False)
+        batch_op.create_index('ix_messages_chat_changes', ['chat_id', 'changed_at', 'id'], unique=False)
+
+    op.create_table('sync_changes',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+    sa.Column('chat_id', sa.UUID(), nullable=True),
+    sa.Column('user_id', sa.UUID(), nullable=True),
+    sa.Column('type', sa.String(length=32), nullable=False),
+    sa.Column('message', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('sync_changes', schema=None) as batch_op:
+        batch_op.create_index('ix_sync_changes_chat', ['chat_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_sync_changes_user', ['user_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('sync_changes', schema=None) as batch_op:
+        batch_op.drop_index('ix_sync_changes_user')
+        batch_op.drop_index('ix_sync_changes_chat')
+
+    op.drop_table('sync_changes')
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_chat_changes')
+        batch_op.drop_column('changed_at')
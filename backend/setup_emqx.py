@@ -1,9 +1,14 @@
+import os
 import requests
 import time
 
 EMQX_API = "http://localhost:18083/api/v5"
 AUTH = ("admin", "public")
 
+# Conta de serviço do backend e do ingester (ver emqx/etc/acl.conf)
+MQTT_USER = os.getenv("MQTT_USER", "admin")
+MQTT_PASSWORD = os.getenv("MQTT_PASSWORD", "public")
+
 def configure():
     authn_body = {
         "mechanism": "password_based",
@@ -19,5 +24,9 @@ def configure():
     }
     requests.post(f"{EMQX_API}/authorization/sources", json=authz_body, auth=AUTH)
 
+    # 409 se já existir
+    service_account = {"user_id": MQTT_USER, "password": MQTT_PASSWORD}
+    requests.post(f"{EMQX_API}/authentication/password_based:built_in_database/users", json=service_account, auth=AUTH)
+
 if __name__ == "__main__":
     configure()
\ No newline at end of file
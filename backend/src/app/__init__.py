@@ -5,6 +5,7 @@ from flask_cors import CORS
 from dotenv import load_dotenv
 from src.schema import *
 from src.validate import *
+from src.ratelimit import init_rate_limits, RATELIMIT_AUTH, RATELIMIT_USERS, RATELIMIT_GROUPS
 
 base_bp = Blueprint("Base API Blueprint", __name__, url_prefix="/api/v1")
 
@@ -35,13 +36,26 @@ def init_app():
     from .admins import admins_bp
     from .groups import groups_bp
     from .images import images_bp
+    from .history import history_bp
+    from .sync import sync_bp
+    from .attachments import attachments_bp
 
     base_bp.register_blueprint(auth_bp)
     base_bp.register_blueprint(users_bp)
     base_bp.register_blueprint(admins_bp)
     base_bp.register_blueprint(groups_bp)
     base_bp.register_blueprint(images_bp)
+    base_bp.register_blueprint(history_bp)
+    base_bp.register_blueprint(sync_bp)
+    base_bp.register_blueprint(attachments_bp)
     
     app.register_blueprint(base_bp)
 
+    # Corte de carga e limites de taxa (src/ratelimit.py)
+    init_rate_limits(app, [
+        (auth_bp, RATELIMIT_AUTH),
+        (users_bp, RATELIMIT_USERS),
+        (groups_bp, RATELIMIT_GROUPS),
+    ])
+
     return app
\ No newline at end of file
@@ -1,7 +1,7 @@
 from flask import Flask, Blueprint, request, jsonify
 from src.validate import *
 from src.schema import *
-from src.logger import logger
+from src.logger import logger, log_pipeline
 from sqlalchemy.exc import IntegrityError
 
 admins_bp = Blueprint("Administrators Blueprint", __name__, url_prefix="/admins")
@@ -53,3 +53,23 @@ def delete_admin(id, tokenPayload):
     return jsonify({"message": "User is no longer admin"}), 200
 
 
+
+@admins_bp.route("/stats", methods=["GET"])
+@require_auth(role="admin")
+def server_stats(token_payload):
+    from src.app.emqx.mqtt_publisher import MQTTPublisher
+    from src.app.emqx.emqx_service import EmqxService
+    from src import outbox
+    from src.ratelimit import load_shedder
+    from src import token_reaper
+
+    return jsonify({
+        "jwt_cache": token_cache.stats(),
+        "logging": log_pipeline.stats(),
+        "password_pool": password_pool.stats(),
+        "load_shedding": load_shedder.stats(),
+        "token_reaper": token_reaper.token_reaper.stats() if token_reaper.token_reaper else None,
+        "mqtt_publisher": MQTTPublisher.stats(),
+        "emqx_api": EmqxService.stats(),
+        "outbox": dict(outbox.outbox_backlog(), relay=outbox.outbox_relay.stats() if outbox.outbox_relay else None)
+    }), 200
@@ -0,0 +1 @@
+from .routes import *
\ No newline at end of file
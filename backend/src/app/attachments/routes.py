@@ -0,0 +1,191 @@
+import json, os
+from flask import Blueprint, request, jsonify, send_file
+from sqlalchemy import select, and_, or_
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import RequestEntityTooLarge
+from src.validate import *
+from src.schema import *
+from src.logger import logger
+from src.filehandling import *
+from src.outbox import emit_event
+from ..groups.routes import get_member_role
+
+attachments_bp = Blueprint("Attachments Blueprint", __name__, url_prefix="/attachments")
+
+# Tamanho máximo de um anexo, em bytes; só a referência (~200 bytes) passa pelo broker
+ATTACHMENT_MAX_SIZE = int(os.getenv("ATTACHMENT_MAX_SIZE", str(50 * 1024 * 1024)))
+# Margem para os outros campos do multipart
+FORM_OVERHEAD = 64 * 1024
+# O conteúdo de um hash nunca muda: o cliente pode guardar em cache à vontade
+ATTACHMENT_CACHE_SECONDS = 7 * 24 * 3600
+
+def is_blob_hash(value):
+    return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+def send_attachment(chat_type, chat_id, sender_id, recipient_id, topic):
+    """
+    Guarda o arquivo do multipart (campo "file") por hash de conteúdo, grava a
+    mensagem e coloca no outbox um MESSAGE_NEW só com a referência, tudo na
+    mesma transação. "content" (legenda) e "message_id" são opcionais.
+    """
+    request.max_content_length = ATTACHMENT_MAX_SIZE + FORM_OVERHEAD
+    try:
+        file = request.files.get("file")
+        content = request.form.get("content", "")
+        message_id = request.form.get("message_id")
+    except RequestEntityTooLarge:
+        return jsonify({"message": f"Attachments are limited to {ATTACHMENT_MAX_SIZE} bytes"}), 413
+
+    if not file:
+        return jsonify({"message": "'file' is required"}), 400
+    if len(content) > MESSAGE_MAX_LENGTH:
+        return jsonify({"message": f"'content' is longer than {MESSAGE_MAX_LENGTH} characters"}), 400
+    try:
+        message_id = uuid.UUID(message_id) if message_id else uuid.uuid4()
+    except ValueError:
+        return jsonify({"message": "Invalid message_id"}), 400
+
+    if db.session.execute(select(Message.id).where(Message.message_id == message_id)).first():
+        return jsonify({"message": "Message already exists"}), 409
+
+    try:
+        blob_hash, size = store_blob(file.stream, ATTACHMENT_MAX_SIZE)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 413
+
+    attachment = db.session.get(Attachment, (blob_hash, chat_id))
+    if not attachment:
+        attachment = Attachment(
+            blob_hash=blob_hash,
+            chat_id=chat_id,
+            chat_type=chat_type,
+            uploader_id=sender_id,
+            recipient_id=recipient_id,
+            name=(secure_filename(file.filename or "") or "file")[:255],
+            content_type=(file.mimetype or "application/octet-stream")[:127],
+            size=size,
+        )
+        db.session.add(attachment)
+
+    reference = attachment.reference()
+    now = utc_now()
+    db.session.add(Message(
+        message_id=message_id,
+        chat_type=chat_type,
+        chat_id=chat_id,
+        sender_id=sender_id,
+        recipient_id=recipient_id,
+        content=content,
+        attachment=json.dumps(reference),
+        sent_at=now,
+        changed_at=now,
+    ))
+    # Gravada aqui: a regra do EMQX só repassa ao ingester o que os clientes publicam
+    emit_event(topic, "MESSAGE_NEW", sender_id, {"message_id": str(message_id), "content": content, "attachment": reference})
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Outro envio com o mesmo message_id (ou o mesmo arquivo no chat) gravou primeiro
+        db.session.rollback()
+        if db.session.execute(select(Message.id).where(Message.message_id == message_id)).first():
+            return jsonify({"message": "Message already exists"}), 409
+        return jsonify({"message": "Conflict while sending attachment"}), 409
+
+    logger.info(f"Attachment {blob_hash} ({size} bytes) sent to {chat_type} {chat_id}")
+    return jsonify({
+        "message": "Attachment sent",
+        "message_id": str(message_id),
+        "attachment": reference,
+    }), 201
+
+@attachments_bp.route("/groups/<id>", methods=["POST"])
+@require_auth()
+def send_group_attachment(id, token_payload):
+    try:
+        group_id = uuid.UUID(id)
+    except ValueError:
+        return jsonify({"message": "Invalid group id"}), 400
+
+    try:
+        my_id = uuid.UUID(token_payload.get("sub"))
+        if not db.session.get(Group, group_id):
+            return jsonify({"message": "Group not found"}), 404
+
+        if get_member_role(group_id, my_id) is None:
+            return jsonify({"message": "You are not a member of this group"}), 403
+
+        return send_attachment("group", group_id, my_id, None, f"/groups/{group_id}")
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error while sending attachment to group {id}: {str(e)}")
+        return jsonify({"message": "Internal server error"}), 500
+
+@attachments_bp.route("/dms/<user_id>", methods=["POST"])
+@require_auth()
+def send_dm_attachment(user_id, token_payload):
+    try:
+        other_id = uuid.UUID(user_id)
+    except ValueError:
+        return jsonify({"message": "Invalid user id"}), 400
+
+    try:
+        my_id = uuid.UUID(token_payload.get("sub"))
+        friendship = Friendship.get_between(my_id, other_id)
+        if other_id == my_id or not friendship or friendship.status != FriendshipStatus.APPROVED:
+            return jsonify({"message": "You can only send attachments to friends"}), 403
+
+        return send_attachment("dm", Message.dm_chat_id(my_id, other_id), my_id, other_id, f"/dms/{other_id}")
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error while sending attachment to {user_id}: {str(e)}")
+        return jsonify({"message": "Internal server error"}), 500
+
+@attachments_bp.route("/<blob_hash>", methods=["GET"])
+@require_auth()
+def get_attachment(blob_hash, token_payload):
+    """Download do anexo, com suporte a Range (206) e ETag para retomar e ler em partes"""
+    if not is_blob_hash(blob_hash):
+        return jsonify({"message": "Invalid attachment id"}), 400
+
+    try:
+        my_id = uuid.UUID(token_payload.get("sub"))
+        my_groups = select(UserGroup.group_id).where(
+            UserGroup.user_id == my_id,
+            UserGroup.invite_status == FriendshipStatus.APPROVED
+        )
+
+        # Basta o anexo ter sido enviado a um chat do qual o usuário participa
+        attachment = db.session.execute(
+            select(Attachment).where(
+                Attachment.blob_hash == blob_hash,
+                or_(
+                    and_(Attachment.chat_type == "group", Attachment.chat_id.in_(my_groups)),
+                    and_(Attachment.chat_type == "dm", or_(Attachment.uploader_id == my_id, Attachment.recipient_id == my_id)),
+                )
+            ).limit(1)
+        ).scalar_one_or_none()
+
+        path = os.path.abspath(blob_path(blob_hash))
+        # 404 também sem permissão, para não revelar quais arquivos existem
+        if not attachment or not os.path.exists(path):
+            return jsonify({"message": "Attachment not found"}), 404
+
+        response = send_file(
+            path,
+            mimetype=attachment.content_type,
+            as_attachment=True,
+            download_name=attachment.name,
+            conditional=True,
+            etag=blob_hash,
+        )
+        response.cache_control.no_cache = None
+        response.cache_control.private = True
+        response.cache_control.max_age = ATTACHMENT_CACHE_SECONDS
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        return response
+
+    except Exception as e:
+        logger.error(f"Error while reading attachment {blob_hash}: {str(e)}")
+        return jsonify({"message": "Internal server error"}), 500
@@ -1,4 +1,6 @@
-from flask import Flask, Blueprint, request, jsonify
+from flask import Flask, Blueprint, request, jsonify, current_app
+from sqlalchemy import update
+from src.ratelimit import route_limit, client_ip, login_username, RATELIMIT_LOGIN, RATELIMIT_LOGIN_USERNAME, RATELIMIT_REFRESH
 from src.validate import *
 from src.schema import *
 from src.logger import logger
@@ -7,7 +9,21 @@ from sqlalchemy.exc import IntegrityError
 
 auth_bp = Blueprint("Authorization Blueprint", __name__, url_prefix='/auth')
 
+def rehash_password(app, user_id, old_hash, password):
+    """Refaz o hash da senha com os parâmetros atuais do Argon2 (roda no pool, fora da resposta do login)"""
+    try:
+        new_hash = hasher.hash(password)
+        with app.app_context():
+            # Só troca se a senha não mudou enquanto isso
+            db.session.execute(update(User).where(User.id == user_id, User.password == old_hash).values(password=new_hash))
+            db.session.commit()
+        logger.info(f"Password hash of user {user_id} upgraded to current Argon2 parameters")
+    except Exception as e:
+        logger.error(f"Error while rehashing password of user {user_id}: {str(e)}")
+
 @auth_bp.route("/login", methods = ["POST"])
+@route_limit(RATELIMIT_LOGIN, key_func=client_ip)
+@route_limit(RATELIMIT_LOGIN_USERNAME, key_func=login_username)
 def login():
     req = request.get_json()
 
@@ -22,9 +38,14 @@ def login():
         return jsonify({"message": "Wrong credentials"}), 401
     
     try:
-        hasher.verify(user.password, senha)
-    except VerifyMismatchError:
-        return jsonify({"message": "Wrong credentials"}), 401
+        if not password_pool.verify(user.password, senha):
+            return jsonify({"message": "Wrong credentials"}), 401
+    except PasswordPoolBusy:
+        return password_pool_busy()
+
+    if needs_rehash(user.password):
+        # Se o pool estiver ocupado fica para o próximo login
+        password_pool.run_in_background(rehash_password, current_app._get_current_object(), user.id, user.password, senha)
         
     refresh, code = gen_refresh_token(user.id)
     if refresh is None:
@@ -54,6 +75,7 @@ def me_info(token_payload):
     }), 200
 
 @auth_bp.route("/refresh", methods = ["POST"])
+@route_limit(RATELIMIT_REFRESH, key_func=client_ip)
 def refresh():
     req = request.get_json()
     ref_tok = req.get("refresh_token")
@@ -0,0 +1,228 @@
+import os
+import threading
+import time
+from uuid import UUID
+from sqlalchemy import select, or_
+from src.schema import db, User, UserGroup, Friendship, FriendshipStatus
+from src.logger import logger
+from src.leader import run_with_advisory_lock
+from .emqx_service import EmqxClient, user_rules, same_rules
+
+# Usuários por lote (uma query de grupos + uma de amizades, depois as chamadas à API)
+EMQX_RECONCILE_BATCH_SIZE = int(os.getenv("EMQX_RECONCILE_BATCH_SIZE", "200"))
+# Intervalo da varredura completa, em segundos (0 desliga)
+EMQX_SWEEP_INTERVAL = float(os.getenv("EMQX_SWEEP_INTERVAL", "3600"))
+
+# Só um worker faz a varredura completa por vez
+EMQX_SWEEP_LOCK_KEY = 0x0C0C4A8
+
+def desired_rules(user_ids):
+    """
+    Calcula as regras que cada usuário deveria ter no EMQX, a partir de
+    user_groups e friendships, com uma query por tabela para o lote todo.
+
+    Args:
+        user_ids: coleção de UUIDs (strings ou UUID)
+
+    Returns:
+        dict: username (UUID em string) -> regras, só para usuários que existem
+    """
+    ids = [UUID(str(u)) for u in user_ids]
+    if not ids:
+        return {}
+
+    existing = db.session.execute(select(User.id).where(User.id.in_(ids))).scalars().all()
+    groups = {user_id: [] for user_id in existing}
+    friends = {user_id: [] for user_id in existing}
+
+    memberships = db.session.execute(
+        select(UserGroup.user_id, UserGroup.group_id)
+        .where(UserGroup.user_id.in_(existing), UserGroup.invite_status == FriendshipStatus.APPROVED)
+        .order_by(UserGroup.user_id, UserGroup.group_id)
+    )
+    for user_id, group_id in memberships:
+        groups[user_id].append(str(group_id))
+
+    friendships = db.session.execute(
+        select(Friendship.user_low_id, Friendship.user_high_id).where(
+            Friendship.status == FriendshipStatus.APPROVED,
+            or_(Friendship.user_low_id.in_(existing), Friendship.user_high_id.in_(existing))
+        )
+    )
+    for low_id, high_id in friendships:
+        if low_id in friends:
+            friends[low_id].append(str(high_id))
+        if high_id in friends:
+            friends[high_id].append(str(low_id))
+
+    return {
+        str(user_id): user_rules(str(user_id), groups[user_id], sorted(friends[user_id]))
+        for user_id in existing
+    }
+
+def _is_user_uuid(username):
+    try:
+        return str(UUID(username)) == username
+    except (ValueError, TypeError):
+        return False
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+class AclReconciler:
+    """
+    Mantém as regras do banco interno de autorização do EMQX iguais ao que o
+    Postgres diz (estado desejado). Compara o desejado com o que o EMQX tem e
+    só grava as diferenças: PUT para quem mudou, um POST em lote para quem
+    ainda não tem regras e DELETE para usuários que não existem mais.
+    Usernames que não são UUIDs de usuários (ex.: contas de serviço) nunca são
+    tocados. As chamadas passam pelo limite de taxa do EmqxClient.
+    """
+
+    def __init__(self, app, client=None, batch_size=EMQX_RECONCILE_BATCH_SIZE):
+        self.app = app
+        self.client = client or EmqxClient()
+        self.batch_size = batch_size
+
+        self.totals = {"created": 0, "updated": 0, "deleted": 0, "unchanged": 0, "failed": 0}
+        self.last_sweep = None
+        self.sweeping = False
+
+    def reconcile_users(self, user_ids):
+        """Reconciliação incremental: relê do banco e do EMQX só os usuários informados."""
+        result = _empty_result()
+        usernames = sorted({str(u) for u in user_ids if _is_user_uuid(str(u))})
+
+        for chunk in _chunks(usernames, self.batch_size):
+            with self.app.app_context():
+                desired = desired_rules(chunk)
+                db.session.rollback()
+
+            current = self.client.get_rules_many(chunk)
+            _add(result, self._apply(chunk, desired, current))
+
+        return result
+
+    def sweep(self):
+        """
+        Varredura completa: lista todas as regras do EMQX em páginas, percorre
+        todos os usuários do banco em lotes (keyset pelo id) e aplica as
+        diferenças. Sobras no EMQX sem usuário no banco são apagadas.
+        """
+        start = time.monotonic()
+        self.sweeping = True
+        result = _empty_result()
+
+        try:
+            # Lê tudo antes de gravar: apagar durante a paginação deslocaria as páginas
+            current = {username: rules for username, rules in self.client.list_rules() if _is_user_uuid(username)}
+
+            last_id = None
+            while True:
+                with self.app.app_context():
+                    stmt = select(User.id).order_by(User.id).limit(self.batch_size)
+                    if last_id is not None:
+                        stmt = stmt.where(User.id > last_id)
+                    ids = db.session.execute(stmt).scalars().all()
+                    desired = desired_rules(ids) if ids else {}
+                    db.session.rollback()
+
+                if not ids:
+                    break
+                last_id = ids[-1]
+
+                chunk = [str(i) for i in ids]
+                _add(result, self._apply(chunk, desired, {u: current.pop(u, None) for u in chunk}))
+
+            # O que sobrou no EMQX não tem mais usuário no banco
+            for chunk in _chunks(current, self.batch_size):
+                with self.app.app_context():
+                    desired = desired_rules(chunk)
+                    db.session.rollback()
+                _add(result, self._apply(chunk, desired, {u: current[u] for u in chunk}))
+
+        finally:
+            self.sweeping = False
+
+        result["seconds"] = time.monotonic() - start
+        self.last_sweep = dict(result, finished_at=time.time())
+        logger.info(
+            f"EMQX ACL sweep: {result['created']} created, {result['updated']} updated, "
+            f"{result['deleted']} deleted, {result['unchanged']} unchanged, {result['failed']} failed "
+            f"in {result['seconds']:.1f}s"
+        )
+        return result
+
+    def _apply(self, usernames, desired, current):
+        """Compara desejado x atual de um lote e grava só as diferenças. Retorna as contagens do lote."""
+        result = _empty_result()
+        to_put, to_create, to_delete = {}, {}, []
+
+        for username in usernames:
+            have = current.get(username)
+            want = desired.get(username)
+
+            if have is False:
+                result["failed"] += 1
+            elif want is None:
+                if have is not None:
+                    to_delete.append(username)
+                else:
+                    result["unchanged"] += 1
+            elif have is None:
+                to_create[username] = want
+            elif not same_rules(have, want):
+                to_put[username] = want
+            else:
+                result["unchanged"] += 1
+
+        written = {"updated": 0, "created": 0, "failed": []}
+        self.client.write_rules(to_put, to_create, written)
+        result["updated"] += written["updated"]
+        result["created"] += written["created"]
+        result["failed"] += len(written["failed"])
+
+        for username in to_delete:
+            try:
+                self.client.delete_rules(username)
+                result["deleted"] += 1
+            except Exception as e:
+                result["failed"] += 1
+                logger.error(f"EMQX error deleting rules of {username}: {e}")
+
+        _add(self.totals, result)
+        return result
+
+    def stats(self):
+        return dict(self.totals, sweeping=self.sweeping, last_sweep=self.last_sweep)
+
+def _empty_result():
+    return {"created": 0, "updated": 0, "deleted": 0, "unchanged": 0, "failed": 0}
+
+def _add(total, result):
+    for key in _empty_result():
+        total[key] += result[key]
+
+def _sweep_loop(reconciler, interval):
+    """Só varre quem conseguir o lock (src/leader.py); os outros workers pulam a rodada."""
+    while True:
+        time.sleep(interval)
+        try:
+            run_with_advisory_lock(reconciler.app, EMQX_SWEEP_LOCK_KEY, lambda still_leader: reconciler.sweep())
+        except Exception as e:
+            logger.error(f"EMQX ACL sweep failed: {e}")
+
+def start_acl_reconciler(app):
+    """Liga a reconciliação incremental deste worker e a varredura periódica."""
+    from .emqx_service import EMQX_API_ENABLED, get_task_queue
+
+    if not EMQX_API_ENABLED:
+        return None
+
+    reconciler = get_task_queue(app).reconciler
+    if EMQX_SWEEP_INTERVAL > 0:
+        thread = threading.Thread(target=_sweep_loop, args=(reconciler, EMQX_SWEEP_INTERVAL), name="emqx-acl-sweep", daemon=True)
+        thread.start()
+    return reconciler
@@ -1,73 +1,483 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 import requests
-import json
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from src.logger import logger
+from .event_codec import subscriber_topics
 
-EMQX_HOST = "http://emqx:18083/api/v5"
-AUTH = ("admin", "public")
+EMQX_API_URL = os.getenv("EMQX_API_URL", "http://emqx:18083/api/v5")
+EMQX_API_USER = os.getenv("EMQX_API_USER", "admin")
+EMQX_API_PASSWORD = os.getenv("EMQX_API_PASSWORD", "public")
 
-class EmqxService:
-    @staticmethod
-    def create_user(username, password):
-        """Cria o usuário no EMQX para ele poder logar"""
+# Sem isso as rotas não falam com a API do EMQX (a ACL padrão é o webhook HTTP)
+EMQX_API_ENABLED = os.getenv("EMQX_API_ENABLED", "false").lower() in ("1", "true", "yes")
+EMQX_API_CONNECT_TIMEOUT = float(os.getenv("EMQX_API_CONNECT_TIMEOUT", "2"))
+EMQX_API_READ_TIMEOUT = float(os.getenv("EMQX_API_READ_TIMEOUT", "5"))
+EMQX_API_RETRIES = int(os.getenv("EMQX_API_RETRIES", "3"))
+# Conexões HTTP mantidas abertas com a API (e requisições paralelas em operações em lote)
+EMQX_API_POOL_SIZE = int(os.getenv("EMQX_API_POOL_SIZE", "8"))
+# Máximo de requisições por segundo à API, por processo (0 = sem limite)
+EMQX_API_RATE_LIMIT = float(os.getenv("EMQX_API_RATE_LIMIT", "50"))
+
+# Limpa o cache de autorização do EMQX (e desassina tópicos revogados) dos clientes afetados
+# por uma mudança de acesso. Permite um authorization.cache.ttl longo no emqx.conf
+EMQX_AUTHZ_INVALIDATION_ENABLED = os.getenv(
+    "EMQX_AUTHZ_INVALIDATION_ENABLED", "true" if EMQX_API_ENABLED else "false"
+).lower() in ("1", "true", "yes")
+
+# Fila de tarefas em memória (por worker) e quantas tarefas são juntadas num lote
+EMQX_TASK_QUEUE_SIZE = int(os.getenv("EMQX_TASK_QUEUE_SIZE", "10000"))
+EMQX_TASK_BATCH_SIZE = int(os.getenv("EMQX_TASK_BATCH_SIZE", "500"))
+
+RULES_PATH = "/authorization/sources/built_in_database/rules/users"
+
+def user_rules(username, group_ids=(), friend_ids=()):
+    """
+    Regras de ACL do usuário no formato do EMQX. As de assinatura das próprias
+    DMs e do Perfil são as que o webhook anexa na conexão
+    (webhooks.acl_logic.compute_user_permissions).
+    """
+    # Pode assinar as próprias DMs e Perfil, também nas cópias em formato compacto (só o sistema publica em /users)
+    rules = [
+        {"permission": "allow", "action": "subscribe", "topic": topic}
+        for topic in subscriber_topics(f"/dms/{username}") + subscriber_topics(f"/users/{username}")
+    ]
+    for g in group_ids:
+        rules.extend(group_rules(g))
+    # Só pode MANDAR mensagem na DM de amigos
+    rules.extend({"permission": "allow", "action": "publish", "topic": f"/dms/{f}"} for f in friend_ids)
+    return rules
+
+def group_rules(group_id):
+    topic, *encoded = subscriber_topics(f"/groups/{group_id}")
+    # As cópias em formato compacto (event_codec) só o backend publica
+    return [{"permission": "allow", "action": "all", "topic": topic}] + [
+        {"permission": "allow", "action": "subscribe", "topic": t} for t in encoded
+    ]
+
+def _rule_key(rule):
+    return (rule.get("topic"), rule.get("action"), rule.get("permission"))
+
+def same_rules(a, b):
+    """Compara dois conjuntos de regras ignorando a ordem e campos extras do EMQX."""
+    return {_rule_key(r) for r in a} == {_rule_key(r) for r in b}
+
+class RateLimiter:
+    """Token bucket simples, compartilhado pelas threads que usam o mesmo cliente."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            self.waited += delay
+            time.sleep(delay)
+
+class EmqxClient:
+    """
+    Cliente da API REST de gerenciamento do EMQX.
+
+    Usa uma requests.Session com pool de conexões keep-alive, timeout em toda
+    chamada e retry com backoff para erros de conexão e respostas 429/5xx.
+    As operações em lote buscam e gravam as regras de vários usuários em
+    paralelo pelo mesmo pool.
+    """
+
+    def __init__(self, base_url=EMQX_API_URL, auth=(EMQX_API_USER, EMQX_API_PASSWORD),
+                 pool_size=EMQX_API_POOL_SIZE, retries=EMQX_API_RETRIES,
+                 timeout=(EMQX_API_CONNECT_TIMEOUT, EMQX_API_READ_TIMEOUT), rate_limit=EMQX_API_RATE_LIMIT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.limiter = RateLimiter(rate_limit) if rate_limit else None
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.2,
+            status_forcelist=(429, 500, 502, 503, 504),
+            # PUT e DELETE são idempotentes; POST repetido cai no 409 de "já existe"
+            allowed_methods=frozenset(["GET", "PUT", "POST", "DELETE"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.headers.update({"Content-Type": "application/json"})
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.requests = 0
+        self.errors = 0
+        self._latency_total = 0.0
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        if self.limiter is not None:
+            self.limiter.acquire()
+        start = time.monotonic()
         try:
-            url = f"{EMQX_HOST}/authentication/password_based:built_in_database/users"
-            payload = {
-                "user_id": username,
-                "password": password 
-            }
-            res = requests.post(url, json=payload, auth=AUTH)
-            if res.status_code not in [200, 201, 409]: # 409 = ja existe
-                logger.error(f"Erro criando user MQTT: {res.text}")
-            
-            # Já cria as regras iniciais (DMs)
-            EmqxService.set_initial_rules(username)
-            
+            return self.session.request(method, f"{self.base_url}{path}", **kwargs)
+        except requests.RequestException:
+            self.errors += 1
+            raise
+        finally:
+            self.requests += 1
+            self._latency_total += time.monotonic() - start
+
+    def get_rules(self, username):
+        """Regras do usuário, ou None se ele ainda não tem nenhuma no EMQX."""
+        res = self.request("GET", f"{RULES_PATH}/{username}")
+        if res.status_code == 404:
+            return None
+        res.raise_for_status()
+        return res.json().get("rules", [])
+
+    def get_rules_many(self, usernames):
+        """
+        Busca as regras de vários usuários em paralelo pelo pool.
+
+        Returns:
+            dict: username -> regras, None se não tem regras, ou False se a leitura falhou
+        """
+        usernames = list(usernames)
+        if not usernames:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.pool_size, len(usernames)))) as executor:
+            return dict(zip(usernames, executor.map(self._get_rules_safe, usernames)))
+
+    def list_rules(self, page_size=500):
+        """Percorre, página a página, todos os usuários com regras no banco interno. Gera (username, regras)."""
+        page = 1
+        while True:
+            res = self.request("GET", RULES_PATH, params={"page": page, "limit": page_size})
+            res.raise_for_status()
+            body = res.json()
+            data = body.get("data", [])
+            for entry in data:
+                yield entry["username"], entry.get("rules", [])
+
+            meta = body.get("meta", {})
+            has_next = meta.get("hasnext")
+            if has_next is None:
+                has_next = len(data) == page_size
+            if not has_next or not data:
+                return
+            page += 1
+
+    def put_rules(self, username, rules):
+        res = self.request("PUT", f"{RULES_PATH}/{username}", json={"username": username, "rules": rules})
+        res.raise_for_status()
+
+    def create_rules(self, entries):
+        """
+        Cria as regras de vários usuários numa única chamada. entries: dict username -> rules.
+        Retorna False se algum deles já tinha regras (409): o EMQX não cria nenhum.
+        """
+        if not entries:
+            return True
+        res = self.request("POST", RULES_PATH, json=[
+            {"username": username, "rules": rules} for username, rules in entries.items()
+        ])
+        if res.status_code == 409:
+            return False
+        res.raise_for_status()
+        return True
+
+    def delete_rules(self, username):
+        res = self.request("DELETE", f"{RULES_PATH}/{username}")
+        if res.status_code != 404:
+            res.raise_for_status()
+
+    def client_ids(self, username):
+        """Clientes MQTT conectados agora com esse username (o frontend usa web_{userId})."""
+        res = self.request("GET", "/clients", params={"username": username, "limit": 100})
+        res.raise_for_status()
+        return [client["clientid"] for client in res.json().get("data", [])]
+
+    def unsubscribe(self, clientid, topic):
+        res = self.request("POST", f"/clients/{quote(clientid, safe='')}/unsubscribe", json={"topic": topic})
+        # 404: o cliente desconectou nesse meio tempo
+        if res.status_code != 404:
+            res.raise_for_status()
+
+    def clear_authz_cache(self, clientid):
+        res = self.request("DELETE", f"/clients/{quote(clientid, safe='')}/authorization/cache")
+        if res.status_code != 404:
+            res.raise_for_status()
+
+    def invalidate_authz(self, revocations):
+        """
+        Faz o EMQX reavaliar a autorização só dos usuários afetados: para cada
+        cliente conectado do usuário, desassina os tópicos revogados e limpa o
+        cache de autorização daquele cliente. Usuários em paralelo pelo pool.
+
+        Args:
+            revocations: dict username -> tópicos a desassinar (vazio = só limpar o cache)
+
+        Returns:
+            dict: {"clients": n, "failed": [usernames]}
+        """
+        result = {"clients": 0, "failed": []}
+        if not revocations:
+            return result
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.pool_size, len(revocations)))) as executor:
+            outcomes = executor.map(lambda item: self._invalidate_user_safe(*item), revocations.items())
+            for username, clients in zip(revocations, outcomes):
+                if clients is None:
+                    result["failed"].append(username)
+                else:
+                    result["clients"] += clients
+        return result
+
+    def _invalidate_user_safe(self, username, topics):
+        try:
+            clients = self.client_ids(username)
+            for clientid in clients:
+                for topic in topics:
+                    self.unsubscribe(clientid, topic)
+                # Depois do unsubscribe: um novo subscribe já passa pela autorização de novo
+                self.clear_authz_cache(clientid)
+            return len(clients)
+        except requests.RequestException as e:
+            logger.error(f"EMQX error invalidating authorization of {username}: {e}")
+            return None
+
+    def write_rules(self, to_put, to_create, result):
+        """Grava as regras em paralelo (PUT por usuário) e cria as novas num único POST, contando em result."""
+        if to_create:
+            try:
+                if self.create_rules(to_create):
+                    result["created"] += len(to_create)
+                    to_create = {}
+            except requests.RequestException as e:
+                logger.error(f"EMQX bulk rule creation failed for {len(to_create)} users: {e}")
+                result["failed"].extend(to_create)
+                to_create = {}
+
+        # 409: alguém criou as regras de um deles depois da leitura; PUT cria ou substitui
+        to_put = dict(to_put, **to_create)
+        if to_put:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.pool_size, len(to_put)))) as executor:
+                for username, ok in zip(to_put, executor.map(lambda item: self._put_rules_safe(*item), to_put.items())):
+                    if ok:
+                        result["updated"] += 1
+                    else:
+                        result["failed"].append(username)
+
+    def _get_rules_safe(self, username):
+        try:
+            return self.get_rules(username)
+        except requests.RequestException as e:
+            logger.error(f"EMQX error reading rules of {username}: {e}")
+            return False
+
+    def _put_rules_safe(self, username, rules):
+        try:
+            self.put_rules(username, rules)
+            return True
+        except requests.RequestException as e:
+            logger.error(f"EMQX error updating rules of {username}: {e}")
+            return False
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_latency_ms": self._latency_total / self.requests * 1000 if self.requests else None,
+            "rate_limited_seconds": self.limiter.waited if self.limiter is not None else 0.0,
+        }
+
+class EmqxTaskQueue:
+    """
+    Executa as chamadas à API do EMQX fora do caminho da requisição.
+
+    As rotas só enfileiram (sem bloquear). Uma thread por processo junta até
+    EMQX_TASK_BATCH_SIZE tarefas; os pedidos de reconciliação do mesmo lote
+    são deduplicados e passados de uma vez ao AclReconciler. Invalidações de
+    autorização rodam por último, depois que as regras já estão corretas.
+    """
+
+    def __init__(self, client=None, queue_size=EMQX_TASK_QUEUE_SIZE, batch_size=EMQX_TASK_BATCH_SIZE):
+        self.client = client or EmqxClient()
+        self.batch_size = batch_size
+        self.pid = os.getpid()
+        self.reconciler = None
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._worker = threading.Thread(target=self._run, name="emqx-tasks", daemon=True)
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.batches = 0
+        self.applied = 0
+        self.failed = 0
+        self.invalidated_clients = 0
+
+    def start(self):
+        self._worker.start()
+        return self
+
+    def submit(self, task):
+        try:
+            self._queue.put_nowait(task)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"EMQX task queue full, dropping {task[0]} task")
+            return False
+
+        self.enqueued += 1
+        return True
+
+    def reconcile(self, user_id):
+        return self.submit(("reconcile", str(user_id)))
+
+    def invalidate_authz(self, username, topics=()):
+        return self.submit(("authz", str(username), list(topics)))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in batch:
+                batch = [task for task in batch if task is not None]
+                self._apply(batch)
+                return
+
+            self._apply(batch)
+
+    def _apply(self, batch):
+        if not batch:
+            return
+
+        reconcile = set()
+        revocations = {}
+        try:
+            for task in batch:
+                if task[0] == "reconcile":
+                    reconcile.add(task[1])
+                else:
+                    topics = revocations.setdefault(task[1], [])
+                    topics.extend(t for t in task[2] if t not in topics)
+
+            if reconcile and self.reconciler is not None:
+                result = self.reconciler.reconcile_users(reconcile)
+                self.applied += len(reconcile) - result["failed"]
+                self.failed += result["failed"]
+
+            # Só com as regras já gravadas: a próxima checagem do broker tem que ver o estado novo
+            if revocations:
+                result = self.client.invalidate_authz(revocations)
+                self.invalidated_clients += result["clients"]
+                self.applied += len(revocations) - len(result["failed"])
+                self.failed += len(result["failed"])
+
         except Exception as e:
-            logger.error(f"FALHA EMQX: {e}")
+            self.failed += len(batch)
+            logger.error(f"EMQX task batch failed: {e}")
 
-    @staticmethod
-    def set_initial_rules(username):
-        """Define que o usuário pode ler/escrever nas suas DMs"""
-        rules = [
-            # Pode assinar/publicar nas próprias DMs e Perfil
-            {"action": "all", "permission": "allow", "topic": f"/dms/{username}"},
-            {"action": "all", "permission": "allow", "topic": f"/users/{username}"},
-            # Pode MANDAR mensagem pra qualquer DM (pra conversa funcionar)
-            {"action": "publish", "permission": "allow", "topic": "/dms/+"},
-             # Pode MANDAR mensagem pra qualquer User (convite de amizade)
-            {"action": "publish", "permission": "allow", "topic": "/users/+"}
-        ]
-        EmqxService._update_rules(username, rules)
+        self.batches += 1
+
+    def stop(self, timeout=5):
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._worker.join(timeout)
+
+    def stats(self):
+        return dict(
+            self.client.stats(),
+            reconciler=self.reconciler.stats() if self.reconciler is not None else None,
+            queued=self._queue.qsize(),
+            enqueued=self.enqueued,
+            dropped=self.dropped,
+            batches=self.batches,
+            applied=self.applied,
+            failed=self.failed,
+            invalidated_clients=self.invalidated_clients,
+        )
+
+_tasks = None
+_tasks_lock = threading.Lock()
+
+def get_task_queue(app=None):
+    """
+    Fila de tarefas do processo atual, criada na primeira chamada (depois do fork do gunicorn).
+    Com app, liga também o reconciliador, que precisa do banco.
+    """
+    global _tasks
+    if _tasks is None or _tasks.pid != os.getpid():
+        with _tasks_lock:
+            if _tasks is None or _tasks.pid != os.getpid():
+                _tasks = EmqxTaskQueue().start()
+                atexit.register(_tasks.stop)
+
+    if app is not None and _tasks.reconciler is None:
+        from .acl_reconciler import AclReconciler
+        _tasks.reconciler = AclReconciler(app, _tasks.client)
+    return _tasks
+
+class EmqxService:
+    """
+    Fachada usada pelas rotas. Todos os métodos só enfileiram a operação e
+    retornam na hora; nada aqui espera pela API do EMQX.
+    """
 
     @staticmethod
-    def add_group_access(username, group_id):
-        """Pega as regras atuais e adiciona o grupo"""
-        current_rules = EmqxService._get_rules(username)
-        
-        # Cria regra do grupo
-        new_rule = {"action": "all", "permission": "allow", "topic": f"/groups/{group_id}"}
-        
-        # Evita duplicados
-        if new_rule not in current_rules:
-            current_rules.append(new_rule)
-            EmqxService._update_rules(username, current_rules)
+    def reconcile_users(user_ids):
+        """
+        Pede a reconciliação das regras dos usuários com o banco (depois do commit).
+        Usado após mudanças de grupo e amizade: o que o EMQX tiver de diferente é corrigido.
+        """
+        if not EMQX_API_ENABLED:
+            return False
+        tasks = get_task_queue(current_app._get_current_object())
+        return all([tasks.reconcile(user_id) for user_id in user_ids])
 
     @staticmethod
-    def _get_rules(username):
-        try:
-            url = f"{EMQX_HOST}/authorization/sources/built_in_database/rules/users/{username}"
-            res = requests.get(url, auth=AUTH)
-            if res.status_code == 200:
-                return res.json().get('rules', [])
-            return []
-        except:
-            return []
+    def invalidate_authz(user_ids, topics=()):
+        """
+        Pede ao EMQX que esqueça as decisões de autorização em cache dos
+        clientes desses usuários e os desassine de topics (depois do commit).
+        Usado quando um acesso é revogado (topics = tópicos perdidos) ou
+        concedido (sem topics: um "deny" em cache também precisa sair). As
+        cópias dos tópicos em formato compacto saem junto.
+        """
+        if not EMQX_AUTHZ_INVALIDATION_ENABLED:
+            return False
+        topics = [t for topic in topics for t in subscriber_topics(topic)]
+        tasks = get_task_queue(current_app._get_current_object() if EMQX_API_ENABLED else None)
+        return all([tasks.invalidate_authz(user_id, topics) for user_id in user_ids])
 
     @staticmethod
-    def _update_rules(username, rules):
-        try:
-            url = f"{EMQX_HOST}/authorization/sources/built_in_database/rules/users/{username}"
-            payload = {"rules": rules}
-            requests.put(url, json=payload, auth=AUTH)
-        except Exception as e:
-            logger.error(f"Erro atualizando regras: {e}")
\ No newline at end of file
+    def stats():
+        if not EMQX_API_ENABLED and not EMQX_AUTHZ_INVALIDATION_ENABLED:
+            return None
+        return _tasks.stats() if _tasks is not None and _tasks.pid == os.getpid() else None
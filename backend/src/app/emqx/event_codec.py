@@ -0,0 +1,225 @@
+"""
+Codificação dos eventos MQTT ({"type", "from", "payload", "timestamp"}).
+
+Os tópicos de sempre (/users/{id}, /groups/{id}, /dms/{id}) levam JSON sem
+compressão, o que todo cliente lê (o frontend só faz JSON.parse). MessagePack
+e CBOR são formatos compactos (sem aspas nem chaves em texto, timestamp como
+inteiro em milissegundos desde a época), publicados só para quem pede: cada
+formato de MQTT_EVENT_ENCODINGS ganha uma cópia do evento no tópico com o
+sufixo do formato (ex.: /users/{id}/msgpack), e o cliente escolhe o formato
+pelo tópico que assina. Nessas cópias, acima de MQTT_COMPRESS_THRESHOLD bytes
+o payload pode ainda ser comprimido com zstd.
+
+O formato vai na propriedade Content Type do PUBLISH (MQTT v5) e a compressão
+numa user property content-encoding=zstd. Sem propriedades (cliente MQTT 3.1.1
+ou cliente antigo) o payload é tratado como JSON, mas o decode também reconhece
+os formatos pelo primeiro byte.
+"""
+import json
+import os
+import threading
+from datetime import datetime, timezone
+import cbor2
+import msgpack
+import zstandard
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+# Formatos compactos publicados além do JSON, separados por vírgula (ex.: "msgpack,cbor"),
+# cada um em {tópico}/{formato}. Vazio: só JSON
+MQTT_EVENT_ENCODINGS = tuple(e.strip().lower() for e in os.getenv("MQTT_EVENT_ENCODINGS", "").split(",") if e.strip())
+# Payloads compactos com pelo menos esse tamanho (bytes) são comprimidos com zstd (0 desliga)
+MQTT_COMPRESS_THRESHOLD = int(os.getenv("MQTT_COMPRESS_THRESHOLD", "0"))
+MQTT_COMPRESS_LEVEL = int(os.getenv("MQTT_COMPRESS_LEVEL", "3"))
+# Limite do evento descomprimido (protege contra payloads zstd que explodem de tamanho)
+MQTT_MAX_EVENT_SIZE = int(os.getenv("MQTT_MAX_EVENT_SIZE", str(1024 * 1024)))
+
+CONTENT_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "cbor": "application/cbor",
+}
+ENCODINGS = {content_type: encoding for encoding, content_type in CONTENT_TYPES.items()}
+# Sufixos de tópico aceitos na assinatura (webhooks/src/webhooks/topic_rules.py tem a mesma lista)
+COMPACT_ENCODINGS = ("msgpack", "cbor")
+
+CONTENT_ENCODING_PROPERTY = "content-encoding"
+ZSTD = "zstd"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+if not set(MQTT_EVENT_ENCODINGS) <= set(COMPACT_ENCODINGS):
+    raise ValueError(f"MQTT_EVENT_ENCODINGS must only contain {', '.join(COMPACT_ENCODINGS)}")
+
+# Compressores do zstandard não podem ser usados por duas threads ao mesmo tempo
+_local = threading.local()
+
+def _compressor():
+    if not hasattr(_local, "compressor"):
+        _local.compressor = zstandard.ZstdCompressor(level=MQTT_COMPRESS_LEVEL)
+        _local.decompressor = zstandard.ZstdDecompressor()
+    return _local.compressor
+
+def _decompressor():
+    _compressor()
+    return _local.decompressor
+
+def _epoch_ms(timestamp):
+    if isinstance(timestamp, str):
+        moment = datetime.fromisoformat(timestamp)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return int(moment.timestamp() * 1000)
+    return timestamp
+
+def encode_event(event, encoding="json", compress_threshold=MQTT_COMPRESS_THRESHOLD):
+    """
+    Serializa um evento.
+
+    Args:
+        event: dict do evento
+        encoding: json, msgpack ou cbor
+        compress_threshold: tamanho mínimo para tentar zstd (0 desliga)
+
+    Returns:
+        tuple: (payload em bytes, content type, content encoding ou None)
+    """
+    if encoding == "json":
+        data = json.dumps(event).encode()
+    else:
+        compact = dict(event, timestamp=_epoch_ms(event.get("timestamp")))
+        data = msgpack.packb(compact) if encoding == "msgpack" else cbor2.dumps(compact)
+
+    content_encoding = None
+    if compress_threshold and len(data) >= compress_threshold:
+        compressed = _compressor().compress(data)
+        # Payload curto ou pouco repetitivo pode ficar maior comprimido
+        if len(compressed) < len(data):
+            data, content_encoding = compressed, ZSTD
+
+    return data, CONTENT_TYPES[encoding], content_encoding
+
+def _sniff(payload):
+    first = payload[0] if payload else None
+    if first is None or first == 0x7B:
+        return "json"
+    if 0x80 <= first <= 0x8F or first in (0xDE, 0xDF):
+        return "msgpack"
+    if 0xA0 <= first <= 0xBF:
+        return "cbor"
+    return "json"
+
+def _decompress(payload, max_size):
+    """
+    Descomprime um frame zstd sem passar de max_size bytes. O decompress() do
+    zstandard ignora o max_output_size quando o frame declara o tamanho, então
+    o tamanho declarado é conferido antes e a leitura é sempre limitada.
+    """
+    if zstandard.frame_content_size(payload) > max_size:
+        raise ValueError(f"event larger than {max_size} bytes")
+
+    chunks, total = [], 0
+    with _decompressor().stream_reader(payload) as reader:
+        while total <= max_size:
+            chunk = reader.read(max_size + 1 - total)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            total += len(chunk)
+
+    if total > max_size:
+        raise ValueError(f"event larger than {max_size} bytes")
+    return b"".join(chunks)
+
+def decode_event(payload, content_type=None, content_encoding=None):
+    """
+    Lê um evento em qualquer um dos formatos.
+
+    Args:
+        payload: bytes ou str recebidos
+        content_type: Content Type do PUBLISH, se houver
+        content_encoding: user property content-encoding, se houver
+
+    Returns:
+        o valor decodificado (um dict, para eventos válidos)
+    Raises:
+        ValueError: payload malformado, formato desconhecido ou grande demais
+    """
+    if isinstance(payload, str):
+        payload = payload.encode()
+
+    try:
+        if content_encoding == ZSTD or (content_encoding is None and payload[:4] == ZSTD_MAGIC):
+            payload = _decompress(payload, MQTT_MAX_EVENT_SIZE)
+        elif content_encoding is not None:
+            raise ValueError(f"unsupported content encoding {content_encoding}")
+
+        encoding = ENCODINGS.get(content_type.split(";")[0].strip().lower()) if content_type else _sniff(payload)
+        if encoding is None:
+            raise ValueError(f"unsupported content type {content_type}")
+
+        if encoding == "json":
+            return json.loads(payload)
+        if encoding == "msgpack":
+            return msgpack.unpackb(payload, raw=False)
+        return cbor2.loads(payload)
+
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"undecodable payload: {e}")
+
+def publish_properties(content_type, content_encoding=None):
+    """Propriedades MQTT v5 do PUBLISH que anunciam o formato do payload."""
+    properties = Properties(PacketTypes.PUBLISH)
+    properties.ContentType = content_type
+    if content_encoding:
+        properties.UserProperty = (CONTENT_ENCODING_PROPERTY, content_encoding)
+    return properties
+
+def message_encoding(msg):
+    """(content type, content encoding) de uma mensagem recebida; (None, None) sem propriedades."""
+    properties = getattr(msg, "properties", None)
+    if properties is None:
+        return None, None
+
+    content_type = getattr(properties, "ContentType", None)
+    content_encoding = None
+    for key, value in getattr(properties, "UserProperty", None) or []:
+        if key == CONTENT_ENCODING_PROPERTY:
+            content_encoding = value
+    return content_type, content_encoding
+
+def encoded_topic(topic, encoding):
+    """Tópico em que o evento sai no formato dado: o próprio tópico para JSON."""
+    return topic if encoding == "json" else f"{topic}/{encoding}"
+
+def subscriber_topics(topic):
+    """O tópico e as suas cópias em todos os formatos compactos (para desassinar tudo junto)."""
+    return [topic] + [encoded_topic(topic, encoding) for encoding in COMPACT_ENCODINGS]
+
+def event_publications(topic, event, message=None):
+    """
+    Publicações de um evento: JSON sem compressão no tópico, mais uma cópia por
+    formato de MQTT_EVENT_ENCODINGS no tópico com o sufixo do formato.
+
+    Args:
+        topic: tópico MQTT do evento
+        event: dict do evento
+        message: o mesmo evento já em texto JSON (outbox), reaproveitado no tópico base
+
+    Returns:
+        list: (tópico, payload, content type, content encoding ou None), JSON primeiro
+    """
+    if message is None:
+        message, content_type, _ = encode_event(event, "json", compress_threshold=0)
+    else:
+        content_type = CONTENT_TYPES["json"]
+
+    publications = [(topic, message, content_type, None)]
+    for encoding in MQTT_EVENT_ENCODINGS:
+        publications.append((encoded_topic(topic, encoding),) + encode_event(event, encoding))
+    return publications
+
+def stored_event_publications(topic, message):
+    """event_publications de um evento guardado como texto JSON (outbox); o texto segue igual no tópico base."""
+    return event_publications(topic, json.loads(message) if MQTT_EVENT_ENCODINGS else None, message)
@@ -1,48 +1,291 @@
 import paho.mqtt.client as mqtt
-import json
+import atexit
+import os
+import queue
+import socket
+import threading
+import time
 from datetime import datetime, timezone
 from src.logger import logger
+from .event_codec import event_publications, publish_properties
 
-MQTT_BROKER = "emqx"
-MQTT_PORT = 1883
-MQTT_USER = "admin"
-MQTT_PASSWORD = "public"
+MQTT_BROKER = os.getenv("MQTT_BROKER", "emqx")
+MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
+MQTT_USER = os.getenv("MQTT_USER", "admin")
+MQTT_PASSWORD = os.getenv("MQTT_PASSWORD", "public")
+
+# Fila de saída em memória (por worker); com ela cheia os eventos são descartados
+MQTT_QUEUE_SIZE = int(os.getenv("MQTT_QUEUE_SIZE", "10000"))
+# Mensagens QoS1 publicadas e ainda sem PUBACK
+MQTT_MAX_INFLIGHT = int(os.getenv("MQTT_MAX_INFLIGHT", "100"))
+MQTT_RECONNECT_MAX_DELAY = int(os.getenv("MQTT_RECONNECT_MAX_DELAY", "30"))
+MQTT_SHUTDOWN_TIMEOUT = float(os.getenv("MQTT_SHUTDOWN_TIMEOUT", "5"))
+# 5 para anunciar o formato dos eventos no Content Type (event_codec); 3 mantém o MQTT 3.1.1
+MQTT_PROTOCOL_VERSION = int(os.getenv("MQTT_PROTOCOL_VERSION", "5"))
+# PUBACKs de mid ainda não registrado são guardados por este tempo (segundos)
+EARLY_ACK_TTL = 10.0
+
+def new_mqtt_client(client_id):
+    """Cliente paho na versão de protocolo configurada (sessão limpa nas duas)."""
+    if MQTT_PROTOCOL_VERSION == 5:
+        return mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv5)
+    return mqtt.Client(client_id=client_id, clean_session=True)
+
+def connect_async(client, host, port, keepalive=60):
+    if MQTT_PROTOCOL_VERSION == 5:
+        client.connect_async(host, port, keepalive=keepalive, clean_start=True)
+    else:
+        client.connect_async(host, port, keepalive=keepalive)
+
+def reason_string(rc):
+    """Texto do código de retorno do CONNACK (int no 3.1.1, ReasonCodes no v5)."""
+    return mqtt.connack_string(rc) if isinstance(rc, int) else str(rc)
+
+class PersistentPublisher:
+    """
+    Conexão MQTT de longa duração, uma por processo (worker do gunicorn).
+
+    As requisições só chamam enqueue(), que coloca a mensagem numa fila
+    limitada. Uma thread de envio publica com QoS1 quando há conexão, sem
+    passar de MQTT_MAX_INFLIGHT mensagens sem PUBACK. A thread de rede do
+    paho (loop_start) cuida da reconexão, e os PUBACKs são tratados em
+    on_publish, que chama o callback da mensagem, se houver.
+    """
+
+    def __init__(self, host=MQTT_BROKER, port=MQTT_PORT, username=MQTT_USER, password=MQTT_PASSWORD,
+                 queue_size=MQTT_QUEUE_SIZE, max_inflight=MQTT_MAX_INFLIGHT, client_id=None):
+        self.host = host
+        self.port = port
+        self.pid = os.getpid()
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._inflight = threading.BoundedSemaphore(max_inflight)
+        self._pending = {}
+        self._early_acks = {}
+        self._pending_lock = threading.Lock()
+        self._connected = threading.Event()
+        self._stopping = threading.Event()
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.published = 0
+        self.acked = 0
+        self.failed = 0
+        self.connects = 0
+        self.disconnects = 0
+        self._ack_latency_total = 0.0
+
+        self._client = new_mqtt_client(client_id or f"backend-{socket.gethostname()}-{self.pid}")
+        self._client.username_pw_set(username, password)
+        self._client.max_inflight_messages_set(max_inflight)
+        self._client.reconnect_delay_set(min_delay=1, max_delay=MQTT_RECONNECT_MAX_DELAY)
+        self._client.on_connect = self._on_connect
+        self._client.on_disconnect = self._on_disconnect
+        self._client.on_publish = self._on_publish
+
+        self._sender = threading.Thread(target=self._send_loop, name="mqtt-publisher", daemon=True)
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def start(self):
+        # connect_async não bloqueia: a thread de rede conecta e reconecta sozinha
+        connect_async(self._client, self.host, self.port)
+        self._client.loop_start()
+        self._sender.start()
+        return self
+
+    def enqueue(self, topic, payload, on_ack=None, properties=None, cancel=None):
+        """
+        Coloca a mensagem na fila de saída sem esperar pelo broker.
+
+        Args:
+            topic: tópico MQTT
+            payload: str ou bytes
+            on_ack: callback opcional chamado como on_ack(True) no PUBACK
+                ou on_ack(False) se a mensagem não puder ser publicada
+            properties: propriedades MQTT v5 do PUBLISH (ignoradas no 3.1.1)
+            cancel: threading.Event opcional; se estiver setado quando a mensagem
+                chegar à vez dela, ela não é publicada e recebe on_ack(False)
+
+        Returns:
+            bool: False se a fila estiver cheia e a mensagem foi descartada
+        """
+        try:
+            self._queue.put_nowait((topic, payload, on_ack, properties, cancel, time.monotonic()))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"MQTT outbound queue full, dropping message to {topic}")
+            return False
+
+        self.enqueued += 1
+        return True
+
+    def _send_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            topic, payload, on_ack, properties, cancel, enqueued_at = item
+            if MQTT_PROTOCOL_VERSION != 5:
+                properties = None
+            self._inflight.acquire()
+
+            self._connected.wait()
+            if cancel is not None and cancel.is_set():
+                # Conferido depois da espera: o cancelamento pode chegar enquanto o broker está fora
+                self._inflight.release()
+                _call(on_ack, False)
+                continue
+
+            # Sem lock nosso aqui: o paho chama on_publish segurando os locks internos dele
+            info = self._client.publish(topic, payload, qos=1, properties=properties)
+            # NO_CONN (caiu entre o wait() e o publish()) no QoS1: o paho já deu um mid à
+            # mensagem e a guardou, e ela é reenviada na reconexão. Publicar de novo duplicaria o evento.
+            if info.rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+                self._inflight.release()
+                self.failed += 1
+                logger.error(f"Failed to publish to {topic}: {mqtt.error_string(info.rc)}")
+                _call(on_ack, False)
+                continue
+
+            self.published += 1
+            with self._pending_lock:
+                # O PUBACK pode chegar antes de registrarmos o mid
+                acked_early = self._early_acks.pop(info.mid, None) is not None
+                if not acked_early:
+                    self._pending[info.mid] = (on_ack, enqueued_at)
+
+            if acked_early:
+                self._acked(on_ack, enqueued_at)
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            self.connects += 1
+            self._connected.set()
+            logger.info(f"MQTT publisher connected to {self.host}:{self.port}")
+        else:
+            logger.error(f"MQTT publisher connection refused: {reason_string(rc)}")
+
+    def _on_disconnect(self, client, userdata, rc, properties=None):
+        self._connected.clear()
+        if not self._stopping.is_set():
+            self.disconnects += 1
+            # Mensagens QoS1 sem PUBACK continuam no paho e são reenviadas após a reconexão
+            logger.warning(f"MQTT publisher disconnected ({mqtt.error_string(rc)}), reconnecting")
+
+    def _on_publish(self, client, userdata, mid):
+        with self._pending_lock:
+            pending = self._pending.pop(mid, None)
+            if pending is None:
+                now = time.monotonic()
+                # Descarta os antigos: depois que o mid (16 bits) dá a volta, um PUBACK
+                # esquecido aqui marcaria como confirmada uma publicação nova
+                for stale in [m for m, at in self._early_acks.items() if now - at > EARLY_ACK_TTL]:
+                    del self._early_acks[stale]
+                self._early_acks[mid] = now
+                return
+
+        self._acked(*pending)
+
+    def _acked(self, on_ack, enqueued_at):
+        self._inflight.release()
+        self.acked += 1
+        self._ack_latency_total += time.monotonic() - enqueued_at
+        _call(on_ack, True)
+
+    def flush(self, timeout):
+        """Espera a fila e as mensagens sem PUBACK esvaziarem, até timeout segundos."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and (self._queue.qsize() or self._pending):
+            time.sleep(0.05)
+        return not (self._queue.qsize() or self._pending)
+
+    def stop(self, timeout=MQTT_SHUTDOWN_TIMEOUT):
+        if not self.flush(timeout):
+            logger.warning(f"MQTT publisher stopping with {self._queue.qsize()} queued and {len(self._pending)} unacked messages")
+        self._stopping.set()
+        self._client.disconnect()
+        self._client.loop_stop()
+
+    def stats(self):
+        return {
+            "connected": self._connected.is_set(),
+            "queued": self._queue.qsize(),
+            "inflight": len(self._pending),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "published": self.published,
+            "acked": self.acked,
+            "failed": self.failed,
+            "connects": self.connects,
+            "disconnects": self.disconnects,
+            "avg_ack_latency_ms": self._ack_latency_total / self.acked * 1000 if self.acked else None,
+        }
+
+def _call(callback, *args):
+    if callback is None:
+        return
+    try:
+        callback(*args)
+    except Exception as e:
+        logger.error(f"MQTT ack callback error: {e}")
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+def get_publisher():
+    """Publisher do processo atual, criado na primeira chamada (depois do fork do gunicorn)."""
+    global _publisher
+    if _publisher is None or _publisher.pid != os.getpid():
+        with _publisher_lock:
+            if _publisher is None or _publisher.pid != os.getpid():
+                _publisher = PersistentPublisher().start()
+                atexit.register(_publisher.stop)
+    return _publisher
 
 class MQTTPublisher:
+    @staticmethod
+    def build_event(event_type, from_user_id, payload):
+        return {
+            "type": event_type,
+            "from": str(from_user_id),
+            "payload": payload,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+
     @staticmethod
     def publish_event(topic, event_type, from_user_id, payload):
         """
         Publishes an MQTT event to a topic.
 
+        The event only goes into this worker's outbound queue; the persistent
+        publisher sends it with QoS1 in the background, as JSON on the topic and
+        as a copy on {topic}/{encoding} for each of MQTT_EVENT_ENCODINGS.
+
         Args:
             topic: MQTT topic (e.g., "/users/uuid-123")
             event_type: Event type (e.g., "FRIENDREQUEST_RECEIVED")
             from_user_id: UUID of the user triggering the event
             payload: Dictionary with event-specific data
+
+        Returns:
+            bool: True if every copy of the event was queued
         """
         try:
-            client = mqtt.Client()
-            client.username_pw_set(MQTT_USER, MQTT_PASSWORD)
-            client.connect(MQTT_BROKER, MQTT_PORT, 60)
-
-            event = {
-                "type": event_type,
-                "from": str(from_user_id),
-                "payload": payload,
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            }
-
-            message = json.dumps(event)
-            result = client.publish(topic, message, qos=1)
-
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                logger.info(f"Published {event_type} to {topic}")
-            else:
-                logger.error(f"Failed to publish {event_type} to {topic}: {result.rc}")
-
-            client.disconnect()
-            return True
+            publisher = get_publisher()
+            publications = event_publications(topic, MQTTPublisher.build_event(event_type, from_user_id, payload))
+            return all([
+                publisher.enqueue(copy_topic, message, properties=publish_properties(content_type, content_encoding))
+                for copy_topic, message, content_type, content_encoding in publications
+            ])
 
         except Exception as e:
             logger.error(f"MQTT publish error: {e}")
             return False
+
+    @staticmethod
+    def stats():
+        return _publisher.stats() if _publisher is not None and _publisher.pid == os.getpid() else None
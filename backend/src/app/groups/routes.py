@@ -3,10 +3,32 @@ from src.validate import *
 from src.schema import *
 from src.logger import logger
 from src.filehandling import *
+from src.notify import *
+from src.outbox import emit_event, record_change
+from src.app.emqx.mqtt_publisher import MQTTPublisher
+from src.app.emqx.emqx_service import EmqxService
 from sqlalchemy.exc import IntegrityError
 
 groups_bp = Blueprint("Groups Blueprint", __name__, url_prefix="/groups")
 
+def emit_membership_event(group_id, event_type, actor_id, user_id, role=None):
+    """Adiciona ao outbox, na transação atual, um evento GROUPMEMBER_* para /groups/{group_id}"""
+    payload = {"group_id": str(group_id), "user_id": str(user_id)}
+    if role is not None:
+        payload["role"] = role
+    emit_event(f"/groups/{group_id}", event_type, actor_id, payload)
+
+def get_member_role(group_id, user_id):
+    """Retorna o papel do usuário no grupo, ou None se ele não for membro aprovado"""
+    relation = db.session.query(UserGroup).filter_by(
+        group_id=uuid.UUID(str(group_id)),
+        user_id=uuid.UUID(str(user_id))
+    ).first()
+
+    if not relation or relation.invite_status != FriendshipStatus.APPROVED:
+        return None
+    return relation.role
+
 @groups_bp.route("", methods=["POST"])
 @require_auth()
 def create_group(token_payload):
@@ -40,8 +62,11 @@ def create_group(token_payload):
         )
 
         db.session.add(user_group)
+        notify_membership_change(user_id, group.id)
         db.session.commit()
 
+        EmqxService.reconcile_users([user_id])
+
         icon_url = f"{CDN_BASE_URL}{group.icon}" if group.icon else None
 
         logger.info(f"Group created: {group.id} by user {user_id}")
@@ -93,9 +118,22 @@ def delete_group(id, token_payload):
         if group.icon:
             old_icon_path = os.path.join(UPLOAD_FOLDER, group.icon)
 
+        member_ids = [row.user_id for row in db.session.query(UserGroup.user_id).filter_by(group_id=group.id)]
+
         db.session.delete(group)
+        notify_group_deleted(group.id)
+        # Sem tópico para publicar depois da remoção: os membros ficam sabendo pelo /sync
+        for member_id in member_ids:
+            event = MQTTPublisher.build_event(
+                "GROUPMEMBER_REMOVE", requester_id,
+                {"group_id": str(group.id), "user_id": str(member_id), "reason": "group_deleted"}
+            )
+            record_change(event, user_id=member_id)
         db.session.commit()
 
+        EmqxService.reconcile_users(member_ids)
+        EmqxService.invalidate_authz(member_ids, [f"/groups/{uuid.UUID(id)}"])
+
         if old_icon_path:
             delete_file(old_icon_path)
 
@@ -237,6 +275,12 @@ def add_group_member(id: str, token_payload):
             )
 
             db.session.add(user_group)
+            notify_membership_change(user_id, group.id)
+            emit_membership_event(group.id, "GROUPMEMBER_ADD", requester_id, user_id, role)
+
+        EmqxService.reconcile_users([user_id])
+        # Um "deny" do tópico do grupo pode estar no cache do broker
+        EmqxService.invalidate_authz([user_id])
 
         logger.info(f"User {user_id} added to group {group.id} by {requester_id}")
 
@@ -288,8 +332,13 @@ def remove_member(id, user_id, token_payload):
         
         if is_self:
             db.session.delete(target_relation)
+            notify_membership_change(user_id, id)
+            emit_membership_event(id, "GROUPMEMBER_REMOVE", requester_id, user_id)
             db.session.commit()
 
+            EmqxService.reconcile_users([user_id])
+            EmqxService.invalidate_authz([user_id], [f"/groups/{uuid.UUID(id)}"])
+
             logger.info(f"User {user_id} left group {id}")
 
             return jsonify({
@@ -301,8 +350,13 @@ def remove_member(id, user_id, token_payload):
         # owner expulsa outra pessoa
         if requester_role == "owner":
             db.session.delete(target_relation)
+            notify_membership_change(user_id, id)
+            emit_membership_event(id, "GROUPMEMBER_REMOVE", requester_id, user_id)
             db.session.commit()
 
+            EmqxService.reconcile_users([user_id])
+            EmqxService.invalidate_authz([user_id], [f"/groups/{uuid.UUID(id)}"])
+
             logger.info(f"User {user_id} removed from group {id} by owner {requester_id}")
 
             return jsonify({
@@ -317,8 +371,13 @@ def remove_member(id, user_id, token_payload):
                 return jsonify({"message": "Admin can only remove members"}), 403
 
             db.session.delete(target_relation)
+            notify_membership_change(user_id, id)
+            emit_membership_event(id, "GROUPMEMBER_REMOVE", requester_id, user_id)
             db.session.commit()
 
+            EmqxService.reconcile_users([user_id])
+            EmqxService.invalidate_authz([user_id], [f"/groups/{uuid.UUID(id)}"])
+
             logger.info(f"User {user_id} removed from group {id} by admin {requester_id}")
 
             return jsonify({
@@ -387,6 +446,9 @@ def update_member_role(id, user_id, token_payload):
 
             target_relation.role = "admin"
 
+        emit_membership_event(id, "GROUPMEMBER_ROLEEDIT", requester_id, user_id, target_relation.role)
+        if new_role == "owner":
+            emit_membership_event(id, "GROUPMEMBER_ROLEEDIT", requester_id, requester_id, requester_relation.role)
         db.session.commit()
 
         logger.info(
@@ -527,6 +589,7 @@ def invite_user_to_group(id, token_payload):
             )
             db.session.add(new_invite)
 
+        notify_membership_change(target_user.id, group.id)
         db.session.commit()
         logger.info(f"User {target_user_id} invited to group {id} by {requester_id}")
 
@@ -577,8 +640,15 @@ def accept_group_invite(id, token_payload):
         relation.invite_status = FriendshipStatus.APPROVED if action == 'accept' else FriendshipStatus.REJECTED
         relation.entered_at = utc_now()
 
+        notify_membership_change(user_id, group.id)
+        if action == 'accept':
+            emit_membership_event(group.id, "GROUPMEMBER_ADD", user_id, user_id, relation.role)
         db.session.commit()
 
+        if action == 'accept':
+            EmqxService.reconcile_users([user_id])
+            EmqxService.invalidate_authz([user_id])
+
         logger.info(f"User {user_id} accepted invite to group {id}")
 
         return jsonify({
@@ -0,0 +1,131 @@
+import base64, json
+from datetime import datetime
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from sqlalchemy import select, tuple_
+from src.validate import *
+from src.schema import *
+from src.logger import logger
+from ..groups.routes import get_member_role
+
+history_bp = Blueprint("History Blueprint", __name__, url_prefix="/history")
+
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 200
+
+def encode_cursor(sent_at, message_row_id):
+    raw = json.dumps([sent_at.isoformat(), message_row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """Decodifica um cursor de encode_cursor em (sent_at, id). Levanta ValueError se estiver malformado."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sent_at, message_row_id = json.loads(raw)
+        return datetime.fromisoformat(sent_at), int(message_row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def parse_limit():
+    limit = request.args.get("limit", HISTORY_DEFAULT_LIMIT, type=int)
+    if limit is None or limit < 1:
+        raise ValueError("'limit' must be a positive integer")
+    return min(limit, HISTORY_MAX_LIMIT)
+
+def history_query(chat_id, before, limit):
+    """
+    Uma página do chat, das mais novas para as mais antigas. Keyset em
+    (chat_id, sent_at, id): a busca pelo cursor é um range scan em
+    ix_messages_chat_history, então a página 1000 custa o mesmo que a página 1.
+    Busca limit + 1 linhas para saber se há mais.
+    """
+    stmt = select(
+        Message.id, Message.message_id, Message.sender_id, Message.content,
+        Message.sent_at, Message.edited_at, Message.deleted_at, Message.attachment
+    ).where(Message.chat_id == chat_id)
+
+    if before is not None:
+        stmt = stmt.where(tuple_(Message.sent_at, Message.id) < tuple_(*before))
+
+    return stmt.order_by(Message.sent_at.desc(), Message.id.desc()).limit(limit + 1)
+
+def serialize_message(row):
+    return {
+        "uuid": str(row.message_id),
+        "from": str(row.sender_id) if row.sender_id else None,
+        "content": row.content,
+        "sent_at": row.sent_at.isoformat(),
+        "edited_at": row.edited_at.isoformat() if row.edited_at else None,
+        "deleted": row.deleted_at is not None,
+        "attachment": json.loads(row.attachment) if row.attachment and row.deleted_at is None else None,
+    }
+
+def stream_history(chat_id, chat_type):
+    """Envia a página em JSON aos poucos, uma mensagem por vez, com o next_cursor no final"""
+    try:
+        before = request.args.get("before")
+        before = decode_cursor(before) if before else None
+        limit = parse_limit()
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    rows = db.session.execute(history_query(chat_id, before, limit))
+
+    def generate():
+        yield json.dumps({"chat_id": str(chat_id), "type": chat_type})[:-1] + ', "messages": ['
+
+        last = None
+        count = 0
+        for row in rows:
+            if count == limit:
+                # Sobrou uma linha: existe página anterior
+                yield "], " + json.dumps({"next_cursor": encode_cursor(last.sent_at, last.id)})[1:]
+                return
+            yield ("," if count else "") + json.dumps(serialize_message(row))
+            last = row
+            count += 1
+
+        yield '], "next_cursor": null}'
+
+    return Response(stream_with_context(generate()), status=200, mimetype="application/json")
+
+@history_bp.route("/groups/<id>", methods=["GET"])
+@require_auth()
+def get_group_history(id, token_payload):
+    try:
+        group_id = uuid.UUID(id)
+    except ValueError:
+        return jsonify({"message": "Invalid group id"}), 400
+
+    try:
+        group = db.session.get(Group, group_id)
+        if not group:
+            return jsonify({"message": "Group not found"}), 404
+
+        if get_member_role(group_id, token_payload.get("sub")) is None:
+            return jsonify({"message": "You are not a member of this group"}), 403
+
+        return stream_history(group_id, "group")
+
+    except Exception as e:
+        logger.error(f"Error while reading history of group {id}: {str(e)}")
+        return jsonify({"message": "Internal server error"}), 500
+
+@history_bp.route("/dms/<user_id>", methods=["GET"])
+@require_auth()
+def get_dm_history(user_id, token_payload):
+    try:
+        other_id = uuid.UUID(user_id)
+    except ValueError:
+        return jsonify({"message": "Invalid user id"}), 400
+
+    try:
+        my_id = uuid.UUID(token_payload.get("sub"))
+        if other_id == my_id:
+            return jsonify({"message": "There is no DM with yourself"}), 400
+
+        # A conversa é derivada do próprio usuário do token: só os dois participantes chegam nela
+        return stream_history(Message.dm_chat_id(my_id, other_id), "dm")
+
+    except Exception as e:
+        logger.error(f"Error while reading DM history with {user_id}: {str(e)}")
+        return jsonify({"message": "Internal server error"}), 500
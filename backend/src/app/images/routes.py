@@ -1,7 +1,7 @@
 import os
 from flask import Blueprint, send_from_directory, abort
 from werkzeug.utils import secure_filename
-from src.logger import logger
+from src.logger import logger, log_decision
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))) # abominacao
 BASE_STATIC_PATH = os.path.join(BASE_DIR, "static")
@@ -15,7 +15,7 @@ def get_file(filename):
     folder = os.path.join(BASE_STATIC_PATH, "uploads")
 
     file_path = os.path.join(folder, safe_name)
-    logger.info(f"Attempt to load file: {file_path}")
+    log_decision("Attempt to load file: %s", file_path)
     if not os.path.exists(file_path):
         abort(404)
 
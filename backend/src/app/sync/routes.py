@@ -0,0 +1,170 @@
+import base64, json, os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, request, jsonify
+from sqlalchemy import select, tuple_, and_, or_
+from src.validate import *
+from src.schema import *
+from src.logger import logger
+from src.outbox import SYNC_RETENTION_DAYS
+from ..history.routes import encode_cursor, decode_cursor, serialize_message
+from ..users.routes import query_user_groups, query_user_friend_ids
+
+sync_bp = Blueprint("Sync Blueprint", __name__, url_prefix="/sync")
+
+SYNC_DEFAULT_LIMIT = 500
+SYNC_MAX_LIMIT = 2000
+# Gravações só ficam visíveis no commit, que pode vir depois da marca de tempo da linha:
+# o cursor devolvido nunca passa de agora - janela, e o que estiver nela volta no próximo /sync
+SYNC_SAFETY_WINDOW = float(os.getenv("SYNC_SAFETY_WINDOW", "5"))
+
+def encode_position(messages, changes):
+    """Cursor global / token de continuação: uma posição (timestamp, id) por seção"""
+    raw = json.dumps({
+        "m": [messages[0].isoformat(), messages[1]] if messages else None,
+        "c": [changes[0].isoformat(), changes[1]] if changes else None,
+    }).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _as_utc(value):
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def decode_position(token):
+    """Decodifica um token de encode_position em (messages, changes). Levanta ValueError se estiver malformado."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return tuple(
+            (_as_utc(datetime.fromisoformat(raw[key][0])), int(raw[key][1])) if raw.get(key) else None
+            for key in ("m", "c")
+        )
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def parse_sync_request(data):
+    """Valida o corpo: cursor, chats ({chat_id: cursor}), continuation e limit"""
+    if not isinstance(data, dict):
+        raise ValueError("JSON body is required")
+
+    cursor = decode_position(data["cursor"]) if data.get("cursor") else (None, None)
+    continuation = decode_position(data["continuation"]) if data.get("continuation") else (None, None)
+
+    chats = data.get("chats") or {}
+    if not isinstance(chats, dict):
+        raise ValueError("'chats' must be an object of chat id -> cursor")
+    try:
+        chats = {uuid.UUID(chat_id): decode_cursor(mark) for chat_id, mark in chats.items()}
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError("Invalid chat id or cursor in 'chats'")
+
+    limit = data.get("limit", SYNC_DEFAULT_LIMIT)
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+        raise ValueError("'limit' must be a positive integer")
+
+    return cursor, chats, continuation, min(limit, SYNC_MAX_LIMIT)
+
+def _after(columns, position):
+    return tuple_(*columns) > tuple_(*position)
+
+def message_changes_query(bounds, after, limit):
+    """
+    Mensagens novas, editadas e apagadas de vários chats numa única query.
+    Chats com a mesma marca entram na mesma lista do IN, então o OR tem um
+    ramo por marca distinta; cada ramo é um range scan em
+    ix_messages_chat_changes que só lê as linhas alteradas depois da marca.
+    """
+    chats_by_bound = defaultdict(list)
+    for chat_id, bound in bounds.items():
+        chats_by_bound[bound].append(chat_id)
+
+    position = (Message.changed_at, Message.id)
+    branches = []
+    for bound, chat_ids in chats_by_bound.items():
+        branch = Message.chat_id.in_(chat_ids)
+        if bound is not None:
+            branch = and_(branch, _after(position, bound))
+        branches.append(branch)
+
+    stmt = select(
+        Message.id, Message.message_id, Message.chat_type, Message.chat_id, Message.sender_id,
+        Message.content, Message.sent_at, Message.edited_at, Message.deleted_at, Message.changed_at,
+        Message.attachment
+    ).where(or_(*branches))
+
+    if after is not None:
+        stmt = stmt.where(_after(position, after))
+
+    return stmt.order_by(Message.changed_at, Message.id).limit(limit + 1)
+
+def membership_changes_query(user_id, group_ids, bound, limit):
+    """Eventos de membros e de amizade que o usuário vê: dos grupos dele, ou sobre ele"""
+    stmt = select(SyncChange.id, SyncChange.message, SyncChange.created_at).where(
+        or_(SyncChange.chat_id.in_(group_ids), SyncChange.user_id == user_id)
+    )
+    if bound is not None:
+        stmt = stmt.where(_after((SyncChange.created_at, SyncChange.id), bound))
+
+    return stmt.order_by(SyncChange.created_at, SyncChange.id).limit(limit + 1)
+
+def _latest(a, b):
+    if a is None or b is None:
+        return a or b
+    return max(a, b)
+
+def _settled(position, horizon):
+    """Posição entregue como cursor: nunca passa da janela de segurança"""
+    return horizon if position is None or position > horizon else position
+
+@sync_bp.route("", methods=["POST"])
+@require_auth()
+def sync(token_payload):
+    try:
+        cursor, chats, continuation, limit = parse_sync_request(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    try:
+        my_id = uuid.UUID(token_payload.get("sub"))
+        now = datetime.now(timezone.utc)
+
+        group_ids = [r.group_id for r in query_user_groups(my_id, approved_only=True)]
+        dm_chat_ids = [Message.dm_chat_id(my_id, friend_id) for friend_id in query_user_friend_ids(my_id)]
+
+        # Marca de cada chat: a do mapa, senão a do cursor global; chats fora do mapa que
+        # o usuário não acessa mais são ignorados
+        bounds = {chat_id: chats.get(chat_id, cursor[0]) for chat_id in group_ids + dm_chat_ids}
+
+        messages = []
+        if bounds:
+            messages = db.session.execute(message_changes_query(bounds, continuation[0], limit)).all()
+        changes = db.session.execute(
+            membership_changes_query(my_id, group_ids, _latest(cursor[1], continuation[1]), limit)
+        ).all()
+
+        has_more = len(messages) > limit or len(changes) > limit
+        messages, changes = messages[:limit], changes[:limit]
+
+        # Continuação: onde cada seção parou (ou a mesma posição, se a seção já acabou)
+        last_message = (_as_utc(messages[-1].changed_at), messages[-1].id) if messages else continuation[0]
+        last_change = (_as_utc(changes[-1].created_at), changes[-1].id) if changes else continuation[1]
+
+        horizon = (now - timedelta(seconds=SYNC_SAFETY_WINDOW), 0)
+        chat_marks = {}
+        for row in messages:
+            chat_marks[row.chat_id] = _settled((_as_utc(row.changed_at), row.id), horizon)
+
+        body = {
+            "messages": [dict(serialize_message(row), chat_id=str(row.chat_id), type=row.chat_type) for row in messages],
+            "changes": [json.loads(row.message) for row in changes],
+            "chats": {str(chat_id): encode_cursor(*mark) for chat_id, mark in chat_marks.items()},
+            "has_more": has_more,
+            "continuation": encode_position(last_message, last_change) if has_more else None,
+            # Só vale guardar quando has_more é falso
+            "cursor": None if has_more else encode_position(_latest(cursor[0], horizon), _latest(cursor[1], horizon)),
+            # Cursor mais velho que a retenção de sync_changes: recarregar grupos e amigos do zero
+            "reset": cursor[1] is not None and cursor[1][0] < now - timedelta(days=SYNC_RETENTION_DAYS),
+        }
+        return jsonify(body), 200
+
+    except Exception as e:
+        logger.error(f"Error while syncing user {token_payload.get('sub')}: {str(e)}")
+        return jsonify({"message": "Internal server error"}), 500
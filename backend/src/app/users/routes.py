@@ -5,11 +5,16 @@ from ...logger import logger
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import select, or_, and_
 from ...filehandling import *
+from ...notify import *
+from ...outbox import emit_event
+from ..emqx.emqx_service import EmqxService
+from ...ratelimit import route_limit, client_ip, user_or_ip, RATELIMIT_SEARCH, RATELIMIT_SIGNUP
 from werkzeug.utils import secure_filename
 
 users_bp = Blueprint("Users Blueprint", __name__, url_prefix='/user')
 
 @users_bp.route("/", methods=["GET"])
+@route_limit(RATELIMIT_SEARCH, key_func=user_or_ip)
 @require_auth()
 def search_users(token_payload):
     q = request.args.get('q')
@@ -58,6 +63,7 @@ def search_users(token_payload):
     }), 200
 
 @users_bp.route("/", methods=["POST"])
+@route_limit(RATELIMIT_SIGNUP, key_func=client_ip)
 def create_user():
     username = request.form.get("username")
     name = request.form.get("name")
@@ -77,6 +83,12 @@ def create_user():
         msg = f"Username '{username}' taken" if existing_user.username == username else f"Email '{email}' taken"
         return jsonify({"message": msg}), 409
 
+    # Antes de salvar a foto: se o pool de Argon2 estiver cheio não sobra arquivo para apagar
+    try:
+        hashed_password = password_pool.hash(password)
+    except PasswordPoolBusy:
+        return password_pool_busy()
+
     pfp_file = request.files.get("pfp")
     pfp_filename = None
     pfp_path = None
@@ -89,8 +101,6 @@ def create_user():
             return jsonify({"message": "Error saving profile picture"}), 500
     
     try:
-        hashed_password = hasher.hash(password)
-        
         new_user = User(
             username=username,
             name=name,
@@ -108,6 +118,8 @@ def create_user():
 
         access_token = gen_jwt(new_user.id, role="default")
         db.session.commit()
+
+        EmqxService.reconcile_users([new_user.id])
         
         final_pfp_url = f"{CDN_BASE_URL}{pfp_filename}" if pfp_filename else None
 
@@ -212,8 +224,11 @@ def delete_user(id, token_payload):
             return jsonify({"message": "Forbidden"}), 403
 
         db.session.delete(user)
+        notify_user_deleted(user.id)
         db.session.commit()
 
+        EmqxService.reconcile_users([id])
+
         logger.info(f"User removed: {id}")
         return jsonify({"message": "User removed"}), 200
 
@@ -279,7 +294,11 @@ def update_user(id, token_payload):
             user.email = email
 
         if password:
-            user.password = hasher.hash(password)
+            try:
+                user.password = password_pool.hash(password)
+            except PasswordPoolBusy:
+                db.session.rollback()
+                return password_pool_busy()
 
         old_pfp_path = None
         if pfp_file:
@@ -317,6 +336,27 @@ def update_user(id, token_payload):
         logger.error(f"Error while updating user {id}: {str(e)}")
         return jsonify({"message": "Internal server error"}), 500
     
+def query_user_groups(user_id, approved_only=False):
+    """Relações UserGroup do usuário (inclui convites pendentes, a menos que approved_only)"""
+    stmt = select(UserGroup).where(UserGroup.user_id == user_id)
+    if approved_only:
+        stmt = stmt.where(UserGroup.invite_status == FriendshipStatus.APPROVED)
+    return db.session.execute(stmt).scalars().all()
+
+def query_user_friend_ids(user_id):
+    """Ids dos amigos aprovados do usuário, numa única query"""
+    stmt = select(Friendship).where(
+        and_(
+            or_(
+                Friendship.user_low_id == user_id, 
+                Friendship.user_high_id == user_id
+            ),
+            Friendship.status == FriendshipStatus.APPROVED
+        )
+    )
+
+    return [r.other(user_id) for r in db.session.execute(stmt).scalars()]
+
 @users_bp.route('/<id>/groups', methods=["GET"])
 @require_auth()
 def get_user_groups(id, token_payload):
@@ -327,7 +367,7 @@ def get_user_groups(id, token_payload):
     
     if user.id != uuid.UUID(token_payload['sub']) and token_payload['role'] != 'admin':
         return jsonify({"message": "Forbidden"}), 403
-    relations = db.session.query(UserGroup).filter_by(user_id = uuid.UUID(id)).all()
+    relations = query_user_groups(uuid.UUID(id))
 
     x = []
     for r in relations:
@@ -353,23 +393,10 @@ def get_user_friends(id, token_payload):
     if user.id != uuid.UUID(token_payload['sub']) and token_payload['role'] != 'admin':
         return jsonify({"message": "Forbidden"}), 403
     
-    uid = uuid.UUID(id)
-    stmt = select(Friendship).where(
-        and_(
-            or_(
-                Friendship.addressee_id == uid, 
-                Friendship.requester_id == uid
-            ),
-            Friendship.status == FriendshipStatus.APPROVED
-        )
-    )
-
-    relations = db.session.execute(stmt).scalars().all()
-
     x = []
-    for r in relations:
+    for friend_id in query_user_friend_ids(uuid.UUID(id)):
         x.append({
-            "id": r.requester_id if r.addressee_id == uid else r.addressee_id
+            "id": friend_id
         })
     
     return jsonify({
@@ -414,6 +441,7 @@ def send_friend_request(target_id, token_payload):
 
                 existing_friendship.status = FriendshipStatus.PENDING
                 existing_friendship.created_at = utc_now()
+                notify_friendship_change(requester_id, addressee_id)
                 db.session.commit()
                 return jsonify({"message": "Friend request resent"}), 200
 
@@ -424,27 +452,23 @@ def send_friend_request(target_id, token_payload):
     )
 
     db.session.add(new_friendship)
+    notify_friendship_change(requester_id, addressee_id)
+
+    # Evento MQTT para notificar o destinatário, publicado pelo relay do outbox após o commit
+    requester = db.session.get(User, requester_id)
+    emit_event(
+        topic=f"/users/{str(addressee_id)}",
+        event_type="FRIENDREQUEST_RECEIVED",
+        from_user_id=requester_id,
+        payload={
+            "requester_id": str(requester_id),
+            "requester_username": requester.username,
+            "requester_name": requester.name,
+            "requester_pfp_url": requester.pfp
+        }
+    )
     db.session.commit()
 
-    # Publicar evento MQTT para notificar o destinatário
-    try:
-        from src.app.emqx.mqtt_publisher import MQTTPublisher
-
-        requester = db.session.get(User, requester_id)
-        MQTTPublisher.publish_event(
-            topic=f"/users/{str(addressee_id)}",
-            event_type="FRIENDREQUEST_RECEIVED",
-            from_user_id=requester_id,
-            payload={
-                "requester_id": str(requester_id),
-                "requester_username": requester.username,
-                "requester_name": requester.name,
-                "requester_pfp_url": requester.pfp
-            }
-        )
-    except Exception as e:
-        logger.error(f"Error publishing MQTT event: {e}")
-
     return jsonify({"message": "Friend request sent successfully"}), 201
 
 @users_bp.route('/<requester_id>/friends/request', methods=['PATCH'])
@@ -463,12 +487,9 @@ def respond_friend_request(requester_id, token_payload):
     if action not in ['accept', 'reject']:
         return jsonify({"message": "Action must be 'accept' or 'reject'"}), 400
 
-    friendship = db.session.query(Friendship).filter_by(
-        requester_id=req_id,
-        addressee_id=my_id
-    ).first()
+    friendship = Friendship.get_between(req_id, my_id)
 
-    if not friendship:
+    if not friendship or friendship.requester_id != req_id:
         return jsonify({"message": "Friend request not found"}), 404
 
     if friendship.status != FriendshipStatus.PENDING:
@@ -481,27 +502,27 @@ def respond_friend_request(requester_id, token_payload):
         friendship.status = FriendshipStatus.REJECTED
         msg = "Friend request rejected"
 
+    notify_friendship_change(req_id, my_id)
+
+    # Evento MQTT para notificar o remetente original, publicado pelo relay do outbox após o commit
+    my_user = db.session.get(User, my_id)
+    emit_event(
+        topic=f"/users/{str(req_id)}",
+        event_type="FRIENDSTATUS_UPDATE",
+        from_user_id=my_id,
+        payload={
+            "action": action,
+            "user_id": str(my_id),
+            "username": my_user.username,
+            "name": my_user.name,
+            "pfp_url": my_user.pfp
+        }
+    )
     db.session.commit()
 
-    # Publicar evento MQTT para notificar o remetente original
-    try:
-        from src.app.emqx.mqtt_publisher import MQTTPublisher
-
-        my_user = db.session.get(User, my_id)
-        MQTTPublisher.publish_event(
-            topic=f"/users/{str(req_id)}",
-            event_type="FRIENDSTATUS_UPDATE",
-            from_user_id=my_id,
-            payload={
-                "action": action,
-                "user_id": str(my_id),
-                "username": my_user.username,
-                "name": my_user.name,
-                "pfp_url": my_user.pfp
-            }
-        )
-    except Exception as e:
-        logger.error(f"Error publishing MQTT event: {e}")
+    EmqxService.reconcile_users([req_id, my_id])
+    # Aceito ou recusado, a decisão sobre /dms/ um do outro em cache no broker fica velha
+    EmqxService.invalidate_authz([req_id, my_id])
 
     return jsonify({
         "message": msg,
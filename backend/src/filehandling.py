@@ -1,4 +1,6 @@
+import hashlib
 import os
+import tempfile
 import uuid
 from werkzeug.utils import secure_filename
 from src.logger import logger
@@ -7,6 +9,10 @@ UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
 CDN_BASE_URL = "https://localhost:8000/images/"
 
+# Anexos de chat, endereçados pelo sha256 do conteúdo: o mesmo arquivo enviado várias vezes ocupa o disco uma vez
+BLOB_FOLDER = 'static/blobs'
+BLOB_CHUNK_SIZE = 1024 * 1024
+
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 def allowed_file(filename):
@@ -37,4 +43,48 @@ def delete_file(file_path):
         except OSError:
             logger.error(f"An error ocurred while deleting file: {file_path}")
             return False
-    return False
\ No newline at end of file
+    return False
+
+def blob_path(digest):
+    return os.path.join(BLOB_FOLDER, digest[:2], digest)
+
+def store_blob(stream, max_size=None):
+    """
+    Copia um stream para o armazenamento por conteúdo, em blocos, calculando o
+    sha256 no caminho. Se o conteúdo já existir, a cópia nova é descartada.
+
+    Returns:
+        (sha256 em hex, tamanho em bytes)
+    Raises:
+        ValueError: o stream passou de max_size bytes
+    """
+    os.makedirs(BLOB_FOLDER, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=BLOB_FOLDER, prefix=".upload-")
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(BLOB_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise ValueError(f"File is larger than {max_size} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+
+        hexdigest = digest.hexdigest()
+        final_path = blob_path(hexdigest)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            # Rename atômico: quem lê nunca vê um arquivo pela metade
+            os.replace(tmp_path, final_path)
+        return hexdigest, size
+
+    except BaseException:
+        delete_file(tmp_path)
+        raise
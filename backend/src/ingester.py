@@ -0,0 +1,447 @@
+"""
+Ingester de mensagens: grava MESSAGE_NEW, MESSAGE_EDIT e MESSAGE_DELETED na
+tabela messages, em lotes.
+
+Não assina /groups/+ e /dms/+ direto: o campo "from" do evento é escrito pelo
+cliente. Uma regra do EMQX (emqx.conf) republica cada mensagem publicada
+nesses tópicos em ingest/{remetente}/groups/{id} ou ingest/{remetente}/dms/{id},
+com o remetente tirado do client_attrs.user_id que o webhook de conexão define
+a partir do JWT. O ingester assina esses tópicos por uma assinatura
+compartilhada ($share/<grupo>/...) e só aceita eventos cujo "from" é o
+remetente do tópico.
+
+Várias instâncias com o mesmo INGEST_SHARE_GROUP dividem a carga; com
+mqtt.shared_subscription_strategy = hash_topic (emqx.conf) as mensagens de um
+remetente num chat vão para a mesma instância, na ordem.
+
+Uso (a partir de backend/):
+    python -m src.ingester
+"""
+import json, os, queue, re, signal, socket, threading, time
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from uuid import UUID
+from sqlalchemy import select, update, bindparam, or_, and_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError, OperationalError
+from src.schema import db, Message, Attachment, UserGroup, Friendship, FriendshipStatus, MESSAGE_MAX_LENGTH
+from src.logger import logger
+from src.app.emqx.event_codec import decode_event as decode_payload, message_encoding
+from src.app.emqx.mqtt_publisher import new_mqtt_client, connect_async, reason_string
+
+INGEST_SHARE_GROUP = os.getenv("INGEST_SHARE_GROUP", "ingesters")
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+# Tempo máximo que uma mensagem espera na memória até o lote ser gravado
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "0.2"))
+# Com a fila cheia o on_message bloqueia e o broker segura as entregas (backpressure)
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "50000"))
+# Ids de mensagens recentes lembrados para descartar reentregas sem ir ao banco
+INGEST_DEDUPE_SIZE = int(os.getenv("INGEST_DEDUPE_SIZE", "100000"))
+INGEST_STATS_INTERVAL = float(os.getenv("INGEST_STATS_INTERVAL", "30"))
+# Porta HTTP com as estatísticas em JSON (0 = desligado)
+INGEST_STATS_PORT = int(os.getenv("INGEST_STATS_PORT", "0"))
+
+INGEST_TOPICS = ("ingest/+/groups/+", "ingest/+/dms/+")
+MESSAGE_EVENTS = ("MESSAGE_NEW", "MESSAGE_EDIT", "MESSAGE_DELETED")
+
+_UUID = r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
+TOPIC_PATTERN = re.compile(rf'^ingest/({_UUID})/(groups|dms)/({_UUID})$')
+
+def shared_topic(topic, group=INGEST_SHARE_GROUP):
+    return f"$share/{group}/{topic}"
+
+def decode_event(topic, payload, received_at, content_type=None, content_encoding=None):
+    """
+    Converte uma mensagem MQTT republicada pelo EMQX num evento para gravação.
+
+    Returns:
+        dict | None: evento, ou None para eventos que não são de mensagem
+    Raises:
+        ValueError: evento de mensagem malformado ou com "from" diferente do remetente autenticado
+    """
+    match = TOPIC_PATTERN.match(topic.lower())
+    if match is None:
+        raise ValueError(f"unexpected topic {topic}")
+
+    event = decode_payload(payload, content_type, content_encoding)
+    if not isinstance(event, dict):
+        raise ValueError("event is not an object")
+
+    event_type = event.get("type")
+    if event_type not in MESSAGE_EVENTS:
+        return None
+
+    body = event.get("payload") or {}
+    sender, kind, target = match.groups()
+    sender_id = UUID(sender)
+    if UUID(str(event.get("from"))) != sender_id:
+        raise ValueError(f"event from {event.get('from')} published by {sender}")
+    message_id = UUID(str(body.get("message_id")))
+
+    content = body.get("content")
+    # Anexo: só a referência passa pelo broker (ver app/attachments); o texto vira legenda opcional
+    attachment = None
+    if event_type == "MESSAGE_NEW" and body.get("attachment") is not None:
+        attachment = Attachment.parse_reference(body["attachment"])
+        content = content if isinstance(content, str) else ""
+
+    if event_type != "MESSAGE_DELETED":
+        if not isinstance(content, str) or (not content.strip() and attachment is None):
+            raise ValueError("message without content")
+        if len(content) > MESSAGE_MAX_LENGTH:
+            raise ValueError(f"message longer than {MESSAGE_MAX_LENGTH} characters")
+
+    target_id = UUID(target)
+    if kind == "groups":
+        chat_type, chat_id, recipient_id = "group", target_id, None
+    else:
+        chat_type, chat_id, recipient_id = "dm", Message.dm_chat_id(sender_id, target_id), target_id
+
+    return {
+        "type": event_type,
+        "message_id": message_id,
+        "chat_type": chat_type,
+        "chat_id": chat_id,
+        "sender_id": sender_id,
+        "recipient_id": recipient_id,
+        "content": content,
+        "attachment": attachment,
+        "received_at": received_at,
+    }
+
+def _insert(dialect):
+    """INSERT ... ON CONFLICT (message_id) DO NOTHING do dialeto em uso."""
+    module = postgresql if dialect == "postgresql" else sqlite
+    return module.insert(Message.__table__).on_conflict_do_nothing(index_elements=["message_id"])
+
+def authorized_events(events):
+    """
+    Descarta eventos cujo remetente não é (mais) membro do grupo ou amigo do
+    destinatário. Uma query por tipo de chat para o lote todo.
+    """
+    group_pairs = {(e["sender_id"], e["chat_id"]) for e in events if e["chat_type"] == "group"}
+    dm_pairs = {Friendship.pair_key(e["sender_id"], e["recipient_id"]) for e in events if e["chat_type"] == "dm"}
+
+    members = set()
+    if group_pairs:
+        members = set(db.session.execute(
+            select(UserGroup.user_id, UserGroup.group_id).where(
+                UserGroup.user_id.in_({u for u, _ in group_pairs}),
+                UserGroup.group_id.in_({g for _, g in group_pairs}),
+                UserGroup.invite_status == FriendshipStatus.APPROVED
+            )
+        ).tuples())
+
+    friends = set()
+    if dm_pairs:
+        friends = set(db.session.execute(
+            select(Friendship.user_low_id, Friendship.user_high_id).where(
+                or_(*(and_(Friendship.user_low_id == low, Friendship.user_high_id == high) for low, high in dm_pairs)),
+                Friendship.status == FriendshipStatus.APPROVED
+            )
+        ).tuples())
+
+    return [
+        e for e in events
+        if ((e["sender_id"], e["chat_id"]) in members if e["chat_type"] == "group"
+            else Friendship.pair_key(e["sender_id"], e["recipient_id"]) in friends)
+    ]
+
+def is_transient(error):
+    """Erro de conexão com o banco: o mesmo lote pode dar certo numa nova tentativa"""
+    return isinstance(error, OperationalError) or (isinstance(error, DBAPIError) and error.connection_invalidated)
+
+def store_events(events):
+    """
+    Grava um lote de eventos numa transação: as mensagens novas num único
+    INSERT de várias linhas (duplicatas ignoradas pelo message_id), depois as
+    edições e remoções com executemany. Só o autor edita ou apaga.
+
+    Returns:
+        dict: contagens do lote (inserted, duplicates, edited, deleted, rejected)
+    """
+    allowed = authorized_events(events)
+    counts = {"inserted": 0, "duplicates": 0, "edited": 0, "deleted": 0, "rejected": len(events) - len(allowed)}
+
+    new_rows = {}
+    edits, deletes = [], []
+    for e in allowed:
+        if e["type"] == "MESSAGE_NEW":
+            if e["message_id"] in new_rows:
+                counts["duplicates"] += 1
+                continue
+            new_rows[e["message_id"]] = {
+                "message_id": e["message_id"],
+                "chat_type": e["chat_type"],
+                "chat_id": e["chat_id"],
+                "sender_id": e["sender_id"],
+                "recipient_id": e["recipient_id"],
+                "content": e["content"],
+                "attachment": json.dumps(e["attachment"]) if e["attachment"] else None,
+                "sent_at": e["received_at"],
+            }
+        elif e["type"] == "MESSAGE_EDIT":
+            edits.append({"b_id": e["message_id"], "b_sender": e["sender_id"], "b_content": e["content"], "b_at": e["received_at"]})
+        else:
+            deletes.append({"b_id": e["message_id"], "b_sender": e["sender_id"], "b_at": e["received_at"]})
+
+    table = Message.__table__
+    # Hora da gravação (não a do recebimento): é ela que o /sync usa de marca
+    written_at = datetime.now(timezone.utc)
+
+    if new_rows:
+        rows = [dict(row, changed_at=written_at) for row in new_rows.values()]
+        result = db.session.execute(_insert(db.engine.dialect.name).values(rows))
+        counts["inserted"] = result.rowcount
+        counts["duplicates"] += len(new_rows) - result.rowcount
+
+    if edits:
+        result = db.session.execute(
+            update(table)
+            .where(table.c.message_id == bindparam("b_id"), table.c.sender_id == bindparam("b_sender"), table.c.deleted_at.is_(None))
+            .values(content=bindparam("b_content"), edited_at=bindparam("b_at"), changed_at=written_at),
+            edits
+        )
+        counts["edited"] = result.rowcount
+
+    if deletes:
+        # Fica só a marca da remoção; o conteúdo sai do banco
+        result = db.session.execute(
+            update(table)
+            .where(table.c.message_id == bindparam("b_id"), table.c.sender_id == bindparam("b_sender"), table.c.deleted_at.is_(None))
+            .values(content="", attachment=None, deleted_at=bindparam("b_at"), changed_at=written_at),
+            deletes
+        )
+        counts["deleted"] = result.rowcount
+
+    db.session.commit()
+    return counts
+
+class MessageIngester:
+    """
+    Consome os tópicos de chat e grava em lotes.
+
+    A thread de rede do paho só decodifica e enfileira; uma thread de escrita
+    junta até INGEST_BATCH_SIZE eventos (ou espera INGEST_FLUSH_INTERVAL) e
+    grava com store_events. Reentregas recentes são descartadas em memória.
+    """
+
+    def __init__(self, app, host=None, port=None, username=None, password=None,
+                 share_group=INGEST_SHARE_GROUP, batch_size=INGEST_BATCH_SIZE,
+                 flush_interval=INGEST_FLUSH_INTERVAL, queue_size=INGEST_QUEUE_SIZE, client_id=None):
+        from src.app.emqx.mqtt_publisher import MQTT_BROKER, MQTT_PORT, MQTT_USER, MQTT_PASSWORD
+
+        self.app = app
+        self.host = host or MQTT_BROKER
+        self.port = port or MQTT_PORT
+        self.share_group = share_group
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._seen = OrderedDict()
+        self._stopping = threading.Event()
+        self._writer = threading.Thread(target=self._write_loop, name="ingest-writer", daemon=True)
+
+        self.counters = {
+            "received": 0, "ignored": 0, "invalid": 0, "rejected": 0, "duplicates": 0,
+            "inserted": 0, "edited": 0, "deleted": 0, "batches": 0, "write_errors": 0, "dropped": 0,
+        }
+        self.started_at = time.monotonic()
+        self._write_seconds = 0.0
+        self._lag_total = 0.0
+        self._lag_count = 0
+        self._recent = []
+
+        self._client = new_mqtt_client(client_id or f"ingester-{socket.gethostname()}-{os.getpid()}")
+        self._client.username_pw_set(username or MQTT_USER, password or MQTT_PASSWORD)
+        self._client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self._client.on_connect = self._on_connect
+        self._client.on_message = self._on_message
+
+    def start(self):
+        self._writer.start()
+        connect_async(self._client, self.host, self.port)
+        self._client.loop_start()
+        return self
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc != 0:
+            logger.error(f"Ingester connection refused: {reason_string(rc)}")
+            return
+        # Reassina a cada reconexão (sessão limpa)
+        client.subscribe([(shared_topic(t, self.share_group), 1) for t in INGEST_TOPICS])
+        logger.info(f"Ingester connected to {self.host}:{self.port}, subscribed as share group '{self.share_group}'")
+
+    def _on_message(self, client, userdata, msg):
+        self.counters["received"] += 1
+        try:
+            event = decode_event(msg.topic, msg.payload, datetime.now(timezone.utc), *message_encoding(msg))
+        except (ValueError, TypeError) as e:
+            self.counters["invalid"] += 1
+            logger.debug(f"Ingester dropped invalid event on {msg.topic}: {e}")
+            return
+
+        if event is None:
+            self.counters["ignored"] += 1
+            return
+
+        if event["type"] == "MESSAGE_NEW" and self._recently_seen(event["message_id"]):
+            self.counters["duplicates"] += 1
+            return
+
+        self._queue.put((event, time.monotonic()))
+
+    def _recently_seen(self, message_id):
+        if message_id in self._seen:
+            self._seen.move_to_end(message_id)
+            return True
+        self._seen[message_id] = None
+        if len(self._seen) > INGEST_DEDUPE_SIZE:
+            self._seen.popitem(last=False)
+        return False
+
+    def _write_loop(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._write(batch)
+
+    def _write(self, batch):
+        events = [event for event, _ in batch]
+        start = time.monotonic()
+
+        counts = self._store(events)
+        if counts is None:
+            return
+
+        now = time.monotonic()
+        self._write_seconds += now - start
+        for key, value in counts.items():
+            self.counters[key] += value
+        self.counters["batches"] += 1
+        self._lag_total += sum(now - queued_at for _, queued_at in batch)
+        self._lag_count += len(batch)
+        self._recent.append((now, len(batch)))
+
+    def _store(self, events):
+        """
+        Grava os eventos com store_events. Erros de conexão repetem o mesmo lote;
+        nos outros (ex.: NUL no conteúdo, FK, tamanho) o lote é dividido ao meio
+        até isolar os eventos com problema, que são descartados e contados em
+        "dropped". O resto do lote é gravado.
+
+        Returns:
+            Counter | None: contagens somadas, ou None se o ingester parou no meio
+        """
+        while True:
+            try:
+                with self.app.app_context():
+                    return Counter(store_events(events))
+            except Exception as e:
+                self.counters["write_errors"] += 1
+                with self.app.app_context():
+                    db.session.rollback()
+                if not is_transient(e):
+                    return self._store_split(events, e)
+                logger.error(f"Ingester failed to write {len(events)} events, retrying: {e}")
+                if self._stopping.is_set():
+                    return None
+                time.sleep(1)
+
+    def _store_split(self, events, error):
+        if len(events) == 1:
+            event = events[0]
+            self.counters["dropped"] += 1
+            logger.error(
+                f"Ingester dropped {event['type']} {event['message_id']} from {event['sender_id']} "
+                f"in {event['chat_type']} {event['chat_id']}: {error}"
+            )
+            return Counter()
+
+        middle = len(events) // 2
+        counts = Counter()
+        for half in (events[:middle], events[middle:]):
+            half_counts = self._store(half)
+            if half_counts is None:
+                return None
+            counts.update(half_counts)
+        return counts
+
+    def stop(self, timeout=10):
+        self._client.disconnect()
+        self._client.loop_stop()
+        self._stopping.set()
+        self._writer.join(timeout)
+
+    def stats(self):
+        now = time.monotonic()
+        self._recent = [(t, n) for t, n in self._recent if now - t <= 60]
+        window = min(60, max(now - self.started_at, 1e-9))
+        batches = self.counters["batches"]
+
+        return dict(
+            self.counters,
+            queued=self._queue.qsize(),
+            events_per_second=sum(n for _, n in self._recent) / window,
+            avg_batch_size=self._lag_count / batches if batches else None,
+            avg_write_ms=self._write_seconds / batches * 1000 if batches else None,
+            avg_lag_ms=self._lag_total / self._lag_count * 1000 if self._lag_count else None,
+        )
+
+def serve_stats(ingester, port):
+    """GET em qualquer caminho devolve ingester.stats() em JSON."""
+    class StatsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(ingester.stats()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), StatsHandler)
+    threading.Thread(target=server.serve_forever, name="ingest-stats", daemon=True).start()
+    return server
+
+def main():
+    from src.app import init_app
+
+    app = init_app()
+    ingester = MessageIngester(app).start()
+    if INGEST_STATS_PORT:
+        serve_stats(ingester, INGEST_STATS_PORT)
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+
+    while not stopped.wait(INGEST_STATS_INTERVAL):
+        stats = ingester.stats()
+        logger.info(
+            f"Ingester: {stats['events_per_second']:.1f} events/s, {stats['inserted']} inserted, "
+            f"{stats['duplicates']} duplicates, {stats['rejected']} rejected, {stats['dropped']} dropped, {stats['queued']} queued"
+        )
+
+    logger.info("Ingester stopping...")
+    ingester.stop()
+
+if __name__ == "__main__":
+    main()
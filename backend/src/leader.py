@@ -0,0 +1,103 @@
+"""
+Trabalhos de fundo que só um processo pode rodar por vez: o relay do outbox,
+a limpeza de refresh tokens e a varredura de ACLs do EMQX.
+
+No Postgres a exclusão é um advisory lock numa conexão dedicada, liberado
+pelo próprio banco se o worker morrer. Nos outros bancos (SQLite, em
+desenvolvimento) todos os workers estão na mesma máquina, então o lock é um
+flock num arquivo por chave e por banco, liberado pelo sistema do mesmo jeito.
+"""
+import fcntl
+import hashlib
+import os
+import tempfile
+import time
+from src.schema import db
+from src.logger import logger
+
+LEADER_LOCK_DIR = os.getenv("LEADER_LOCK_DIR", tempfile.gettempdir())
+# De quanto em quanto tempo still_leader() confere a conexão que segura o lock
+LOCK_CHECK_INTERVAL = 5
+
+def _lock_checker(cursor):
+    """Confere de tempos em tempos se a conexão que segura o lock continua viva."""
+    last_check = time.monotonic()
+
+    def still_leader():
+        nonlocal last_check
+        if time.monotonic() - last_check < LOCK_CHECK_INTERVAL:
+            return True
+        last_check = time.monotonic()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            return True
+        except Exception as e:
+            logger.error(f"Lost the connection holding a leader lock: {e}")
+            return False
+
+    return still_leader
+
+def _run_with_pg_lock(app, key, fn):
+    conn = None
+    try:
+        with app.app_context():
+            conn = db.engine.raw_connection()
+
+        # Conexão dedicada: não volta para o pool segurando o lock
+        conn.detach()
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (key,))
+        if not cursor.fetchone()[0]:
+            return False, None
+
+        try:
+            return True, fn(_lock_checker(cursor))
+        finally:
+            try:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (key,))
+            except Exception:
+                # Conexão perdida: o lock já foi liberado pelo banco
+                pass
+    finally:
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+def _run_with_file_lock(url, key, fn):
+    digest = hashlib.sha256(url.encode()).hexdigest()[:12]
+    path = os.path.join(LEADER_LOCK_DIR, f"conchat-{key:x}-{digest}.lock")
+
+    with open(path, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False, None
+
+        try:
+            return True, fn(lambda: True)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def run_with_advisory_lock(app, key, fn):
+    """
+    Roda fn(still_leader) só se este processo conseguir o lock key, sem esperar por ele.
+
+    Args:
+        app: o Flask app (para chegar ao banco)
+        key: inteiro que identifica o trabalho
+        fn: recebe still_leader(), que fica False se o lock for perdido
+            (ex.: queda da conexão que o segura), e pode rodar por tempo indeterminado
+
+    Returns:
+        tuple: (True, retorno de fn) ou (False, None) se outro processo tem o lock
+    """
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        url = db.engine.url.render_as_string(hide_password=True)
+
+    if dialect == "postgresql":
+        return _run_with_pg_lock(app, key, fn)
+    return _run_with_file_lock(url, key, fn)
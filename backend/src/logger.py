@@ -1,26 +1,10 @@
-import logging
-from logging.handlers import RotatingFileHandler
-import os
+from src.logpipeline import LogPipeline
 
-def setup_logger():
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
+# Mesma implementação do servidor de webhooks (webhooks/src/logger.py); só muda o nome e o arquivo
+log_pipeline = LogPipeline('ConchatApp', 'logs/app.log')
 
-    logger = logging.getLogger('ConchatApp')
-    logger.setLevel(logging.INFO)
+logger = log_pipeline.logger
+setup_logger = log_pipeline.setup
 
-    formatter = logging.Formatter('[{asctime}] [{levelname}]: {message}', style='{')
-
-    # Maximo de 5 MB, 5 backups
-    file_handler = RotatingFileHandler('logs/app.log', maxBytes=5*1024*1024, backupCount=5, encoding='utf-8')
-    file_handler.setFormatter(formatter)
-
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-
-    return logger
-
-logger = setup_logger()
\ No newline at end of file
+# Ex.: cada arquivo servido
+log_decision = log_pipeline.log_decision
@@ -0,0 +1,126 @@
+import atexit
+import logging
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+import os
+import queue
+import random
+
+# Sem imports de src: este módulo também é carregado pelo servidor de webhooks (webhooks/src/logger.py)
+
+# LOG_QUEUE=true: as threads das requisições só enfileiram os registros; uma thread
+# de fundo formata e escreve no arquivo e no console
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE = os.getenv("LOG_QUEUE", "true").lower() in ("1", "true", "yes")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Logs por decisão (caminho quente): nível e fração amostrada configuráveis
+LOG_DECISION_LEVEL = os.getenv("LOG_DECISION_LEVEL", "INFO").upper()
+LOG_DECISION_SAMPLE_RATE = float(os.getenv("LOG_DECISION_SAMPLE_RATE", "1.0"))
+
+def parse_level(name, default=logging.DEBUG):
+    """Nível numérico de um nome ("INFO") ou número ("20"); default se não for nenhum dos dois."""
+    if str(name).isdigit():
+        return int(name)
+    level = logging.getLevelName(str(name).upper())
+    # Para nomes desconhecidos getLevelName devolve a string "Level X"
+    return level if isinstance(level, int) else default
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler com fila limitada: se a fila encher, descarta o registro em vez de bloquear."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class LogPipeline:
+    """Logger de um serviço (arquivo + console, em fila ou não) e o log amostrado das decisões."""
+
+    def __init__(self, name, filename, decision_level=LOG_DECISION_LEVEL, sample_rate=LOG_DECISION_SAMPLE_RATE):
+        self.logger = logging.getLogger(name)
+        self.filename = filename
+        self.decision_level = parse_level(decision_level)
+        self.sample_rate = sample_rate
+        self.dropped = 0
+
+        self._handler = None
+        self._listener = None
+        atexit.register(self.stop)
+
+        self.setup()
+        if parse_level(decision_level, None) is None:
+            self.logger.warning(f"Unknown LOG_DECISION_LEVEL '{decision_level}', using DEBUG")
+
+    def stop(self):
+        """Esvazia a fila e para a thread de escrita."""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def setup(self, queued=LOG_QUEUE, level=LOG_LEVEL):
+        """(Re)configura os handlers; permite reconfigurar (ex.: benchmarks) sem duplicar handlers."""
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.logger.setLevel(parse_level(level, logging.INFO))
+
+        self.stop()
+        if isinstance(self._handler, DroppingQueueHandler):
+            self.dropped += self._handler.dropped
+        self._handler = None
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+            handler.close()
+
+        formatter = logging.Formatter('[{asctime}] [{levelname}]: {message}', style='{')
+
+        # Máximo de 5 MB, 5 backups
+        file_handler = RotatingFileHandler(self.filename, maxBytes=5*1024*1024, backupCount=5, encoding='utf-8')
+        file_handler.setFormatter(formatter)
+
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+
+        if queued:
+            log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+            self._handler = DroppingQueueHandler(log_queue)
+            self.logger.addHandler(self._handler)
+            self._listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+            self._listener.start()
+        else:
+            self.logger.addHandler(file_handler)
+            self.logger.addHandler(console_handler)
+
+        return self.logger
+
+    def log_decision(self, msg, *args, level=None):
+        """
+        Log de uma decisão do caminho quente.
+
+        Usa LOG_DECISION_LEVEL como nível padrão e só registra uma fração
+        LOG_DECISION_SAMPLE_RATE das chamadas. A mensagem é formatada apenas
+        se o registro for de fato emitido.
+        """
+        level = self.decision_level if level is None else level
+        if not self.logger.isEnabledFor(level):
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        self.logger.log(level, msg, *args)
+
+    def stats(self):
+        queued = isinstance(self._handler, DroppingQueueHandler)
+        return {
+            "queued": queued,
+            "queue_size": self._handler.queue.qsize() if queued else 0,
+            "queue_max": LOG_QUEUE_SIZE,
+            "dropped": self.dropped + (self._handler.dropped if queued else 0),
+            "decision_level": logging.getLevelName(self.decision_level),
+            "decision_sample_rate": self.sample_rate,
+        }
@@ -0,0 +1,34 @@
+import json, os
+from sqlalchemy import text
+from src.schema import db
+
+# Canal escutado pelo servidor de webhooks para invalidar o cache de ACL
+ACL_NOTIFY_CHANNEL = os.getenv("ACL_NOTIFY_CHANNEL", "acl_invalidation")
+
+def _notify_acl(user_id=None, topic=None):
+    """
+    Enfileira uma invalidação de ACL na transação atual.
+    O Postgres só entrega o NOTIFY no commit, então mudanças desfeitas nunca chegam aos webhooks.
+    """
+    if db.engine.dialect.name != "postgresql":
+        return
+
+    payload = json.dumps({
+        "user": str(user_id) if user_id is not None else None,
+        "topic": topic
+    })
+    db.session.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": ACL_NOTIFY_CHANNEL, "payload": payload})
+
+def notify_membership_change(user_id, group_id):
+    _notify_acl(user_id, f"/groups/{group_id}")
+
+def notify_group_deleted(group_id):
+    _notify_acl(topic=f"/groups/{group_id}")
+
+def notify_friendship_change(user1_id, user2_id):
+    _notify_acl(user1_id, f"/dms/{user2_id}")
+    _notify_acl(user2_id, f"/dms/{user1_id}")
+
+def notify_user_deleted(user_id):
+    _notify_acl(user_id)
+    _notify_acl(topic=f"/dms/{user_id}")
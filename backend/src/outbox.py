@@ -0,0 +1,307 @@
+import json, os, threading, time
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+from sqlalchemy import select, delete, update
+from src.schema import db, OutboxEvent, SyncChange
+from src.logger import logger
+from src.leader import run_with_advisory_lock
+
+OUTBOX_RELAY_ENABLED = os.getenv("OUTBOX_RELAY_ENABLED", "true").lower() in ("1", "true", "yes")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "0.5"))
+OUTBOX_ACK_TIMEOUT = float(os.getenv("OUTBOX_ACK_TIMEOUT", "30"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "30"))
+
+# Só um worker publica por vez; os outros ficam de reserva esperando este lock
+OUTBOX_LOCK_KEY = 0x0C0C4A7
+LEADER_RETRY_INTERVAL = 5
+
+# Eventos copiados para sync_changes (lidos pelo /sync) e por quanto tempo ficam lá
+SYNC_EVENT_TYPES = {
+    "GROUPMEMBER_ADD", "GROUPMEMBER_REMOVE", "GROUPMEMBER_ROLEEDIT",
+    "FRIENDREQUEST_RECEIVED", "FRIENDSTATUS_UPDATE",
+}
+SYNC_RETENTION_DAYS = float(os.getenv("SYNC_RETENTION_DAYS", "30"))
+SYNC_PRUNE_INTERVAL = float(os.getenv("SYNC_PRUNE_INTERVAL", "3600"))
+SYNC_PRUNE_BATCH_SIZE = int(os.getenv("SYNC_PRUNE_BATCH_SIZE", "5000"))
+
+def emit_event(topic, event_type, from_user_id, payload):
+    """
+    Adiciona um evento MQTT ao outbox na transação atual.
+    O evento só é publicado se a transação for confirmada.
+    """
+    from src.app.emqx.mqtt_publisher import MQTTPublisher
+
+    event = MQTTPublisher.build_event(event_type, from_user_id, payload)
+    db.session.add(OutboxEvent(topic=topic, message=json.dumps(event)))
+
+    if event_type in SYNC_EVENT_TYPES:
+        # /groups/{id} vale para os membros do grupo e para o usuário do payload; /users/{id} só para ele
+        kind, _, target = topic.strip("/").partition("/")
+        if kind == "groups":
+            record_change(event, chat_id=target, user_id=payload.get("user_id"))
+        else:
+            record_change(event, user_id=target)
+
+def record_change(event, chat_id=None, user_id=None):
+    """
+    Guarda na transação atual uma cópia do evento para o /sync, visível aos
+    membros de chat_id e a user_id. Usado direto nas mudanças que não são
+    publicadas (ex.: um grupo apagado não tem mais tópico onde publicar).
+    """
+    db.session.add(SyncChange(
+        chat_id=UUID(str(chat_id)) if chat_id else None,
+        user_id=UUID(str(user_id)) if user_id else None,
+        type=event["type"],
+        message=json.dumps(event),
+    ))
+
+def prune_sync_changes(retention_days=SYNC_RETENTION_DAYS, batch_size=SYNC_PRUNE_BATCH_SIZE):
+    """Apaga, em lotes pequenos, as mudanças mais velhas que a retenção. Retorna quantas saíram."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    total = 0
+    while True:
+        ids = select(SyncChange.id).where(SyncChange.created_at < cutoff).order_by(SyncChange.id).limit(batch_size)
+        deleted = db.session.execute(delete(SyncChange).where(SyncChange.id.in_(ids))).rowcount
+        db.session.commit()
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+def _as_utc(value):
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def _all_acked(count, callback):
+    """Junta as respostas das cópias de um evento: callback(True) quando todas tiverem PUBACK, callback(False) na primeira falha."""
+    state = {"waiting": count, "done": False}
+    lock = threading.Lock()
+
+    def on_ack(success):
+        with lock:
+            if state["done"]:
+                return
+            state["waiting"] -= 1
+            state["done"] = not success or state["waiting"] == 0
+            if not state["done"]:
+                return
+        callback(success)
+    return on_ack
+
+class OutboxRelay:
+    """
+    Publica os eventos da tabela outbox em ordem de id, em lotes, pela conexão
+    MQTT persistente do processo. Uma linha só é apagada depois do PUBACK
+    (entrega at-least-once).
+
+    A ordem vale entre lotes: na primeira falha o resto do lote é cancelado e
+    volta no próximo, e nenhum lote novo sai enquanto houver evento de um lote
+    anterior sem resposta. Um evento sem PUBACK dentro de ack_timeout continua
+    com o paho (que o reenvia após reconectar) e não é publicado de novo.
+    """
+
+    def __init__(self, app, batch_size=OUTBOX_BATCH_SIZE, poll_interval=OUTBOX_POLL_INTERVAL, ack_timeout=OUTBOX_ACK_TIMEOUT):
+        self.app = app
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.ack_timeout = ack_timeout
+
+        self.leader = False
+        self.published = 0
+        self.retried = 0
+        self.batches = 0
+        self.lag_seconds = 0.0
+        self.started_at = time.monotonic()
+        self._delivery_total = 0.0
+        self._delivery_max = 0.0
+        self._recent = []
+
+        # Eventos entregues ao publisher e ainda sem resposta (id -> created_at) e as respostas a gravar
+        self._unresolved = {}
+        self._resolved = []
+        self._done = threading.Condition()
+
+    def _on_ack(self, row_id, cancel):
+        def callback(success):
+            with self._done:
+                created_at = self._unresolved.pop(row_id, None)
+                self._resolved.append((row_id, success, created_at))
+                if not success:
+                    # Os eventos seguintes do lote não saem antes deste
+                    cancel.set()
+                self._done.notify_all()
+        return callback
+
+    def _wait_unresolved(self):
+        with self._done:
+            return self._done.wait_for(lambda: not self._unresolved, timeout=self.ack_timeout)
+
+    def _record_resolved(self):
+        """Apaga os eventos confirmados e conta uma tentativa nos que falharam."""
+        with self._done:
+            resolved, self._resolved = self._resolved, []
+
+        acked = [(row_id, created_at) for row_id, success, created_at in resolved if success]
+        failed_ids = [row_id for row_id, success, _ in resolved if not success]
+        if not resolved:
+            return 0, 0
+
+        with self.app.app_context():
+            if acked:
+                db.session.execute(delete(OutboxEvent).where(OutboxEvent.id.in_([row_id for row_id, _ in acked])))
+            if failed_ids:
+                db.session.execute(
+                    update(OutboxEvent).where(OutboxEvent.id.in_(failed_ids))
+                    .values(attempts=OutboxEvent.attempts + 1, last_error="not published, retried in order")
+                )
+            db.session.commit()
+
+        now = datetime.now(timezone.utc)
+        for _, created_at in acked:
+            delivery = (now - _as_utc(created_at)).total_seconds()
+            self._delivery_total += delivery
+            self._delivery_max = max(self._delivery_max, delivery)
+
+        self.published += len(acked)
+        self.retried += len(failed_ids)
+        self._recent.append((time.monotonic(), len(acked)))
+        return len(acked), len(failed_ids)
+
+    def run_once(self, publisher):
+        """Publica um lote. Retorna quantos eventos foram confirmados pelo broker."""
+        from src.app.emqx.event_codec import stored_event_publications, publish_properties
+
+        # Um lote anterior ainda esperando PUBACK: nada novo sai na frente dele
+        if not self._wait_unresolved():
+            self._record_resolved()
+            raise RuntimeError(f"{len(self._unresolved)} outbox events still waiting for PUBACK")
+        self._record_resolved()
+
+        with self.app.app_context():
+            rows = db.session.execute(
+                select(OutboxEvent.id, OutboxEvent.topic, OutboxEvent.message, OutboxEvent.created_at)
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+            ).all()
+            db.session.rollback()
+
+        if not rows:
+            self.lag_seconds = 0.0
+            return 0
+
+        self.lag_seconds = (datetime.now(timezone.utc) - _as_utc(rows[0].created_at)).total_seconds()
+
+        cancel = threading.Event()
+        for row in rows:
+            # Guardado em JSON; sai em JSON no tópico e numa cópia por formato compacto configurado
+            publications = stored_event_publications(row.topic, row.message)
+            on_ack = _all_acked(len(publications), self._on_ack(row.id, cancel))
+
+            with self._done:
+                self._unresolved[row.id] = row.created_at
+            queued = all(
+                publisher.enqueue(topic, message, on_ack=on_ack, properties=publish_properties(content_type, content_encoding), cancel=cancel)
+                for topic, message, content_type, content_encoding in publications
+            )
+            if not queued:
+                # Fila cheia: este e os seguintes ficam para o próximo lote
+                on_ack(False)
+                break
+
+        answered = self._wait_unresolved()
+        if not answered:
+            # O que ainda não saiu da fila do publisher é descartado; o que já foi ao broker segue com o paho
+            cancel.set()
+
+        acked, failed = self._record_resolved()
+        self.batches += 1
+
+        if failed or not answered:
+            raise RuntimeError(f"{failed} outbox events were not published and {len(self._unresolved)} are waiting for PUBACK")
+
+        return acked
+
+    def lead(self, still_leader):
+        """Roda enquanto este processo segurar o lock do relay."""
+        self.leader = True
+        logger.info("Outbox relay acquired leadership")
+        try:
+            self.run(still_leader)
+        finally:
+            self.leader = False
+
+    def run(self, still_leader=lambda: True):
+        from src.app.emqx.mqtt_publisher import get_publisher
+
+        backoff = self.poll_interval
+        last_prune = time.monotonic()
+        while still_leader():
+            try:
+                # Manutenção do sync_changes fica com o líder, para não rodar em todos os workers
+                if SYNC_PRUNE_INTERVAL > 0 and time.monotonic() - last_prune >= SYNC_PRUNE_INTERVAL:
+                    last_prune = time.monotonic()
+                    with self.app.app_context():
+                        pruned = prune_sync_changes()
+                    if pruned:
+                        logger.info(f"Pruned {pruned} sync changes older than {SYNC_RETENTION_DAYS:g} days")
+
+                publisher = get_publisher()
+                if not publisher.connected:
+                    time.sleep(self.poll_interval)
+                    continue
+
+                published = self.run_once(publisher)
+                backoff = self.poll_interval
+
+                # Lote cheio: provavelmente há mais eventos esperando
+                if published < self.batch_size:
+                    time.sleep(self.poll_interval)
+
+            except Exception as e:
+                logger.error(f"Outbox relay error: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, OUTBOX_MAX_BACKOFF)
+
+    def stats(self):
+        now = time.monotonic()
+        self._recent = [(t, n) for t, n in self._recent if now - t <= 60]
+
+        return {
+            "leader": self.leader,
+            "waiting_ack": len(self._unresolved),
+            "published": self.published,
+            "retried": self.retried,
+            "batches": self.batches,
+            "lag_seconds": self.lag_seconds,
+            "throughput_per_second": sum(n for _, n in self._recent) / min(60, max(now - self.started_at, 1e-9)),
+            "avg_delivery_seconds": self._delivery_total / self.published if self.published else None,
+            "max_delivery_seconds": self._delivery_max if self.published else None,
+        }
+
+def outbox_backlog():
+    """Número de eventos esperando publicação e idade do mais antigo, em segundos."""
+    count, oldest = db.session.execute(select(db.func.count(OutboxEvent.id), db.func.min(OutboxEvent.created_at))).one()
+    age = (datetime.now(timezone.utc) - _as_utc(oldest)).total_seconds() if oldest else 0.0
+    return {"pending": count, "oldest_age_seconds": age}
+
+def _leader_loop(relay):
+    """Só publica o processo que segurar o lock (advisory lock no Postgres, flock nos outros bancos)."""
+    while True:
+        try:
+            run_with_advisory_lock(relay.app, OUTBOX_LOCK_KEY, relay.lead)
+        except Exception as e:
+            logger.error(f"Outbox relay leader election error: {e}")
+
+        time.sleep(LEADER_RETRY_INTERVAL)
+
+outbox_relay = None
+
+def start_outbox_relay(app):
+    global outbox_relay
+
+    if not OUTBOX_RELAY_ENABLED:
+        return None
+
+    outbox_relay = OutboxRelay(app)
+    thread = threading.Thread(target=_leader_loop, args=(outbox_relay,), name="outbox-relay", daemon=True)
+    thread.start()
+    return thread
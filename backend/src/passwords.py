@@ -0,0 +1,156 @@
+"""
+Hash e verificação de senhas (Argon2) num pool limitado por worker.
+
+Cada hash custa centenas de milissegundos de CPU e dezenas de MB de memória.
+Feito direto na thread da requisição, uma rajada de logins ocupa o worker
+inteiro e trava até o /auth/me. Aqui no máximo PASSWORD_POOL_SIZE hashes
+rodam ao mesmo tempo por worker (o argon2-cffi solta o GIL, então threads
+bastam) e até PASSWORD_QUEUE_LIMIT esperam na fila; além disso a chamada
+falha na hora com PasswordPoolBusy, que as rotas devolvem como 503 com
+Retry-After. Com PASSWORD_POOL_SIZE=0 o hash roda na própria thread, sem
+limite, como antes.
+
+Os parâmetros do Argon2 vêm de ARGON2_TIME_COST, ARGON2_MEMORY_COST (KiB) e
+ARGON2_PARALLELISM, gravados no .env por calibrate_argon2.py; sem eles valem
+os padrões do argon2-cffi. Hashes com parâmetros antigos continuam válidos e
+são refeitos no próximo login (needs_rehash + run_in_background).
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from src.logger import logger
+
+# Hashes simultâneos por worker do gunicorn (0 desliga o pool)
+PASSWORD_POOL_SIZE = int(os.getenv("PASSWORD_POOL_SIZE", "1"))
+# Quantos pedidos podem esperar na fila além dos que estão rodando
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", "4"))
+# Valor do Retry-After (segundos) quando o pool recusa
+PASSWORD_RETRY_AFTER = int(os.getenv("PASSWORD_RETRY_AFTER", "2"))
+
+_defaults = PasswordHasher()
+
+# Custo do Argon2 (calibrate_argon2.py mede e grava valores para o hardware do deploy)
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", str(_defaults.time_cost)))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", str(_defaults.memory_cost)))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", str(_defaults.parallelism)))
+
+hasher = PasswordHasher(time_cost=ARGON2_TIME_COST, memory_cost=ARGON2_MEMORY_COST, parallelism=ARGON2_PARALLELISM)
+
+class PasswordPoolBusy(Exception):
+    """O pool está cheio (rodando + fila); o cliente deve tentar de novo depois."""
+
+class PasswordPool:
+    def __init__(self, size=PASSWORD_POOL_SIZE, queue_limit=PASSWORD_QUEUE_LIMIT):
+        self.size = size
+        self.queue_limit = queue_limit
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        self.completed = 0
+        self.rejected = 0
+        self.background = 0
+        self.max_pending = 0
+        self.wait_time = 0.0
+        self.work_time = 0.0
+
+    def _submit(self, function, *args):
+        if self.size <= 0:
+            return function(*args)
+
+        with self._lock:
+            if self._pending >= self.size + self.queue_limit:
+                self.rejected += 1
+                raise PasswordPoolBusy()
+            self._reserve()
+
+        return self._executor.submit(self._timed(function, *args)).result()
+
+    def run_in_background(self, function, *args):
+        """
+        Agenda function(*args) no pool sem esperar o resultado. Não compete com
+        as requisições: só entra se sobrar ao menos metade da fila. Retorna
+        False se não entrou (a tarefa pode ser tentada de novo depois).
+        """
+        with self._lock:
+            if self.size <= 0 or self._pending >= self.size + self.queue_limit // 2:
+                return False
+            self._reserve()
+            self.background += 1
+
+        future = self._executor.submit(self._timed(function, *args))
+        # Ninguém espera o resultado: sem isso uma exceção da tarefa sumiria em silêncio
+        future.add_done_callback(_log_background_error)
+        return True
+
+    def _reserve(self):
+        """Chamado com o lock: conta mais uma tarefa pendente"""
+        # Criado no primeiro uso: já dentro do worker, depois do fork do gunicorn
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="argon2")
+
+        self._pending += 1
+        self.max_pending = max(self.max_pending, self._pending)
+
+    def _timed(self, function, *args):
+        submitted = time.perf_counter()
+
+        def run():
+            started = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self._pending -= 1
+                    self.completed += 1
+                    self.wait_time += started - submitted
+                    self.work_time += finished - started
+
+        return run
+
+    def hash(self, password):
+        return self._submit(hasher.hash, password)
+
+    def verify(self, password_hash, password):
+        """True se a senha confere; hashes malformados contam como senha errada."""
+        return self._submit(_verify, password_hash, password)
+
+    def stats(self):
+        with self._lock:
+            completed = self.completed
+            return {
+                "size": self.size,
+                "queue_limit": self.queue_limit,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "completed": completed,
+                "rejected": self.rejected,
+                "background": self.background,
+                "avg_wait_ms": round(self.wait_time / completed * 1000, 2) if completed else None,
+                "avg_work_ms": round(self.work_time / completed * 1000, 2) if completed else None,
+            }
+
+def _log_background_error(future):
+    error = future.exception()
+    if error is not None:
+        logger.error(f"Password background task failed: {error!r}")
+
+def needs_rehash(password_hash):
+    """True se o hash foi feito com parâmetros diferentes dos atuais (checagem barata, sem refazer o hash)"""
+    try:
+        return hasher.check_needs_rehash(password_hash)
+    except InvalidHashError:
+        return False
+
+def _verify(password_hash, password):
+    try:
+        return hasher.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+password_pool = PasswordPool()
@@ -0,0 +1,153 @@
+"""
+Limites de taxa (Flask-Limiter) e corte de carga por worker.
+
+Limites: cada blueprint pesado (auth_bp, users_bp, groups_bp) tem um limite
+geral por usuário do token (ou IP, sem token), e as rotas caras têm os seus:
+login por IP e por username, refresh por IP, busca de usuários por usuário.
+Os valores usam a sintaxe do Flask-Limiter ("10/minute;3/second") e vêm do
+ambiente; string vazia desliga o limite. Uma janela curta mais uma longa
+faz o papel de balde de fichas: permite rajadas pequenas e segura a taxa
+média. Estouro responde 429 com Retry-After.
+
+O estado fica em memória (por worker) ou num backend compartilhado via
+RATELIMIT_STORAGE_URI (ex.: redis://redis:6379/0, que exige o pacote redis).
+Se o backend compartilhado cair, os limites continuam em memória.
+
+Corte de carga: no máximo MAX_IN_FLIGHT requisições em andamento por worker;
+acima disso a resposta é 503 imediato, o que esvazia a fila do gunicorn em
+vez de deixá-la crescer atrás de requisições lentas.
+"""
+import os
+import threading
+from flask import jsonify, request
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from src.validate import decode_jwt
+
+RATELIMIT_STORAGE_URI = os.getenv("RATELIMIT_STORAGE_URI", "memory://")
+RATELIMIT_STRATEGY = os.getenv("RATELIMIT_STRATEGY", "moving-window")
+RATELIMIT_ENABLED = os.getenv("RATELIMIT_ENABLED", "true").lower() == "true"
+
+# Limites gerais por blueprint (por usuário ou IP)
+RATELIMIT_AUTH = os.getenv("RATELIMIT_AUTH", "120/minute")
+RATELIMIT_USERS = os.getenv("RATELIMIT_USERS", "300/minute;30/second")
+RATELIMIT_GROUPS = os.getenv("RATELIMIT_GROUPS", "300/minute;30/second")
+
+# Limites das rotas caras
+RATELIMIT_LOGIN = os.getenv("RATELIMIT_LOGIN", "20/minute;5/second")
+RATELIMIT_LOGIN_USERNAME = os.getenv("RATELIMIT_LOGIN_USERNAME", "10/minute")
+RATELIMIT_REFRESH = os.getenv("RATELIMIT_REFRESH", "30/minute;5/second")
+RATELIMIT_SIGNUP = os.getenv("RATELIMIT_SIGNUP", "10/hour")
+RATELIMIT_SEARCH = os.getenv("RATELIMIT_SEARCH", "60/minute;5/second")
+
+# Requisições simultâneas por worker antes de responder 503 (0 desliga); abaixo de GUNICORN_THREADS
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "6"))
+SHED_RETRY_AFTER = int(os.getenv("SHED_RETRY_AFTER", "1"))
+
+def client_ip():
+    return get_remote_address()
+
+def user_or_ip():
+    """Usuário do token (já verificado e em cache em decode_jwt) ou, sem token válido, o IP"""
+    parts = request.headers.get("Authorization", "").split()
+    if len(parts) == 2 and parts[0].lower() == "bearer":
+        payload = decode_jwt(parts[1])
+        if payload is not None:
+            return f"user:{payload.get('sub')}"
+    return f"ip:{client_ip()}"
+
+def login_username():
+    """Username do corpo do login: segura tentativas distribuídas contra uma conta só"""
+    username = (request.get_json(silent=True) or {}).get("username")
+    return f"login:{str(username).lower()}" if username else f"ip:{client_ip()}"
+
+def _is_preflight():
+    return request.method == "OPTIONS"
+
+limiter = Limiter(
+    key_func=user_or_ip,
+    storage_uri=RATELIMIT_STORAGE_URI,
+    strategy=RATELIMIT_STRATEGY,
+    headers_enabled=True,
+    swallow_errors=True,
+    in_memory_fallback_enabled=True,
+    enabled=RATELIMIT_ENABLED,
+)
+
+def route_limit(limit_value, key_func):
+    """limiter.limit que soma ao limite do blueprint; limit_value vazio não limita"""
+    if not limit_value:
+        return lambda function: function
+    return limiter.limit(limit_value, key_func=key_func, override_defaults=False, exempt_when=_is_preflight)
+
+class LoadShedder:
+    """Conta as requisições em andamento no worker e recusa as que passam de max_in_flight"""
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.shed = 0
+        self.rate_limited = 0
+
+    def enter(self):
+        with self._lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                self.shed += 1
+                return False
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            return True
+
+    def limited(self):
+        with self._lock:
+            self.rate_limited += 1
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "peak": self.peak,
+                "shed": self.shed,
+                "rate_limited": self.rate_limited,
+            }
+
+load_shedder = LoadShedder()
+
+def init_rate_limits(app, blueprint_limits):
+    """
+    Liga o corte de carga e os limites no app.
+
+    Args:
+        app: o Flask app
+        blueprint_limits: [(blueprint, limite)] com o limite geral de cada blueprint
+    """
+    # Registrado antes do Flask-Limiter: requisição cortada nem chega a consultar o backend dos limites
+    @app.before_request
+    def shed_load():
+        if request.path.endswith("/ping"):
+            return None
+        if not load_shedder.enter():
+            return jsonify({"message": "Server is busy, please try again later"}), 503, {"Retry-After": str(SHED_RETRY_AFTER)}
+        request.environ["conchat.in_flight"] = True
+
+    @app.teardown_request
+    def release_slot(exc):
+        if request.environ.pop("conchat.in_flight", False):
+            load_shedder.leave()
+
+    @app.errorhandler(429)
+    def rate_limited(e):
+        load_shedder.limited()
+        return jsonify({"message": f"Too many requests: {e.description}"}), 429
+
+    limiter.init_app(app)
+    for blueprint, limit_value in blueprint_limits:
+        if limit_value:
+            limiter.limit(limit_value, key_func=user_or_ip, exempt_when=_is_preflight)(blueprint)
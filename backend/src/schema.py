@@ -4,8 +4,9 @@ from sqlalchemy import CheckConstraint, BOOLEAN, DateTime, func, text, Index, se
 from sqlalchemy import Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
-from uuid import uuid4
+from uuid import uuid4, uuid5, UUID
 import enum
+import os
 
 db = SQLAlchemy()
 migrate = Migrate()
@@ -83,8 +84,13 @@ class UserGroup(db.Model):
 class Friendship(db.Model):
     __tablename__ = "friendships"
 
-    requester_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
-    addressee_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    # Chave canônica do par (menor id, maior id): "são amigos?" vira uma busca pela PK
+    user_low_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    user_high_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+
+    # Direção do pedido
+    requester_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    addressee_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
 
     created_at = db.Column(DateTime(timezone=True), nullable=False, default=utc_now)
     status = db.Column(
@@ -95,18 +101,28 @@ class Friendship(db.Model):
 
     __table_args__ = (
         CheckConstraint('requester_id != addressee_id', name='ck_not_self_friend'),
+        CheckConstraint('user_low_id < user_high_id', name='ck_friend_pair_order'),
         Index('ix_friend_addr', 'addressee_id'), 
+        Index('ix_friend_high', 'user_high_id'),
     )
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.requester_id is not None and self.addressee_id is not None:
+            self.user_low_id, self.user_high_id = Friendship.pair_key(self.requester_id, self.addressee_id)
+
+    @staticmethod
+    def pair_key(user1_id, user2_id):
+        user1_id, user2_id = UUID(str(user1_id)), UUID(str(user2_id))
+        return (user1_id, user2_id) if user1_id < user2_id else (user2_id, user1_id)
+
+    def other(self, user_id):
+        """Retorna o id do outro usuário do par"""
+        return self.user_high_id if self.user_low_id == UUID(str(user_id)) else self.user_low_id
+
     @classmethod
     def get_between(cls, user1_id, user2_id):
-        query = select(cls).where(
-            or_(
-                and_(cls.requester_id == user1_id, cls.addressee_id == user2_id),
-                and_(cls.requester_id == user2_id, cls.addressee_id == user1_id)
-            )
-        )
-        return db.session.execute(query).scalar_one_or_none()
+        return db.session.get(cls, cls.pair_key(user1_id, user2_id))
 
 class Block(db.Model):
     __tablename__ = "blocks"
@@ -128,4 +144,144 @@ class RefreshToken(db.Model):
 
     __table_args__ = (
         Index("ix_uid", 'user_id'),
-    )
\ No newline at end of file
+        # Limpeza em lotes (src/token_reaper.py): vencidos pela data, invalidados por um índice parcial pequeno
+        Index("ix_refresh_tokens_expires_at", "expires_at"),
+        Index("ix_refresh_tokens_invalid", "expires_at", postgresql_where=text("NOT is_valid"), sqlite_where=text("is_valid = 0")),
+    )
+
+class OutboxEvent(db.Model):
+    """Evento MQTT gravado na mesma transação da mudança; o relay (src/outbox.py) publica e apaga"""
+    __tablename__ = "outbox"
+
+    # Ordem de publicação
+    id = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True, autoincrement=True)
+
+    topic = db.Column(db.String(255), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    created_at = db.Column(DateTime(timezone=True), nullable=False, default=utc_now)
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+
+# Namespace fixo para derivar o id da conversa de DM a partir do par de usuários
+DM_CHAT_NAMESPACE = UUID("6f1c7d2e-3b8a-4c55-9e0d-2a7b1f4c9d63")
+
+# Tamanho máximo do texto (ou da legenda de um anexo) de uma mensagem
+MESSAGE_MAX_LENGTH = int(os.getenv("MESSAGE_MAX_LENGTH", "2000"))
+
+class Message(db.Model):
+    """Mensagem de grupo ou DM, gravada pelo ingester (src/ingester.py) a partir do broker"""
+    __tablename__ = "messages"
+
+    # Ordem de gravação no servidor
+    id = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True, autoincrement=True)
+    # Id gerado pelo cliente (payload.message_id): deduplica reentregas do QoS1
+    message_id = db.Column(db.UUID(as_uuid=True), nullable=False, unique=True)
+
+    chat_type = db.Column(db.String(8), nullable=False)
+    # Id do grupo, ou Message.dm_chat_id do par para DMs
+    chat_id = db.Column(db.UUID(as_uuid=True), nullable=False)
+    sender_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    recipient_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+
+    content = db.Column(db.Text, nullable=False)
+    sent_at = db.Column(DateTime(timezone=True), nullable=False, default=utc_now)
+    edited_at = db.Column(DateTime(timezone=True), nullable=True)
+    deleted_at = db.Column(DateTime(timezone=True), nullable=True)
+    # Última gravação da linha (envio, edição ou remoção): posição da mensagem no /sync
+    changed_at = db.Column(DateTime(timezone=True), nullable=False, default=utc_now)
+    # Referência (JSON) a um anexo guardado fora do broker; ver Attachment
+    attachment = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        CheckConstraint("chat_type IN ('group', 'dm')", name="ck_message_chat_type"),
+        # Histórico por keyset: a busca pelo cursor é só índice; o conteúdo fica fora
+        # do índice (um texto longo passaria do limite de tamanho da entrada do btree)
+        Index(
+            "ix_messages_chat_history", "chat_id", "sent_at", "id",
+            postgresql_include=["message_id", "sender_id", "edited_at", "deleted_at"],
+        ),
+        # Delta do /sync: o que mudou em cada chat depois de uma marca
+        Index("ix_messages_chat_changes", "chat_id", "changed_at", "id"),
+    )
+
+    @staticmethod
+    def dm_chat_id(user1_id, user2_id):
+        """Id da conversa entre dois usuários, o mesmo para os dois lados"""
+        low, high = Friendship.pair_key(user1_id, user2_id)
+        return uuid5(DM_CHAT_NAMESPACE, f"{low}:{high}")
+
+class Attachment(db.Model):
+    """
+    Anexo enviado a um chat. O arquivo fica uma vez só no disco, pelo sha256
+    do conteúdo (src/filehandling.py, BLOB_FOLDER); cada linha libera a
+    leitura dele para os participantes de um chat
+    """
+    __tablename__ = "attachments"
+
+    blob_hash = db.Column(db.String(64), primary_key=True)
+    chat_id = db.Column(db.UUID(as_uuid=True), primary_key=True)
+    chat_type = db.Column(db.String(8), nullable=False)
+
+    uploader_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    # Outro participante, em DMs
+    recipient_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+
+    name = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(127), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    created_at = db.Column(DateTime(timezone=True), nullable=False, default=utc_now)
+
+    __table_args__ = (
+        CheckConstraint("chat_type IN ('group', 'dm')", name="ck_attachment_chat_type"),
+    )
+
+    def reference(self):
+        """O que vai no evento e na mensagem no lugar do arquivo"""
+        return {"id": self.blob_hash, "name": self.name, "content_type": self.content_type, "size": self.size}
+
+    @staticmethod
+    def parse_reference(value):
+        """
+        Valida uma referência vinda de um evento (pode ter sido montada pelo
+        cliente). Só serve para exibição: o acesso ao arquivo é conferido nas
+        linhas desta tabela. Levanta ValueError se for inválida.
+        """
+        if not isinstance(value, dict):
+            raise ValueError("attachment must be an object")
+        blob_hash, name = value.get("id"), value.get("name")
+        content_type, size = value.get("content_type"), value.get("size")
+
+        if not isinstance(blob_hash, str) or len(blob_hash) != 64 or not all(c in "0123456789abcdef" for c in blob_hash):
+            raise ValueError("invalid attachment id")
+        if not isinstance(name, str) or not 0 < len(name) <= 255:
+            raise ValueError("invalid attachment name")
+        if not isinstance(content_type, str) or not 0 < len(content_type) <= 127:
+            raise ValueError("invalid attachment content type")
+        if not isinstance(size, int) or isinstance(size, bool) or size < 0:
+            raise ValueError("invalid attachment size")
+
+        return {"id": blob_hash, "name": name, "content_type": content_type, "size": size}
+
+class SyncChange(db.Model):
+    """
+    Cópia dos eventos de membros e de amizade emitidos pelo outbox, guardada
+    por SYNC_RETENTION_DAYS para o /sync (o outbox apaga depois de publicar)
+    """
+    __tablename__ = "sync_changes"
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True, autoincrement=True)
+
+    # Grupo do evento: todos os membros atuais veem
+    chat_id = db.Column(db.UUID(as_uuid=True), nullable=True)
+    # Usuário afetado: vê o evento mesmo sem ser (mais) membro do grupo
+    user_id = db.Column(db.UUID(as_uuid=True), nullable=True)
+
+    type = db.Column(db.String(32), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    created_at = db.Column(DateTime(timezone=True), nullable=False, default=utc_now)
+
+    __table_args__ = (
+        Index("ix_sync_changes_chat", "chat_id", "created_at", "id"),
+        Index("ix_sync_changes_user", "user_id", "created_at", "id"),
+    )
@@ -0,0 +1,118 @@
+"""
+Limpeza periódica de refresh_tokens vencidos ou invalidados.
+
+Um DELETE único de tudo que venceu trava a tabela (e o /auth/refresh) pelo
+tempo que levar. Aqui cada rodada apaga em lotes de TOKEN_REAPER_BATCH_SIZE
+linhas, cada lote na sua própria transação curta, com TOKEN_REAPER_PAUSE
+segundos de pausa entre eles. Os lotes são achados pelos índices de
+expires_at (vencidos) e dos invalidados, sem varrer a tabela. Só linhas
+mortas são apagadas, que o refresh já recusa de qualquer jeito.
+
+Só um worker roda a limpeza por vez (src/leader.py: advisory lock no Postgres,
+flock nos outros bancos).
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from sqlalchemy import select, delete
+from src.schema import db, RefreshToken
+from src.logger import logger
+from src.leader import run_with_advisory_lock
+
+# Intervalo entre rodadas, em segundos (0 desliga)
+TOKEN_REAPER_INTERVAL = float(os.getenv("TOKEN_REAPER_INTERVAL", "3600"))
+TOKEN_REAPER_BATCH_SIZE = int(os.getenv("TOKEN_REAPER_BATCH_SIZE", "1000"))
+# Pausa entre lotes, em segundos: dá espaço para as transações das requisições
+TOKEN_REAPER_PAUSE = float(os.getenv("TOKEN_REAPER_PAUSE", "0.1"))
+
+# Só um worker limpa por vez
+TOKEN_REAPER_LOCK_KEY = 0x0C0C4A9
+
+def _delete_chunk(condition, order_by, batch_size):
+    ids = select(RefreshToken.token_id).where(condition).order_by(order_by).limit(batch_size)
+    deleted = db.session.execute(delete(RefreshToken).where(RefreshToken.token_id.in_(ids))).rowcount
+    db.session.commit()
+    return deleted
+
+def reap_refresh_tokens(batch_size=TOKEN_REAPER_BATCH_SIZE, pause=TOKEN_REAPER_PAUSE):
+    """
+    Apaga os refresh tokens vencidos e os invalidados, em lotes.
+
+    Returns:
+        dict: {"expired", "invalidated", "batches", "seconds"}
+    """
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    result = {"expired": 0, "invalidated": 0, "batches": 0}
+
+    passes = (
+        ("expired", RefreshToken.expires_at < now, RefreshToken.expires_at),
+        # ~is_valid vira "NOT is_valid" no Postgres, o mesmo predicado do índice parcial
+        ("invalidated", ~RefreshToken.is_valid, RefreshToken.expires_at),
+    )
+    for key, condition, order_by in passes:
+        while True:
+            try:
+                deleted = _delete_chunk(condition, order_by, batch_size)
+            except Exception:
+                db.session.rollback()
+                raise
+
+            result[key] += deleted
+            result["batches"] += 1
+            if deleted < batch_size:
+                break
+            time.sleep(pause)
+
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+class TokenReaper:
+    def __init__(self, app):
+        self.app = app
+        self.runs = 0
+        self.purged = 0
+        self.last_run = None
+        self.last_result = None
+
+    def run_once(self):
+        with self.app.app_context():
+            result = reap_refresh_tokens()
+
+        self.runs += 1
+        self.purged += result["expired"] + result["invalidated"]
+        self.last_run = datetime.now(timezone.utc).isoformat()
+        self.last_result = result
+
+        if result["expired"] or result["invalidated"]:
+            logger.info(
+                f"Purged {result['expired']} expired and {result['invalidated']} invalidated refresh tokens "
+                f"in {result['batches']} batches, {result['seconds']:.2f}s"
+            )
+        return result
+
+    def stats(self):
+        return {"runs": self.runs, "purged": self.purged, "last_run": self.last_run, "last_result": self.last_result}
+
+def _reaper_loop(reaper, interval):
+    """Só limpa quem conseguir o lock; os outros workers pulam a rodada."""
+    while True:
+        time.sleep(interval)
+        try:
+            run_with_advisory_lock(reaper.app, TOKEN_REAPER_LOCK_KEY, lambda still_leader: reaper.run_once())
+        except Exception as e:
+            logger.error(f"Refresh token reaper failed: {e}")
+
+token_reaper = None
+
+def start_token_reaper(app):
+    global token_reaper
+
+    if TOKEN_REAPER_INTERVAL <= 0:
+        return None
+
+    token_reaper = TokenReaper(app)
+    thread = threading.Thread(target=_reaper_loop, args=(token_reaper, TOKEN_REAPER_INTERVAL), name="token-reaper", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,83 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Sem imports de src: este módulo também é carregado pelo servidor de webhooks (shared/validate.py)
+
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+
+class VerifiedTokenCache:
+    """
+    LRU limitado de payloads de JWT já verificados, indexado pelo SHA-256 do token.
+    Cada entrada vence exatamente no 'exp' do token: um token em cache nunca é aceito depois de expirar.
+    """
+
+    def __init__(self, max_size=JWT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict() # digest -> (exp, payload)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def decode(self, token, decoder):
+        """
+        Payload do token; decoder(token) (verificação completa da assinatura) só é chamado se não estiver em cache.
+        Tokens inválidos (decoder devolve None) e sem 'exp' nunca entram no cache.
+        """
+        if not token or self.max_size <= 0:
+            return decoder(token)
+
+        digest = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                exp, payload = entry
+                if now < exp:
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return dict(payload)
+
+                del self._entries[digest]
+                self.expired += 1
+
+            self.misses += 1
+
+        payload = decoder(token)
+        if payload is None or "exp" not in payload:
+            return payload
+
+        with self._lock:
+            self._entries[digest] = (float(payload["exp"]), dict(payload))
+            self._entries.move_to_end(digest)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        return payload
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
+
+token_cache = VerifiedTokenCache()
@@ -1,12 +1,13 @@
-import jwt, os, secrets, uuid
+import hashlib, hmac, jwt, os, secrets, uuid
 from dotenv import load_dotenv
 from datetime import datetime, timedelta, timezone
-from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
 from src.schema import *
 from flask import jsonify, request
 from functools import wraps
 from src.logger import logger
+from src.tokencache import token_cache
+from src.passwords import hasher, needs_rehash, password_pool, PasswordPoolBusy, PASSWORD_RETRY_AFTER
 
 load_dotenv()
 
@@ -14,7 +15,8 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ACCESS_EXP = timedelta(minutes=15)
 REFRESH_EXP = timedelta(days=20)
 
-hasher = PasswordHasher()
+# Chave do HMAC dos refresh tokens; sem ela, derivada da SECRET_KEY. Trocar a chave invalida as sessões abertas
+REFRESH_TOKEN_KEY = os.getenv("REFRESH_TOKEN_KEY")
 
 # Decorador
 def require_auth(role = None):
@@ -63,6 +65,10 @@ def fakeRequireAuth(role=None):
 
 
 
+def password_pool_busy():
+    """Resposta para quando o pool de Argon2 recusou o pedido (src/passwords.py)"""
+    return jsonify({"message": "Server is busy, please try again later"}), 503, {"Retry-After": str(PASSWORD_RETRY_AFTER)}
+
 # JWT ------------------------------------------------------------------------------------------------------------------
 def gen_jwt(user_id, role):
     payload = {
@@ -74,18 +80,42 @@ def gen_jwt(user_id, role):
     token = jwt.encode(payload, SECRET_KEY, algorithm="HS256")
     return token
 
-def decode_jwt(token):
+def _verify_jwt(token):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
         return payload
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         return None
+
+def decode_jwt(token):
+    # Tokens já verificados ficam em cache até o 'exp'
+    return token_cache.decode(token, _verify_jwt)
     
 # REFRESH -----------------------------------------------------------------------------------------------------------------
 
+# O segredo do refresh token já tem 512 bits aleatórios: não precisa de KDF lento, um HMAC basta.
+# Linhas antigas ainda guardam hash Argon2 ("$argon2id$...") e são trocadas pelo digest na próxima rotação.
+REFRESH_DIGEST_PREFIX = "hmac-sha256$"
+
+def _refresh_key():
+    if REFRESH_TOKEN_KEY:
+        return REFRESH_TOKEN_KEY.encode()
+    return hmac.new(SECRET_KEY.encode(), b"refresh-token-digest", hashlib.sha256).digest()
+
+def refresh_token_digest(token_secret):
+    digest = hmac.new(_refresh_key(), token_secret.encode(), hashlib.sha256).hexdigest()
+    return REFRESH_DIGEST_PREFIX + digest
+
+def verify_refresh_secret(token_hash, token_secret):
+    """Confere o segredo contra o digest guardado (tempo constante) ou, em linhas antigas, contra o hash Argon2"""
+    if token_hash.startswith(REFRESH_DIGEST_PREFIX):
+        return hmac.compare_digest(token_hash, refresh_token_digest(token_secret))
+
+    return password_pool.verify(token_hash, token_secret)
+
 def gen_refresh_token(user_id):
     token_secret = secrets.token_urlsafe(64)
-    token_hash = hasher.hash(token_secret)
+    token_hash = refresh_token_digest(token_secret)
     expires_at = datetime.now(timezone.utc) + REFRESH_EXP
 
     token = RefreshToken (
@@ -105,10 +135,11 @@ def gen_refresh_token(user_id):
 def validate_refresh_token(token):
     try:
         tok_id, tok_sec = token.split(".")
+        tok_uuid = uuid.UUID(tok_id)
     except ValueError:
         return jsonify({"message": "Malformed token"}), 400
 
-    db_token = db.session.get(RefreshToken, tok_id)
+    db_token = db.session.get(RefreshToken, tok_uuid)
     if not db_token:
         return jsonify({"message": "Token not found"}), 404
     
@@ -121,8 +152,11 @@ def validate_refresh_token(token):
     
     # Verifica Hash do token
     try:
-        hasher.verify(db_token.token_hash, tok_sec)
-    except VerifyMismatchError: 
+        secret_ok = verify_refresh_secret(db_token.token_hash, tok_sec)
+    except PasswordPoolBusy:
+        return password_pool_busy()
+
+    if not secret_ok:
         # Inválido (perigoso, tem alguém tentando utilizar um token de sessão não existente para a conta)
         # Invalidamos todos os tokens daquela conta, forçando a fazer login novamente
         db.session.query(RefreshToken).filter_by(user_id = db_token.user_id).update({"is_valid": False})
@@ -135,9 +169,9 @@ def validate_refresh_token(token):
             return jsonify({"message": "The specified token has an invalid hash"}), 500
         return jsonify({"message": "The specified token has an invalid hash"}), 401
     
-    # Válido
+    # Válido (o novo segredo sempre vai como digest HMAC, o que migra as linhas Argon2)
     new_token_sec = secrets.token_urlsafe(64)
-    new_hash = hasher.hash(new_token_sec)
+    new_hash = refresh_token_digest(new_token_sec)
     new_expires = datetime.now(timezone.utc) + REFRESH_EXP
 
     db_token.token_hash = new_hash
@@ -162,15 +196,14 @@ def validate_refresh_token(token):
     }), 200
 
 def cleanup_expired_tokens():
-    now = datetime.now(timezone.utc)
-
-    deleted_count = db.session.query(RefreshToken).filter(RefreshToken.expires_at < now).delete()
+    # Em lotes, como a limpeza periódica (src/token_reaper.py): um DELETE único travaria a tabela
+    from src.token_reaper import reap_refresh_tokens
 
     try:
-        db.session.commit()
-    except:
-        db.session.rollback()
+        result = reap_refresh_tokens()
+    except Exception as e:
+        logger.error(f"Error while deleting expired tokens: {str(e)}")
         return False
     
-    logger.info(f"Deleted {deleted_count} expired tokens")
+    logger.info(f"Deleted {result['expired']} expired and {result['invalidated']} invalidated tokens in {result['seconds']:.2f}s")
     return True
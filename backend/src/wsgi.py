@@ -2,6 +2,9 @@ from .app import *
 from src.logger import logger
 from flask_cors import CORS
 from src.validate import *
+from src.outbox import start_outbox_relay
+from src.app.emqx.acl_reconciler import start_acl_reconciler
+from src.token_reaper import start_token_reaper
 
 @base_bp.route("/ping", methods = ["GET"])
 def ping():
@@ -47,8 +50,17 @@ app = init_app()
 CORS(app, resources={r"/api/*": {"origins": "http://localhost:5173"}})
 # Create database tables if they don't exist
 with app.app_context():
-    from schema import db
+    from src.schema import db
     db.create_all()
     logger.info("Database tables created/verified")
-    
+
+# Publica os eventos do outbox (no Postgres, um worker por vez)
+start_outbox_relay(app)
+
+# Regras de ACL no banco interno do EMQX (com EMQX_API_ENABLED): reconciliação e varredura periódica
+start_acl_reconciler(app)
+
+# Limpeza em lotes dos refresh tokens vencidos ou invalidados
+start_token_reaper(app)
+
 logger.info("Server started!")
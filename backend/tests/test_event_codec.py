@@ -0,0 +1,94 @@
+import json
+import pytest
+import zstandard
+from src.app.emqx import event_codec
+from src.app.emqx.event_codec import decode_event, encode_event, CONTENT_TYPES, ZSTD
+
+EVENT = {
+    "type": "MESSAGE_NEW",
+    "from": "4c1f0e2a-8b7d-4e6f-9a5b-3c2d1e0f9a8b",
+    "payload": {"message_id": "6f1b7c2e-1d3a-4b5c-9e8f-0a1b2c3d4e5f", "content": "bom dia!"},
+    "timestamp": "2025-11-21T17:35:20+00:00",
+}
+
+@pytest.mark.parametrize("encoding", ["json", "msgpack", "cbor"])
+def test_round_trip(encoding):
+    payload, content_type, content_encoding = encode_event(EVENT, encoding=encoding, compress_threshold=0)
+
+    assert content_type == CONTENT_TYPES[encoding]
+    assert content_encoding is None
+
+    decoded = decode_event(payload, content_type)
+    if encoding == "json":
+        assert decoded == EVENT
+    else:
+        # Formatos compactos levam o timestamp em ms desde a época
+        assert decoded == dict(EVENT, timestamp=1763746520000)
+
+@pytest.mark.parametrize("encoding", ["json", "msgpack", "cbor"])
+def test_decode_without_properties_sniffs_format(encoding):
+    payload, _, _ = encode_event(EVENT, encoding=encoding, compress_threshold=0)
+    assert decode_event(payload)["type"] == "MESSAGE_NEW"
+
+def test_compressed_round_trip():
+    event = dict(EVENT, payload={"message_id": EVENT["payload"]["message_id"], "content": "bom dia! " * 200})
+    payload, content_type, content_encoding = encode_event(event, encoding="json", compress_threshold=64)
+
+    assert content_encoding == ZSTD
+    assert len(payload) < len(json.dumps(event))
+    assert decode_event(payload, content_type, content_encoding) == event
+    # Sem a user property o frame é reconhecido pelo magic number
+    assert decode_event(payload) == event
+
+def test_payload_that_grows_is_not_compressed():
+    payload, _, content_encoding = encode_event({"type": "X"}, encoding="json", compress_threshold=1)
+    assert content_encoding is None
+    assert payload == b'{"type": "X"}'
+
+def test_zstd_bomb_with_declared_size_is_rejected(monkeypatch):
+    monkeypatch.setattr(event_codec, "MQTT_MAX_EVENT_SIZE", 1024)
+    bomb = zstandard.ZstdCompressor().compress(b"{" + b" " * (64 * 1024 * 1024) + b"}")
+
+    assert zstandard.frame_content_size(bomb) > 1024
+    with pytest.raises(ValueError, match="larger than"):
+        decode_event(bomb, "application/json", ZSTD)
+
+def test_zstd_bomb_without_declared_size_is_rejected(monkeypatch):
+    monkeypatch.setattr(event_codec, "MQTT_MAX_EVENT_SIZE", 1024)
+    compressor = zstandard.ZstdCompressor(write_content_size=False)
+    bomb = compressor.compress(b"{" + b" " * (64 * 1024 * 1024) + b"}")
+
+    assert zstandard.frame_content_size(bomb) == -1
+    with pytest.raises(ValueError, match="larger than"):
+        decode_event(bomb, "application/json", ZSTD)
+
+def test_event_at_the_limit_is_accepted(monkeypatch):
+    data = json.dumps(EVENT).encode()
+    monkeypatch.setattr(event_codec, "MQTT_MAX_EVENT_SIZE", len(data))
+
+    assert decode_event(zstandard.ZstdCompressor().compress(data), "application/json", ZSTD) == EVENT
+
+@pytest.mark.parametrize("payload, content_type, content_encoding", [
+    (b"{not json", "application/json", None),
+    (b"{}", "text/plain", None),
+    (b"{}", "application/json", "gzip"),
+    (b"\x28\xb5\x2f\xfd garbage", "application/json", ZSTD),
+])
+def test_invalid_payloads_raise_value_error(payload, content_type, content_encoding):
+    with pytest.raises(ValueError):
+        decode_event(payload, content_type, content_encoding)
+
+def test_publications_default_to_plain_json_on_the_topic():
+    assert event_codec.event_publications("/users/x", EVENT) == [("/users/x", json.dumps(EVENT).encode(), "application/json", None)]
+
+def test_compact_copies_go_to_the_suffixed_topics(monkeypatch):
+    monkeypatch.setattr(event_codec, "MQTT_EVENT_ENCODINGS", ("msgpack", "cbor"))
+    stored = json.dumps(EVENT)
+
+    publications = event_codec.stored_event_publications("/groups/g", stored)
+
+    assert [topic for topic, *_ in publications] == ["/groups/g", "/groups/g/msgpack", "/groups/g/cbor"]
+    # O tópico base segue com o texto guardado, sem recodificar
+    assert publications[0] == ("/groups/g", stored, "application/json", None)
+    for _, payload, content_type, content_encoding in publications[1:]:
+        assert decode_event(payload, content_type, content_encoding)["payload"] == EVENT["payload"]
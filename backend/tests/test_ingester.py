@@ -0,0 +1,84 @@
+import uuid
+from datetime import datetime, timezone
+import pytest
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+from src import ingester as ingester_module
+from src.ingester import MessageIngester
+from src.schema import db, Message, User, Group, UserGroup, FriendshipStatus
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'ingest.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+@pytest.fixture
+def chat(app):
+    with app.app_context():
+        user = User(username="ingest", password="x", name="Ingest", email="ingest@test.local")
+        group = Group(name="Ingest")
+        db.session.add_all([user, group])
+        db.session.flush()
+        db.session.add(UserGroup(user_id=user.id, group_id=group.id, role="owner", invite_status=FriendshipStatus.APPROVED))
+        db.session.commit()
+        return user.id, group.id
+
+def new_message(chat, content="oi"):
+    sender_id, group_id = chat
+    return {
+        "type": "MESSAGE_NEW",
+        "message_id": uuid.uuid4(),
+        "chat_type": "group",
+        "chat_id": group_id,
+        "sender_id": sender_id,
+        "recipient_id": None,
+        "content": content,
+        "attachment": None,
+        "received_at": datetime.now(timezone.utc),
+    }
+
+def stored_ids(app):
+    with app.app_context():
+        return set(db.session.execute(db.select(Message.message_id)).scalars())
+
+def test_bad_event_is_dropped_and_the_rest_of_the_batch_is_written(app, chat):
+    events = [new_message(chat) for _ in range(7)]
+    # Viola o CHECK de chat_type: o INSERT do lote inteiro falha com IntegrityError
+    bad = dict(new_message(chat), chat_type="channel")
+    batch = [(event, 0.0) for event in events[:3] + [bad] + events[3:]]
+
+    ingester = MessageIngester(app)
+    ingester._write(batch)
+
+    assert stored_ids(app) == {e["message_id"] for e in events}
+    assert ingester.counters["inserted"] == 7
+    assert ingester.counters["dropped"] == 1
+    assert ingester.counters["batches"] == 1
+
+def test_transient_error_retries_the_same_batch(app, chat, monkeypatch):
+    events = [new_message(chat) for _ in range(3)]
+    store_events = ingester_module.store_events
+    calls = []
+
+    def flaky_store_events(batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise OperationalError("INSERT", {}, Exception("server closed the connection unexpectedly"))
+        return store_events(batch)
+
+    monkeypatch.setattr(ingester_module, "store_events", flaky_store_events)
+    monkeypatch.setattr(ingester_module.time, "sleep", lambda seconds: None)
+
+    ingester = MessageIngester(app)
+    ingester._write([(event, 0.0) for event in events])
+
+    assert calls == [3, 3]
+    assert stored_ids(app) == {e["message_id"] for e in events}
+    assert ingester.counters["dropped"] == 0
+    assert ingester.counters["write_errors"] == 1
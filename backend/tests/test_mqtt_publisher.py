@@ -0,0 +1,35 @@
+import threading
+from src.app.emqx import mqtt_publisher
+from src.app.emqx.mqtt_publisher import PersistentPublisher
+
+def test_no_conn_publish_is_queued_once_and_acked_later():
+    # Sem loop_start o socket nunca abre: todo publish() volta com MQTT_ERR_NO_CONN
+    publisher = PersistentPublisher(client_id="test-no-conn")
+    publisher._connected.set()
+    publisher._sender.start()
+
+    acked = threading.Event()
+    publisher.enqueue("users/x", b"{}", on_ack=lambda ok: ok and acked.set())
+    publisher._queue.put(None)
+    publisher._sender.join(timeout=5)
+
+    # Uma única mensagem guardada no paho para reenvio, com o mid registrado
+    assert len(publisher._client._out_messages) == 1
+    mid = next(iter(publisher._client._out_messages))
+    assert list(publisher._pending) == [mid]
+    assert publisher.failed == 0
+
+    publisher._on_publish(publisher._client, None, mid)
+    assert acked.is_set()
+    assert not publisher._pending and not publisher._early_acks
+
+def test_stale_early_acks_expire(monkeypatch):
+    publisher = PersistentPublisher(client_id="test-early-acks")
+    now = [1000.0]
+    monkeypatch.setattr(mqtt_publisher.time, "monotonic", lambda: now[0])
+
+    publisher._on_publish(publisher._client, None, 1)
+    now[0] += mqtt_publisher.EARLY_ACK_TTL + 1
+    publisher._on_publish(publisher._client, None, 2)
+
+    assert list(publisher._early_acks) == [2]
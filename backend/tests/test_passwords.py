@@ -0,0 +1,16 @@
+from src import passwords
+from src.passwords import PasswordPool
+
+def test_background_task_errors_are_logged(monkeypatch):
+    errors = []
+    monkeypatch.setattr(passwords.logger, "error", errors.append)
+
+    def fail():
+        raise RuntimeError("database is gone")
+
+    pool = PasswordPool(size=1, queue_limit=4)
+    assert pool.run_in_background(fail)
+    pool._executor.shutdown(wait=True)
+
+    assert errors == ["Password background task failed: RuntimeError('database is gone')"]
+    assert pool.stats()["pending"] == 0
@@ -250,10 +250,9 @@ function Chat() {
     if (!currentUser || !chatParams || mqttClient) return;
 
     const accessToken = localStorage.getItem('access_token');
-    const username = currentUser.username;
-
     const client = mqtt.connect('ws://localhost:8083/mqtt', {
-      username: username,
+      // O broker só aceita o uuid do usuário como username (o mesmo do JWT)
+      username: currentUser.uuid,
       password: accessToken || '',
       clientId: `conchat-${Math.random().toString(16).substring(2, 10)}`,
       reconnectPeriod: 5000,
@@ -0,0 +1,92 @@
+"""
+Mede tempo de carga, uso de memória e latência de consulta do acl_graph
+com dados sintéticos (sem banco).
+
+Uso (a partir de webhooks/):
+    python bench/acl_graph.py [--users 1000000] [--groups 100000]
+                              [--memberships 10000000] [--friendships 5000000]
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import uuid
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.append(os.path.join(HERE, "..", "..", "backend", "src"))
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def max_rss_bytes():
+    # ru_maxrss é em KB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--groups", type=int, default=100_000)
+    parser.add_argument("--memberships", type=int, default=10_000_000)
+    parser.add_argument("--friendships", type=int, default=5_000_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    args = parser.parse_args()
+
+    # O pacote webhooks carrega o logger, que escreve em logs/ no diretório atual
+    os.chdir(tempfile.mkdtemp(prefix="acl_bench_"))
+    from webhooks.acl_graph import AuthorizationGraph, GraphBuilder
+
+    rng = random.Random(42)
+    users = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(args.users)]
+    groups = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(args.groups)]
+
+    rss_before = max_rss_bytes()
+    start = time.perf_counter()
+
+    builder = GraphBuilder()
+    for _ in range(args.memberships):
+        builder.add_membership(users[rng.randrange(args.users)], groups[rng.randrange(args.groups)])
+    for _ in range(args.friendships):
+        a, b = rng.randrange(args.users), rng.randrange(args.users)
+        if a != b:
+            builder.add_friendship(users[a], users[b])
+
+    graph = AuthorizationGraph(enabled=True)
+    graph.install(builder)
+    del builder
+
+    load_time = time.perf_counter() - start
+    stats = graph.stats()
+
+    print(f"load: {load_time:.1f}s for {stats['memberships']} memberships and {stats['friendships']} friendships")
+    print(f"memory: {stats['memory_bytes'] / 2**20:.1f} MiB reported by the graph, "
+          f"max RSS grew {(max_rss_bytes() - rss_before) / 2**20:.1f} MiB while loading")
+
+    # Metade das consultas cai em grupos/amigos reais do usuário
+    member_samples, friend_samples = [], []
+    for _ in range(args.lookups):
+        user = users[rng.randrange(args.users)]
+        known_groups = graph.all_groups(user)
+        group = rng.choice(known_groups) if known_groups and rng.random() < 0.5 else groups[rng.randrange(args.groups)]
+
+        t0 = time.perf_counter_ns()
+        graph.member_groups(user, (group,))
+        member_samples.append(time.perf_counter_ns() - t0)
+
+        known_friends = graph.all_friends(user)
+        friend = rng.choice(known_friends) if known_friends and rng.random() < 0.5 else users[rng.randrange(args.users)]
+
+        t0 = time.perf_counter_ns()
+        graph.approved_friends(user, (friend,))
+        friend_samples.append(time.perf_counter_ns() - t0)
+
+    for label, samples in (("is member", member_samples), ("are friends", friend_samples)):
+        print(f"{label}: p50={percentile(samples, 50) / 1000:.2f}us p99={percentile(samples, 99) / 1000:.2f}us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Mede a latência do /webhooks/v1/acl_auth com e sem o cache de decisões.
+
+Uso (a partir de webhooks/):
+    python bench/acl_latency.py [--requests 5000] [--users 50] [--groups 20]
+
+Usa um banco SQLite temporário e o test client do Flask, então mede apenas o
+custo do processo de webhooks (validação do JWT + regras + banco).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import logging
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.append(os.path.join(HERE, "..", "..", "backend", "src"))
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def seed(db, users_count, groups_count):
+    from shared.schema import User, Group, UserGroup, Friendship, FriendshipStatus
+
+    users = [User(username=f"user{i}", password="x", name=f"User {i}", email=f"user{i}@bench.local") for i in range(users_count)]
+    groups = [Group(name=f"group{i}") for i in range(groups_count)]
+    db.session.add_all(users + groups)
+    db.session.flush()
+
+    for group in groups:
+        for user in random.sample(users, min(len(users), 10)):
+            db.session.add(UserGroup(user_id=user.id, group_id=group.id, role="member", invite_status=FriendshipStatus.APPROVED))
+
+    for i, user in enumerate(users):
+        friend = users[(i + 1) % len(users)]
+        db.session.add(Friendship(requester_id=user.id, addressee_id=friend.id, status=FriendshipStatus.APPROVED))
+
+    db.session.commit()
+    return [str(u.id) for u in users], [str(g.id) for g in groups]
+
+def run(client, jwt_for, users, groups, requests_count):
+    latencies = []
+    for _ in range(requests_count):
+        user = random.choice(users)
+        kind = random.random()
+        if kind < 0.6:
+            topic, action = f"/groups/{random.choice(groups)}", "publish"
+        elif kind < 0.9:
+            topic, action = f"/dms/{random.choice(users)}", "publish"
+        else:
+            topic, action = f"/dms/{user}", "subscribe"
+
+        body = {"clientid": f"web_{user}", "username": user, "password": jwt_for[user], "topic": topic, "action": action}
+
+        start = time.perf_counter()
+        client.post("/webhooks/v1/acl_auth", json=body)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--groups", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="acl_bench_")
+    os.chdir(workdir)
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("SECRET_KEY", "bench-secret-key-with-enough-length!")
+
+    import jwt
+    from app import init_app
+    from logger import logger
+    from shared.schema import db
+    from webhooks.acl_cache import acl_cache
+
+    logger.setLevel(logging.ERROR)
+    random.seed(42)
+
+    app = init_app()
+    with app.app_context():
+        db.create_all()
+        users, groups = seed(db, args.users, args.groups)
+
+    exp = datetime.now(timezone.utc) + timedelta(hours=1)
+    jwt_for = {u: jwt.encode({"sub": u, "role": "default", "exp": exp}, os.environ["SECRET_KEY"], algorithm="HS256") for u in users}
+
+    client = app.test_client()
+    for enabled in (False, True):
+        acl_cache.enabled = enabled
+        acl_cache.clear()
+        acl_cache.hits = acl_cache.misses = 0
+
+        random.seed(7)
+        latencies = run(client, jwt_for, users, groups, args.requests)
+
+        label = "cache on " if enabled else "cache off"
+        print(f"{label}: p50={percentile(latencies, 50):.3f}ms p99={percentile(latencies, 99):.3f}ms "
+              f"hits={acl_cache.hits} misses={acl_cache.misses}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Conta quantas chamadas ao /webhooks/v1/acl_auth seriam feitas a cada 1.000
+mensagens, com e sem as regras de ACL anexadas na conexão.
+
+Uso (a partir de webhooks/):
+    python bench/connect_acl.py [--messages 1000] [--users 50] [--groups 20]
+
+Simula o EMQX: cada usuário conecta uma vez (chamando /connect), assina seus
+tópicos e publica mensagens em grupos e DMs. Um tópico coberto pelas regras
+recebidas na conexão não gera chamada ao webhook de ACL. O cache de
+autorização do próprio EMQX não é simulado, para isolar o efeito das regras.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import logging
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.append(os.path.join(HERE, "..", "..", "backend", "src"))
+
+def rule_matches(rule, topic, action):
+    return rule["topic"] == topic and rule["action"] in ("all", action)
+
+def simulate(client, jwt_for, users, memberships, friends, messages, use_connect_acl):
+    acl_calls = 0
+    attached = {}
+
+    def check(user, topic, action):
+        nonlocal acl_calls
+        if use_connect_acl and any(rule_matches(r, topic, action) for r in attached[user]):
+            return
+        acl_calls += 1
+        client.post("/webhooks/v1/acl_auth", json={
+            "clientid": f"web_{user}", "username": user, "password": jwt_for[user],
+            "topic": topic, "action": action
+        })
+
+    for user in users:
+        res = client.post("/webhooks/v1/connect", json={"clientid": f"web_{user}", "username": user, "password": jwt_for[user]})
+        attached[user] = res.get_json().get("acl", [])
+
+        check(user, f"/dms/{user}", "subscribe")
+        for group in memberships[user]:
+            check(user, f"/groups/{group}", "subscribe")
+
+    senders = [u for u in users if memberships[u] or friends[u]]
+    for _ in range(messages):
+        user = random.choice(senders)
+        if memberships[user] and (not friends[user] or random.random() < 0.7):
+            check(user, f"/groups/{random.choice(memberships[user])}", "publish")
+        else:
+            check(user, f"/dms/{random.choice(friends[user])}", "publish")
+
+    return acl_calls
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--groups", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="acl_bench_")
+    os.chdir(workdir)
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("SECRET_KEY", "bench-secret-key-with-enough-length!")
+
+    import jwt
+    from app import init_app
+    from logger import logger
+    from shared.schema import db, UserGroup, Friendship
+    from webhooks.acl_cache import acl_cache
+    from acl_latency import seed
+
+    logger.setLevel(logging.ERROR)
+    random.seed(42)
+
+    app = init_app()
+    with app.app_context():
+        db.create_all()
+        users, _ = seed(db, args.users, args.groups)
+
+        memberships = {u: [] for u in users}
+        for rel in db.session.query(UserGroup).all():
+            memberships[str(rel.user_id)].append(str(rel.group_id))
+
+        friends = {u: [] for u in users}
+        for rel in db.session.query(Friendship).all():
+            friends[str(rel.requester_id)].append(str(rel.addressee_id))
+            friends[str(rel.addressee_id)].append(str(rel.requester_id))
+
+    exp = datetime.now(timezone.utc) + timedelta(hours=1)
+    jwt_for = {u: jwt.encode({"sub": u, "role": "default", "exp": exp}, os.environ["SECRET_KEY"], algorithm="HS256") for u in users}
+
+    # O cache de decisões não muda o número de chamadas, só o custo de cada uma
+    acl_cache.enabled = False
+    client = app.test_client()
+
+    for use_connect_acl in (False, True):
+        random.seed(7)
+        calls = simulate(client, jwt_for, users, memberships, friends, args.messages, use_connect_acl)
+        label = "with connect ACL   " if use_connect_acl else "without connect ACL"
+        print(f"{label}: {calls} acl_auth calls ({calls * 1000 / args.messages:.1f} per 1000 messages, "
+              f"{len(users)} connects included)")
+
+if __name__ == "__main__":
+    main()
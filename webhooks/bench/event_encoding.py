@@ -0,0 +1,98 @@
+"""
+Compara os formatos de evento MQTT do backend (backend/src/app/emqx/event_codec):
+tamanho do payload e CPU de encode/decode em JSON, MessagePack e CBOR, com e
+sem zstd, para eventos típicos de pedido de amizade, membros de grupo e chat.
+
+Uso (a partir de webhooks/):
+    python bench/event_encoding.py [--repeat 20000]
+
+Os tempos são a mediana de 5 rodadas de --repeat chamadas, em microssegundos
+por evento. "zstd" força a tentativa de compressão (limiar de 1 byte); se o
+resultado ficar maior, o payload sai sem compressão, como no publisher.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import timeit
+import uuid
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "..", "backend"))
+
+from src.app.emqx.event_codec import encode_event, decode_event
+
+ENCODINGS = ("json", "msgpack", "cbor")
+
+def event(event_type, payload):
+    return {
+        "type": event_type,
+        "from": str(uuid.uuid4()),
+        "payload": payload,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+WORDS = ("oi", "alguém", "vai", "na", "reunião", "de", "amanhã", "preciso", "confirmar", "o", "horário",
+         "projeto", "entrega", "sexta", "pode", "revisar", "código", "depois", "almoço", "ok", "valeu", "isso")
+
+def text(length, seed=7):
+    """Texto com palavras sorteadas: repetitivo como conversa real, não como uma frase copiada"""
+    rng = random.Random(seed)
+    words = []
+    while sum(len(w) + 1 for w in words) < length:
+        words.append(rng.choice(WORDS))
+    return " ".join(words)[:length]
+
+def sample_events():
+    user_id = str(uuid.uuid4())
+    return {
+        "friend request": event("FRIENDREQUEST_RECEIVED", {
+            "requester_id": user_id,
+            "requester_username": "maria_silva",
+            "requester_name": "Maria Silva",
+            "requester_pfp_url": "profile_pictures/4c1f0e2a-8b7d-4e6f-9a5b-3c2d1e0f9a8b.png",
+        }),
+        "friend status": event("FRIENDSTATUS_UPDATE", {
+            "action": "accept",
+            "user_id": user_id,
+            "username": "maria_silva",
+            "name": "Maria Silva",
+            "pfp_url": None,
+        }),
+        "member add": event("GROUPMEMBER_ADD", {"group_id": str(uuid.uuid4()), "user_id": user_id, "role": "member"}),
+        "chat (short)": event("MESSAGE_NEW", {"message_id": str(uuid.uuid4()), "content": "bom dia!"}),
+        "chat (typical)": event("MESSAGE_NEW", {"message_id": str(uuid.uuid4()), "content": text(120)}),
+        "chat (2000 chars)": event("MESSAGE_NEW", {"message_id": str(uuid.uuid4()), "content": text(2000)}),
+    }
+
+def per_call_us(function, repeat):
+    runs = timeit.repeat(function, number=repeat, repeat=5)
+    return statistics.median(runs) / repeat * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'event':<18} {'format':<16} {'bytes':>6} {'vs json':>8} {'encode us':>10} {'decode us':>10}")
+    for name, sample in sample_events().items():
+        json_size = None
+        for encoding in ENCODINGS:
+            for threshold in (0, 1):
+                payload, content_type, content_encoding = encode_event(sample, encoding, threshold)
+                assert decode_event(payload, content_type, content_encoding)["payload"] == sample["payload"]
+
+                if json_size is None:
+                    json_size = len(payload)
+
+                encode_us = per_call_us(lambda: encode_event(sample, encoding, threshold), args.repeat)
+                decode_us = per_call_us(lambda: decode_event(payload, content_type, content_encoding), args.repeat)
+
+                label = encoding + ("+zstd" if content_encoding else " (zstd>)" if threshold else "")
+                print(f"{name:<18} {label:<16} {len(payload):>6} {len(payload) / json_size:>7.0%} {encode_us:>10.2f} {decode_us:>10.2f}")
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Mede o custo de páginas do histórico de mensagens (backend/src/app/history)
+em profundidades diferentes de um mesmo chat grande, e confere no plano de
+execução que a busca pelo cursor usa ix_messages_chat_history sem ordenar.
+
+Uso (a partir de webhooks/):
+    python bench/history_pages.py [--messages 1000000] [--limit 50]
+
+Usa DATABASE_URL se definida (Postgres) ou um banco SQLite temporário. As
+mensagens sintéticas só são inseridas se o chat do bench ainda estiver vazio.
+Termina com código 1 se o plano não usar o índice ou precisar de ordenação.
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "..", "backend"))
+
+BATCH_SIZE = 10000
+# Chat fixo para poder reaproveitar os dados entre execuções
+BENCH_CHAT_ID = uuid.UUID("0b0e1c4a-7d1e-4f3b-9b8a-5c2d6e7f8a90")
+
+def seed(db, Message, total, noise_chats=50):
+    """Um chat com total mensagens e alguns chats menores intercalados (pra o índice não ser trivial)."""
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    table = Message.__table__
+    others = [uuid.uuid4() for _ in range(noise_chats)]
+
+    rows = []
+    for i in range(total):
+        # Vários envios no mesmo instante: o desempate pelo id também é exercitado
+        sent_at = start + timedelta(milliseconds=(i // 3) * 10)
+        rows.append({"message_id": uuid.uuid4(), "chat_type": "group", "chat_id": BENCH_CHAT_ID,
+                     "content": f"bench message {i}", "sent_at": sent_at})
+        if i % 10 == 0:
+            rows.append({"message_id": uuid.uuid4(), "chat_type": "group", "chat_id": others[i % noise_chats],
+                         "content": f"noise {i}", "sent_at": sent_at})
+        if len(rows) >= BATCH_SIZE:
+            db.session.execute(table.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(table.insert(), rows)
+    db.session.commit()
+
+def explain(db, statement):
+    dialect = db.engine.dialect
+    compiled = statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+
+    if dialect.name == "postgresql":
+        db.session.execute(db.text("SET LOCAL enable_seqscan = off"))
+        rows = db.session.execute(db.text(f"EXPLAIN {compiled}")).scalars()
+    else:
+        rows = (row[-1] for row in db.session.execute(db.text(f"EXPLAIN QUERY PLAN {compiled}")))
+
+    return "\n".join(rows)
+
+def plan_ok(dialect_name, plan):
+    if dialect_name == "postgresql":
+        return "ix_messages_chat_history" in plan and "Sort" not in plan and "Seq Scan" not in plan
+    return "USING INDEX ix_messages_chat_history" in plan and "TEMP B-TREE" not in plan
+
+def cursor_at(db, Message, page, limit):
+    """Cursor que abre a página (1-based) page; usa OFFSET só aqui, para montar o teste."""
+    if page == 1:
+        return None
+    row = db.session.execute(
+        db.select(Message.sent_at, Message.id).where(Message.chat_id == BENCH_CHAT_ID)
+        .order_by(Message.sent_at.desc(), Message.id.desc())
+        .offset((page - 1) * limit - 1).limit(1)
+    ).one_or_none()
+    return (row.sent_at, row.id) if row else None
+
+def measure(db, statement, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = db.session.execute(statement).all()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), len(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="history_pages_")
+    os.chdir(workdir)
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'history.db')}")
+    os.environ.setdefault("SECRET_KEY", "bench-secret-key-with-enough-length!")
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+    from src.app import init_app
+    from src.logger import logger
+    from src.schema import db, Message
+    from src.app.history.routes import history_query
+
+    logger.setLevel(logging.ERROR)
+
+    app = init_app()
+    with app.app_context():
+        db.create_all()
+        if db.session.execute(db.select(Message.id).where(Message.chat_id == BENCH_CHAT_ID).limit(1)).first() is None:
+            start = time.perf_counter()
+            seed(db, Message, args.messages)
+            print(f"seeded {args.messages} messages in {time.perf_counter() - start:.1f}s")
+
+        dialect_name = db.engine.dialect.name
+        failed = False
+
+        for page in args.pages:
+            before = cursor_at(db, Message, page, args.limit)
+            if page > 1 and before is None:
+                print(f"page {page:>6}: chat has fewer than {page * args.limit} messages, skipped")
+                continue
+
+            statement = history_query(BENCH_CHAT_ID, before, args.limit)
+            plan = explain(db, statement)
+            db.session.rollback()
+            ok = plan_ok(dialect_name, plan)
+            failed = failed or not ok
+
+            median_ms, rows = measure(db, statement, args.repeat)
+            print(f"page {page:>6}: {median_ms:7.3f} ms median, {rows} rows  [{'ok' if ok else 'FAIL'}]")
+            if not ok:
+                print("    " + plan.replace("\n", "\n    "))
+
+        db.session.rollback()
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+Teste de carga do servidor de webhooks simulando o tráfego do EMQX:
+conexões (/connect) e checagens de ACL de subscribe e publish (/acl_auth).
+
+Uso (a partir de webhooks/, depois de popular o banco com bench/seed_data.py):
+    # Flask test client, no mesmo processo
+    python bench/loadtest.py --database-url sqlite:////tmp/load.db --target testclient
+
+    # gunicorn de verdade, iniciado pelo script
+    python bench/loadtest.py --target gunicorn --workers 4 --concurrency 32
+
+    # servidor já rodando (ex.: container ou modo ASGI)
+    python bench/loadtest.py --target http://localhost:5001 --concurrency 32
+
+    # grava o resultado e compara com uma execução anterior
+    python bench/loadtest.py --target gunicorn --save after.json --baseline before.json
+
+O mix de operações é configurável (--mix connect=0.05,subscribe=0.35,publish=0.6).
+Os tokens JWT são assinados com SECRET_KEY, que precisa ser a mesma do servidor.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WEBHOOKS_SRC = os.path.join(HERE, "..", "src")
+BACKEND_SRC = os.path.join(HERE, "..", "..", "backend", "src")
+sys.path.insert(0, WEBHOOKS_SRC)
+sys.path.append(BACKEND_SRC)
+
+DEFAULT_MIX = "connect=0.05,subscribe=0.35,publish=0.6"
+QUERY_CHUNK = 1000
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name not in ("connect", "subscribe", "publish"):
+            raise ValueError(f"Unknown operation '{name}' in --mix")
+        mix[name] = float(weight)
+    return mix
+
+# População -------------------------------------------------------------------------------------------------------------
+
+def load_population(database_url, sample_users):
+    """
+    Lê do banco uma amostra de usuários com seus grupos e amigos aprovados.
+    Dá preferência aos usuários sintéticos do seed_data.py.
+    """
+    from sqlalchemy import create_engine, select, or_
+    from shared.schema import User, Group, UserGroup, Friendship, FriendshipStatus
+
+    engine = create_engine(database_url)
+    with engine.connect() as connection:
+        users = [str(u) for u in connection.execute(select(User.id).where(User.username.like("load%")).limit(sample_users)).scalars()]
+        if not users:
+            users = [str(u) for u in connection.execute(select(User.id).limit(sample_users)).scalars()]
+        all_groups = [str(g) for g in connection.execute(select(Group.id).limit(100000)).scalars()]
+
+        groups = {u: [] for u in users}
+        friends = {u: [] for u in users}
+        for i in range(0, len(users), QUERY_CHUNK):
+            chunk = users[i:i + QUERY_CHUNK]
+            ids = [uuid.UUID(u) for u in chunk]
+
+            for user_id, group_id in connection.execute(select(UserGroup.user_id, UserGroup.group_id).where(
+                    UserGroup.user_id.in_(ids), UserGroup.invite_status == FriendshipStatus.APPROVED)):
+                groups[str(user_id)].append(str(group_id))
+
+            for low_id, high_id in connection.execute(select(Friendship.user_low_id, Friendship.user_high_id).where(
+                    or_(Friendship.user_low_id.in_(ids), Friendship.user_high_id.in_(ids)),
+                    Friendship.status == FriendshipStatus.APPROVED)):
+                low_id, high_id = str(low_id), str(high_id)
+                if low_id in friends:
+                    friends[low_id].append(high_id)
+                if high_id in friends:
+                    friends[high_id].append(low_id)
+
+    engine.dispose()
+    return users, all_groups, groups, friends
+
+def build_operations(rng, count, mix, users, all_groups, groups, friends, tokens):
+    """
+    Gera a sequência de requisições. Cerca de 10% dos subscribes e publishes
+    miram tópicos sem permissão, como um cliente desatualizado faria.
+    """
+    names, weights = zip(*mix.items())
+    operations = []
+
+    for _ in range(count):
+        user = rng.choice(users)
+        credentials = {"clientid": f"web_{user}", "username": user, "password": tokens[user]}
+        operation = rng.choices(names, weights)[0]
+
+        if operation == "connect":
+            operations.append(("connect", "/webhooks/v1/connect", credentials))
+            continue
+
+        roll = rng.random()
+        if operation == "subscribe":
+            if roll < 0.1 or not groups[user]:
+                topic = f"/groups/{rng.choice(all_groups)}" if all_groups and roll < 0.05 else f"/dms/{rng.choice(users)}"
+            elif roll < 0.4:
+                topic = rng.choice((f"/dms/{user}", f"/users/{user}"))
+            else:
+                topic = f"/groups/{rng.choice(groups[user])}"
+        else:
+            if roll < 0.1:
+                topic = rng.choice((f"/dms/{rng.choice(users)}", f"/users/{user}"))
+            elif roll < 0.4 and friends[user]:
+                topic = f"/dms/{rng.choice(friends[user])}"
+            elif groups[user]:
+                topic = f"/groups/{rng.choice(groups[user])}"
+            else:
+                topic = f"/dms/{rng.choice(users)}"
+
+        body = dict(credentials, topic=topic, action=operation)
+        operations.append((f"acl_auth {operation}", "/webhooks/v1/acl_auth", body))
+
+    return operations
+
+# Alvos -----------------------------------------------------------------------------------------------------------------
+
+class TestClientTarget:
+    """Chama o app Flask em processo, sem rede."""
+
+    def __init__(self):
+        from app import init_app
+        self.client = init_app().test_client()
+
+    def post(self, path, body):
+        return self.client.post(path, json=body).status_code
+
+    def close(self):
+        pass
+
+class HttpTarget:
+    """Chama um servidor HTTP, com uma sessão keep-alive por thread."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self._local = threading.local()
+
+    def post(self, path, body):
+        import requests
+
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session.post(self.base_url + path, json=body, timeout=30).status_code
+
+    def close(self):
+        pass
+
+class GunicornTarget(HttpTarget):
+    """Sobe um gunicorn com src/wsgi.py numa porta livre e o derruba no final."""
+
+    def __init__(self, workers, extra_args=()):
+        import requests
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        super().__init__(f"http://127.0.0.1:{port}")
+
+        self.workdir = tempfile.mkdtemp(prefix="loadtest_gunicorn_")
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join((os.path.abspath(WEBHOOKS_SRC), os.path.abspath(BACKEND_SRC))))
+        self.log = open(os.path.join(self.workdir, "gunicorn.log"), "w")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "--workers", str(workers), *extra_args, "wsgi:app"],
+            cwd=self.workdir, env=env, stdout=self.log, stderr=subprocess.STDOUT
+        )
+
+        deadline = time.monotonic() + 30
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited, see {self.log.name}")
+            try:
+                if requests.get(self.base_url + "/webhooks/v1/ping", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if time.monotonic() > deadline:
+                self.close()
+                raise RuntimeError(f"gunicorn did not answer in 30s, see {self.log.name}")
+            time.sleep(0.2)
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+# Execução e relatório --------------------------------------------------------------------------------------------------
+
+def execute(target, operations, concurrency):
+    """Executa as operações e retorna ([(rótulo, latência_ms, status)], duração_s)."""
+    def worker(chunk):
+        results = []
+        for label, path, body in chunk:
+            start = time.perf_counter()
+            try:
+                status = target.post(path, body)
+            except Exception:
+                status = None
+            results.append((label, (time.perf_counter() - start) * 1000, status))
+        return results
+
+    chunks = [operations[i::concurrency] for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = [r for chunk_results in pool.map(worker, chunks) for r in chunk_results]
+    return results, time.perf_counter() - start
+
+def summarize(results, duration):
+    by_label = {}
+    for label, latency, status in results:
+        by_label.setdefault(label, []).append((latency, status))
+    by_label["total"] = [(latency, status) for _, latency, status in results]
+
+    report = {}
+    for label, samples in by_label.items():
+        latencies = [latency for latency, _ in samples]
+        statuses = [status for _, status in samples]
+        report[label] = {
+            "requests": len(samples),
+            "allowed": sum(1 for s in statuses if s == 200),
+            "denied": sum(1 for s in statuses if s in (401, 403)),
+            "errors": sum(1 for s in statuses if s is None or s >= 500 or s == 400),
+            "rps": len(samples) / duration,
+            "p50_ms": percentile(latencies, 50),
+            "p90_ms": percentile(latencies, 90),
+            "p99_ms": percentile(latencies, 99),
+            "max_ms": max(latencies),
+        }
+    return report
+
+def print_report(report, baseline=None):
+    header = f"{'endpoint':<20} {'requests':>8} {'allow':>6} {'deny':>6} {'errors':>6} {'req/s':>9} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}"
+    print(header)
+    print("-" * len(header))
+    for label, row in report.items():
+        print(f"{label:<20} {row['requests']:>8} {row['allowed']:>6} {row['denied']:>6} {row['errors']:>6} {row['rps']:>9.1f} "
+              f"{row['p50_ms']:>8.2f} {row['p90_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['max_ms']:>8.2f}")
+
+        before = (baseline or {}).get(label)
+        if before:
+            print(f"{'  vs baseline':<20} {'':>8} {'':>6} {'':>6} {'':>6} {row['rps'] / before['rps'] - 1:>+9.1%} "
+                  f"{row['p50_ms'] / before['p50_ms'] - 1:>+8.1%} {row['p90_ms'] / before['p90_ms'] - 1:>+8.1%} "
+                  f"{row['p99_ms'] / before['p99_ms'] - 1:>+8.1%} {row['max_ms'] / before['max_ms'] - 1:>+8.1%}")
+    print("latencies in ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--target", default="testclient", help="testclient, gunicorn ou a URL base de um servidor")
+    parser.add_argument("--workers", type=int, default=2, help="workers do gunicorn (--target gunicorn)")
+    parser.add_argument("--concurrency", type=int, default=1, help="threads fazendo requisições")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--warmup", type=int, default=1000, help="requisições iniciais fora do relatório")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--sample-users", type=int, default=5000, help="quantos usuários do banco participam")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--save", help="grava o relatório em JSON")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error("defina DATABASE_URL ou --database-url")
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SECRET_KEY", "bench-secret-key-with-enough-length!")
+    save_path = os.path.abspath(args.save) if args.save else None
+
+    import jwt
+
+    users, all_groups, groups, friends = load_population(args.database_url, args.sample_users)
+    if not users:
+        parser.error("nenhum usuário no banco; rode bench/seed_data.py antes")
+
+    exp = datetime.now(timezone.utc) + timedelta(hours=2)
+    tokens = {u: jwt.encode({"sub": u, "role": "default", "exp": exp}, os.environ["SECRET_KEY"], algorithm="HS256") for u in users}
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    warmup = build_operations(rng, args.warmup, mix, users, all_groups, groups, friends, tokens)
+    operations = build_operations(rng, args.requests, mix, users, all_groups, groups, friends, tokens)
+
+    if args.target == "testclient":
+        # O app escreve logs/ no diretório atual
+        os.chdir(tempfile.mkdtemp(prefix="loadtest_"))
+        target = TestClientTarget()
+    elif args.target == "gunicorn":
+        target = GunicornTarget(args.workers)
+    else:
+        target = HttpTarget(args.target)
+
+    try:
+        execute(target, warmup, args.concurrency)
+        results, duration = execute(target, operations, args.concurrency)
+    finally:
+        target.close()
+
+    report = summarize(results, duration)
+    print(f"target={args.target} concurrency={args.concurrency} users={len(users)} groups={len(all_groups)} "
+          f"duration={duration:.1f}s")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["report"]
+    print_report(report, baseline)
+
+    if save_path:
+        with open(save_path, "w") as f:
+            json.dump({"args": vars(args), "report": report}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
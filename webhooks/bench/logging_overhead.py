@@ -0,0 +1,80 @@
+"""
+Mede quanto o log síncrono custa por requisição no /webhooks/v1/acl_auth,
+comparando com o modo em fila (LOG_QUEUE) e com amostragem dos logs de decisão.
+
+Uso (a partir de webhooks/):
+    python bench/logging_overhead.py [--requests 5000] [--users 50] [--groups 20]
+
+O cache de decisões fica desligado para que toda requisição gere o log da
+decisão. A saída do console vai para /dev/null, mas continua sendo escrita.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.append(os.path.join(HERE, "..", "..", "backend", "src"))
+
+from acl_latency import percentile, seed, run
+
+MODES = (
+    ("sync", False, 1.0),
+    ("queued", True, 1.0),
+    ("queued, 1% sampled", True, 0.01),
+)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--groups", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="logging_bench_")
+    os.chdir(workdir)
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("SECRET_KEY", "bench-secret-key-with-enough-length!")
+
+    stdout = sys.stdout
+    sys.stderr = open(os.devnull, "w")
+
+    import jwt
+    import logger as logger_module
+    from app import init_app
+    from shared.schema import db
+    from webhooks.acl_cache import acl_cache
+
+    random.seed(42)
+    app = init_app()
+    with app.app_context():
+        db.create_all()
+        users, groups = seed(db, args.users, args.groups)
+
+    exp = datetime.now(timezone.utc) + timedelta(hours=1)
+    jwt_for = {u: jwt.encode({"sub": u, "role": "default", "exp": exp}, os.environ["SECRET_KEY"], algorithm="HS256") for u in users}
+
+    client = app.test_client()
+    acl_cache.enabled = False
+
+    # Aquecimento, para o primeiro modo não pagar o custo de inicialização
+    logger_module.setup_logger(queued=False, level="ERROR")
+    run(client, jwt_for, users, groups, min(args.requests, 500))
+
+    for label, queued, sample_rate in MODES:
+        logger_module.setup_logger(queued=queued, level="INFO")
+        logger_module.log_pipeline.sample_rate = sample_rate
+
+        random.seed(7)
+        latencies = run(client, jwt_for, users, groups, args.requests)
+
+        print(f"{label:>20}: p50={percentile(latencies, 50):.3f}ms p99={percentile(latencies, 99):.3f}ms "
+              f"mean={sum(latencies) / len(latencies):.3f}ms", file=stdout)
+
+    logger_module.setup_logger(queued=False)
+
+if __name__ == "__main__":
+    main()
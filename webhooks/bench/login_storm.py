@@ -0,0 +1,170 @@
+"""
+Mede a latência do /auth/me do backend durante uma rajada de logins, com o
+Argon2 feito na thread da requisição (workers sync, PASSWORD_POOL_SIZE=0) e
+com o pool limitado de backend/src/passwords.py (workers gthread).
+
+Uso (a partir de webhooks/):
+    python bench/login_storm.py [--workers 2] [--threads 8] [--storm 16] [--duration 10]
+
+Cada cenário sobe um gunicorn com src.wsgi:app e um banco SQLite temporário,
+cria um usuário e então dispara --storm clientes fazendo login sem parar,
+enquanto um cliente separado chama /auth/me em sequência. Logins recusados
+pelo pool (503 + Retry-After) são contados, não repetidos.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.abspath(os.path.join(HERE, "..", "..", "backend"))
+
+PASSWORD = "bench-password"
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+class Backend:
+    """gunicorn do backend numa porta livre, derrubado no final."""
+
+    def __init__(self, workers, threads, env):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/api/v1"
+
+        self.workdir = tempfile.mkdtemp(prefix="login_storm_")
+        env = dict(
+            os.environ,
+            PYTHONPATH=BACKEND,
+            DATABASE_URL=f"sqlite:///{os.path.join(self.workdir, 'storm.db')}",
+            SECRET_KEY=os.getenv("SECRET_KEY", "bench-secret-key-with-enough-length!"),
+            LOG_LEVEL="ERROR",
+            # Só o pool em teste: sem limites de taxa nem corte de carga (src/ratelimit.py)
+            RATELIMIT_ENABLED="false",
+            MAX_IN_FLIGHT="0",
+            **env,
+        )
+        args = ["--workers", str(workers)] + (["--threads", str(threads)] if threads > 1 else [])
+
+        # Cria as tabelas antes, para os workers não disputarem o create_all do SQLite
+        subprocess.run([sys.executable, "-c", "import src.wsgi"], cwd=self.workdir, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        self.log = open(os.path.join(self.workdir, "gunicorn.log"), "w")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", *args, "src.wsgi:app"],
+            cwd=self.workdir, env=env, stdout=self.log, stderr=subprocess.STDOUT
+        )
+
+        deadline = time.monotonic() + 30
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited, see {self.log.name}")
+            try:
+                if requests.get(self.base_url + "/ping", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if time.monotonic() > deadline:
+                self.close()
+                raise RuntimeError(f"gunicorn did not answer in 30s, see {self.log.name}")
+            time.sleep(0.2)
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+def probe_me(base_url, token, stop, samples):
+    """Chama /auth/me em sequência até stop; guarda a latência em ms de cada resposta 200"""
+    session = requests.Session()
+    headers = {"Authorization": f"Bearer {token}"}
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            ok = session.get(base_url + "/auth/me", headers=headers, timeout=60).status_code == 200
+        except requests.RequestException:
+            ok = False
+        if ok:
+            samples.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.02)
+
+def storm(base_url, username, stop, statuses):
+    session = requests.Session()
+    while not stop.is_set():
+        try:
+            status = session.post(base_url + "/auth/login", json={"username": username, "password": PASSWORD}, timeout=60).status_code
+        except requests.RequestException:
+            status = None
+        statuses.append(status)
+
+def run_scenario(name, workers, threads, env, storm_clients, duration):
+    backend = Backend(workers, threads, env)
+    try:
+        created = requests.post(backend.base_url + "/user/", data={
+            "username": "storm", "name": "Storm", "email": "storm@bench.local", "password": PASSWORD
+        }, timeout=60).json()
+        token = created["access_token"]
+
+        idle = []
+        stop = threading.Event()
+        prober = threading.Thread(target=probe_me, args=(backend.base_url, token, stop, idle))
+        prober.start()
+        time.sleep(min(3, duration))
+        stop.set()
+        prober.join()
+
+        busy, statuses = [], []
+        stop = threading.Event()
+        threads_ = [threading.Thread(target=storm, args=(backend.base_url, "storm", stop, statuses)) for _ in range(storm_clients)]
+        threads_.append(threading.Thread(target=probe_me, args=(backend.base_url, token, stop, busy)))
+        for thread in threads_:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads_:
+            thread.join()
+    finally:
+        backend.close()
+
+    print(f"== {name}")
+    for label, samples in (("/auth/me idle", idle), ("/auth/me storm", busy)):
+        if samples:
+            print(f"  {label:<15} n={len(samples):<5} p50={percentile(samples, 50):8.1f} ms  "
+                  f"p95={percentile(samples, 95):8.1f} ms  p99={percentile(samples, 99):8.1f} ms  max={max(samples):8.1f} ms")
+        else:
+            print(f"  {label:<15} no successful calls")
+    ok = statuses.count(200)
+    print(f"  logins          ok={ok} ({ok / duration:.1f}/s)  503={statuses.count(503)}  "
+          f"other={len(statuses) - ok - statuses.count(503)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8, help="threads por worker no cenário com pool")
+    parser.add_argument("--pool-size", type=int, default=1, help="PASSWORD_POOL_SIZE no cenário com pool")
+    parser.add_argument("--queue-limit", type=int, default=4, help="PASSWORD_QUEUE_LIMIT no cenário com pool")
+    parser.add_argument("--storm", type=int, default=16, help="clientes fazendo login ao mesmo tempo")
+    parser.add_argument("--duration", type=float, default=10, help="segundos de rajada por cenário")
+    args = parser.parse_args()
+
+    run_scenario("inline (sync workers, no pool)", args.workers, 1, {"PASSWORD_POOL_SIZE": "0"},
+                 args.storm, args.duration)
+    run_scenario(f"pool (gthread x{args.threads}, pool {args.pool_size} + queue {args.queue_limit})", args.workers, args.threads,
+                 {"PASSWORD_POOL_SIZE": str(args.pool_size), "PASSWORD_QUEUE_LIMIT": str(args.queue_limit)},
+                 args.storm, args.duration)
+
+if __name__ == "__main__":
+    main()
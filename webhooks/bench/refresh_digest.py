@@ -0,0 +1,57 @@
+"""
+Compara o custo de uma rotação de refresh token (backend/src/validate.py):
+verificar o segredo apresentado e gerar o do próximo token, com o hash Argon2
+antigo e com o digest HMAC-SHA256 atual.
+
+Uso (a partir de webhooks/):
+    python bench/refresh_digest.py [--repeat 20]
+
+Mostra a mediana por rotação e quantas rotações por segundo um processo
+aguenta só com esse trabalho (sem banco nem HTTP).
+"""
+import argparse
+import os
+import secrets
+import statistics
+import sys
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "..", "backend"))
+
+os.environ.setdefault("SECRET_KEY", "bench-secret-key-with-enough-length!")
+
+from src.validate import hasher, refresh_token_digest, verify_refresh_secret
+
+def per_call_ms(function, repeat):
+    runs = timeit.repeat(function, number=repeat, repeat=5)
+    return statistics.median(runs) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    secret = secrets.token_urlsafe(64)
+    argon2_hash = hasher.hash(secret)
+    digest = refresh_token_digest(secret)
+
+    def argon2_rotation():
+        hasher.verify(argon2_hash, secret)
+        hasher.hash(secrets.token_urlsafe(64))
+
+    def hmac_rotation():
+        verify_refresh_secret(digest, secret)
+        refresh_token_digest(secrets.token_urlsafe(64))
+
+    argon2_ms = per_call_ms(argon2_rotation, args.repeat)
+    # HMAC é rápido demais para poucas repetições
+    hmac_ms = per_call_ms(hmac_rotation, args.repeat * 1000)
+
+    print(f"{'scheme':<8} {'ms/rotation':>12} {'rotations/s':>12}")
+    print(f"{'argon2':<8} {argon2_ms:>12.3f} {1000 / argon2_ms:>12.0f}")
+    print(f"{'hmac':<8} {hmac_ms:>12.4f} {1000 / hmac_ms:>12.0f}")
+    print(f"speedup: {argon2_ms / hmac_ms:.0f}x")
+
+if __name__ == "__main__":
+    main()
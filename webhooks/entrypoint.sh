@@ -0,0 +1,12 @@
+#!/bin/sh
+
+WORKERS=${WEBHOOKS_WORKERS:-2}
+
+# WEBHOOKS_SERVER=asgi usa o servidor assíncrono (src/asgi.py) com pool de conexões assíncrono
+if [ "$WEBHOOKS_SERVER" = "asgi" ]; then
+    echo "Iniciando servidor de webhooks (ASGI)..."
+    exec uvicorn asgi:app --app-dir src --host 0.0.0.0 --port 5001 --workers "$WORKERS"
+fi
+
+echo "Iniciando servidor de webhooks (WSGI)..."
+exec gunicorn --bind 0.0.0.0:5001 src.wsgi:app --workers "$WORKERS"
@@ -3,6 +3,9 @@ from flask import Flask
 from dotenv import load_dotenv
 from shared.schema import db
 from webhooks import webhooks_bp
+from webhooks.acl_cache import acl_cache
+from webhooks.acl_graph import acl_graph
+from webhooks.acl_listener import start_invalidation_listener
 from logger import logger
 
 def init_app():
@@ -20,6 +23,9 @@ def init_app():
     # Registrar blueprints
     app.register_blueprint(webhooks_bp)
 
+    # Invalidação do cache de ACL (e carga do acl_graph) pelo backend
+    start_invalidation_listener(app, acl_cache, acl_graph)
+
     return app
 
 if __name__ == "__main__":
@@ -0,0 +1,107 @@
+"""
+Modo de execução ASGI do servidor de webhooks.
+
+Atende os mesmos endpoints e o mesmo contrato JSON de webhooks/routes.py,
+mas as consultas ao banco são não-bloqueantes e usam um pool assíncrono,
+então um único processo mantém milhares de checagens de ACL em andamento.
+
+Uso:
+    uvicorn asgi:app --host 0.0.0.0 --port 5001 --workers 2
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from webhooks.acl_async import create_async_session_factory, authorize_topic_access_batch_async
+from webhooks.acl_cache import acl_cache
+from webhooks.acl_graph import acl_graph
+from webhooks.acl_listener import listen_async
+from webhooks.handlers import (
+    WebhookRequestError, handle_connect, parse_acl_auth, acl_auth_response,
+    parse_acl_auth_batch, acl_auth_batch_response, internal_error, stats_response
+)
+from logger import logger
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+async def read_json(request: Request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+async def connect(request: Request):
+    """Webhook para autenticação de conexão MQTT (mesmo contrato de routes.connect)."""
+    try:
+        response, status = handle_connect(await read_json(request))
+    except Exception as e:
+        response, status = internal_error("connect", e)
+    return JSONResponse(response, status)
+
+async def acl_auth(request: Request):
+    """Webhook para autorização ACL (mesmo contrato de routes.acl_auth)."""
+    try:
+        user_uuid, pairs = parse_acl_auth(await read_json(request))
+        decisions = await authorize_topic_access_batch_async(request.app.state.sessions, user_uuid, pairs)
+        response, status = acl_auth_response(decisions)
+    except WebhookRequestError as e:
+        response, status = e.body, e.status
+    except Exception as e:
+        response, status = internal_error("ACL", e)
+    return JSONResponse(response, status)
+
+async def acl_auth_batch(request: Request):
+    """Autorização ACL em lote (mesmo contrato de routes.acl_auth_batch)."""
+    try:
+        user_uuid, pairs = parse_acl_auth_batch(await read_json(request))
+        decisions = await authorize_topic_access_batch_async(request.app.state.sessions, user_uuid, pairs)
+        response, status = acl_auth_batch_response(pairs, decisions)
+    except WebhookRequestError as e:
+        response, status = e.body, e.status
+    except Exception as e:
+        response, status = internal_error("ACL batch", e)
+    return JSONResponse(response, status)
+
+async def ping(request: Request):
+    """Endpoint de health check"""
+    return JSONResponse({"message": "Webhooks server is active"}, 200)
+
+async def stats(request: Request):
+    """Contadores dos caches de decisões ACL, de JWTs verificados, do acl_graph e dos logs deste worker"""
+    response, status = stats_response()
+    return JSONResponse(response, status)
+
+@asynccontextmanager
+async def lifespan(app):
+    logger.info("Initializing Webhooks Server via ASGI...")
+    engine, app.state.sessions = create_async_session_factory(DATABASE_URL)
+
+    listener = None
+    if (acl_cache.enabled or acl_graph.enabled) and engine.dialect.name == "postgresql":
+        listener = asyncio.create_task(listen_async(DATABASE_URL, acl_cache, acl_graph, app.state.sessions))
+    elif acl_cache.enabled or acl_graph.enabled:
+        logger.warning(f"ACL invalidation listener disabled for '{engine.dialect.name}' database, relying on cache TTL")
+
+    logger.info("Webhooks Server initialized!")
+    yield
+
+    if listener is not None:
+        listener.cancel()
+    await engine.dispose()
+
+app = Starlette(
+    routes=[
+        Route("/webhooks/v1/connect", connect, methods=["POST"]),
+        Route("/webhooks/v1/acl_auth", acl_auth, methods=["POST"]),
+        Route("/webhooks/v1/acl_auth/batch", acl_auth_batch, methods=["POST"]),
+        Route("/webhooks/v1/ping", ping, methods=["GET"]),
+        Route("/webhooks/v1/stats", stats, methods=["GET"]),
+    ],
+    lifespan=lifespan
+)
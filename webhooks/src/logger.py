@@ -1,26 +1,13 @@
-import logging
-from logging.handlers import RotatingFileHandler
-import os
+import sys
 
-def setup_logger():
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
+# Mesma implementação do backend, montado em /backend/src no Docker (como shared/validate.py)
+sys.path.append('/backend/src')
+from logpipeline import LogPipeline
 
-    logger = logging.getLogger('ConchatWebhooks')
-    logger.setLevel(logging.INFO)
+log_pipeline = LogPipeline('ConchatWebhooks', 'logs/webhooks.log')
 
-    formatter = logging.Formatter('[{asctime}] [{levelname}]: {message}', style='{')
+logger = log_pipeline.logger
+setup_logger = log_pipeline.setup
 
-    # Máximo de 5 MB, 5 backups
-    file_handler = RotatingFileHandler('logs/webhooks.log', maxBytes=5*1024*1024, backupCount=5, encoding='utf-8')
-    file_handler.setFormatter(formatter)
-
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-
-    return logger
-
-logger = setup_logger()
+# Ex.: cada checagem de ACL
+log_decision = log_pipeline.log_decision
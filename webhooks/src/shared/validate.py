@@ -1,23 +1,33 @@
 import jwt
 import os
+import sys
 from dotenv import load_dotenv
 from datetime import datetime, timezone
 
+# Mesmo cache de tokens verificados usado pelo backend
+sys.path.append('/backend/src')
+from tokencache import token_cache
+
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 
-def decode_jwt(token):
-    """
-    Decodifica e valida um token JWT.
-    Retorna o payload se válido, None caso contrário.
-    """
+def _verify_jwt(token):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
         return payload
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         return None
 
+def decode_jwt(token):
+    """
+    Decodifica e valida um token JWT.
+    Retorna o payload se válido, None caso contrário.
+    A verificação da assinatura só acontece na primeira vez; depois o payload
+    vem do cache até o 'exp' do token.
+    """
+    return token_cache.decode(token, _verify_jwt)
+
 def validate_jwt(token):
     """
     Valida se um token JWT é válido e não expirado.
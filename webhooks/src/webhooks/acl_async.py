@@ -0,0 +1,135 @@
+"""
+Versão assíncrona das consultas de ACL, usada pelo servidor ASGI (asgi.py).
+Reaproveita as queries e as regras de acl_logic.py; apenas a execução no
+banco passa a ser não-bloqueante, através de um pool de conexões assíncrono.
+"""
+import os
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from logger import logger
+from .acl_cache import acl_cache
+from .acl_graph import acl_graph, GraphBuilder
+from .acl_logic import (
+    group_memberships_query, friendships_query, read_friendships,
+    user_groups_query, user_friends_query,
+    plan_topic_checks, decide_planned_checks,
+    approved_memberships_query, approved_friendships_query
+)
+
+GRAPH_LOAD_BATCH = 10000
+
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", "20"))
+ASYNC_DB_MAX_OVERFLOW = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "20"))
+ASYNC_DB_POOL_TIMEOUT = float(os.getenv("ASYNC_DB_POOL_TIMEOUT", "10"))
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def async_database_url(url):
+    """Troca o driver síncrono da DATABASE_URL pelo equivalente assíncrono."""
+    scheme, rest = url.split("://", 1)
+    dialect = scheme.split("+", 1)[0]
+    return f"{ASYNC_DRIVERS.get(dialect, scheme)}://{rest}"
+
+def create_async_session_factory(database_url):
+    url = async_database_url(database_url)
+
+    options = {"pool_pre_ping": True}
+    if url.startswith("postgresql"):
+        options.update(
+            pool_size=ASYNC_DB_POOL_SIZE,
+            max_overflow=ASYNC_DB_MAX_OVERFLOW,
+            pool_timeout=ASYNC_DB_POOL_TIMEOUT
+        )
+
+    engine = create_async_engine(url, **options)
+    return engine, async_sessionmaker(engine, expire_on_commit=False)
+
+async def load_graph_async(session_factory, graph):
+    """Carga completa do acl_graph, lendo as tabelas em lotes."""
+    builder = GraphBuilder()
+
+    async with session_factory() as session:
+        result = await session.stream(approved_memberships_query().execution_options(yield_per=GRAPH_LOAD_BATCH))
+        async for user_id, group_id in result:
+            builder.add_membership(user_id, group_id)
+
+        result = await session.stream(approved_friendships_query().execution_options(yield_per=GRAPH_LOAD_BATCH))
+        async for low_id, high_id in result:
+            builder.add_friendship(low_id, high_id)
+
+    graph.install(builder)
+
+async def refresh_graph_user_async(session, user_uuid):
+    """Equivalente não-bloqueante de acl_logic.refresh_graph_user."""
+    groups_dirty, friends_dirty = acl_graph.needs_refresh(user_uuid)
+    version = acl_graph.version
+
+    if groups_dirty:
+        groups = [str(g) for g in (await session.execute(user_groups_query(user_uuid))).scalars()]
+        acl_graph.set_user_groups(user_uuid, groups, version)
+
+    if friends_dirty:
+        friends = read_friendships(user_uuid, await session.execute(user_friends_query(user_uuid)))
+        acl_graph.set_user_friends(user_uuid, friends, version)
+
+async def fetch_group_memberships_async(session, user_uuid, group_uuids):
+    if not group_uuids:
+        return set()
+
+    if acl_graph.ready:
+        await refresh_graph_user_async(session, user_uuid)
+        return acl_graph.member_groups(user_uuid, group_uuids)
+
+    result = await session.execute(group_memberships_query(user_uuid, group_uuids))
+    return {str(group_id) for group_id in result.scalars()}
+
+async def fetch_friendships_async(session, user_uuid, friend_uuids):
+    if not friend_uuids:
+        return set()
+
+    if acl_graph.ready:
+        await refresh_graph_user_async(session, user_uuid)
+        return acl_graph.approved_friends(user_uuid, friend_uuids)
+
+    result = await session.execute(friendships_query(user_uuid, friend_uuids))
+    return read_friendships(user_uuid, result)
+
+async def authorize_topic_access_batch_async(session_factory, user_uuid, checks):
+    """
+    Equivalente não-bloqueante de acl_logic.authorize_topic_access_batch.
+    Só abre uma sessão (e pega uma conexão do pool) se algo faltar no cache.
+    """
+    results = [acl_cache.get(user_uuid, topic, action) for topic, action in checks]
+    missing = [i for i, decision in enumerate(results) if decision is None]
+
+    if not missing:
+        return results
+
+    # Antes da leitura: uma invalidação que chegar durante a avaliação descarta a gravação no cache
+    generation = acl_cache.generation()
+    try:
+        parsed, group_uuids, friend_uuids = plan_topic_checks([checks[i] for i in missing])
+
+        groups, friends = set(), set()
+        if group_uuids or friend_uuids:
+            async with session_factory() as session:
+                groups = await fetch_group_memberships_async(session, user_uuid, group_uuids)
+                friends = await fetch_friendships_async(session, user_uuid, friend_uuids)
+
+        decisions = decide_planned_checks(user_uuid, parsed, groups, friends)
+    except (ValueError, Exception) as e:
+        # Erros de banco não entram no cache
+        logger.error(f"Error evaluating ACL for user {user_uuid}: {e}")
+        for i in missing:
+            results[i] = (False, "Could not evaluate access")
+        return results
+
+    for i, decision in zip(missing, decisions):
+        topic, action = checks[i]
+        acl_cache.set(user_uuid, topic, action, decision, generation)
+        results[i] = decision
+
+    return results
@@ -0,0 +1,194 @@
+"""
+Cache em memória das decisões de ACL (usuário, tópico, ação) -> decisão.
+
+Cada worker do gunicorn mantém sua própria instância. As entradas expiram
+por TTL e são invalidadas imediatamente quando o backend notifica mudanças
+de membros de grupo ou de amizades (ver acl_listener.py).
+
+Uma decisão calculada enquanto chega uma invalidação não pode entrar no
+cache: quem vai ao banco pega generation() antes e passa para set(), que
+descarta a gravação se o usuário (ou o cache inteiro) foi invalidado depois.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from .topic_rules import base_topic
+
+ACL_CACHE_ENABLED = os.getenv("ACL_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ACL_CACHE_TTL = float(os.getenv("ACL_CACHE_TTL", "60"))
+ACL_CACHE_SIZE = int(os.getenv("ACL_CACHE_SIZE", "100000"))
+# Usuários com a geração da última invalidação guardada; os mais antigos viram o piso global
+ACL_CACHE_GENERATIONS = int(os.getenv("ACL_CACHE_GENERATIONS", "10000"))
+
+class ACLDecisionCache:
+    """
+    LRU limitado com TTL, indexado por usuário e por tópico para permitir
+    invalidação seletiva. O índice por tópico usa o tópico base, então invalidar
+    /groups/{id} também tira as cópias em formato compacto (/groups/{id}/msgpack).
+    """
+
+    def __init__(self, max_size=ACL_CACHE_SIZE, ttl=ACL_CACHE_TTL, enabled=ACL_CACHE_ENABLED,
+                 max_generations=ACL_CACHE_GENERATIONS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = enabled
+        self.max_generations = max_generations
+
+        self._entries = OrderedDict()  # key -> (expires_at, decision)
+        self._by_user = {}
+        self._by_topic = {}
+        self._lock = threading.Lock()
+
+        # Incrementada a cada invalidação. _user_generations guarda a da última invalidação de cada
+        # usuário; _floor, a da última que atingiu todos (por tópico, clear ou usuário esquecido)
+        self._generation = 0
+        self._user_generations = OrderedDict()
+        self._floor = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_writes = 0
+
+    @staticmethod
+    def _key(user_uuid, topic, action):
+        return (user_uuid.lower(), topic.lower(), action)
+
+    def get(self, user_uuid, topic, action):
+        """Retorna a decisão (allowed, message) em cache ou None."""
+        if not self.enabled:
+            return None
+
+        key = self._key(user_uuid, topic, action)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, decision = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return decision
+
+    def generation(self):
+        """Valor a passar para set() por quem vai calcular uma decisão agora."""
+        with self._lock:
+            return self._generation
+
+    def set(self, user_uuid, topic, action, decision, generation=None):
+        """
+        Grava uma decisão. Com generation (o valor de generation() antes da
+        avaliação), a gravação é descartada se alguma invalidação que atinge
+        o usuário chegou depois.
+        """
+        if not self.enabled:
+            return
+
+        key = self._key(user_uuid, topic, action)
+        with self._lock:
+            if generation is not None and self._is_stale(key[0], generation):
+                self.stale_writes += 1
+                return
+
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                self._by_user.setdefault(key[0], set()).add(key)
+                self._by_topic.setdefault(base_topic(key[1]), set()).add(key)
+
+            self._entries[key] = (time.monotonic() + self.ttl, decision)
+
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, user_uuid=None, topic=None):
+        """
+        Remove decisões em cache.
+
+        - user_uuid e topic: apenas as entradas daquele usuário no tópico
+        - só topic: todas as entradas do tópico (ex: grupo removido)
+        - só user_uuid: todas as entradas do usuário (ex: usuário removido)
+        """
+        with self._lock:
+            if user_uuid is not None and topic is not None:
+                keys = self._by_user.get(user_uuid.lower(), set()) & self._by_topic.get(topic.lower(), set())
+            elif topic is not None:
+                keys = set(self._by_topic.get(topic.lower(), ()))
+            elif user_uuid is not None:
+                keys = set(self._by_user.get(user_uuid.lower(), ()))
+            else:
+                return 0
+
+            self._generation += 1
+            if user_uuid is not None:
+                self._bump_user(user_uuid.lower())
+            else:
+                self._floor = self._generation
+
+            for key in keys:
+                self._remove(key)
+
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+            self._by_topic.clear()
+            self._generation += 1
+            self._floor = self._generation
+            self._user_generations.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_writes": self.stale_writes,
+            }
+
+    def _is_stale(self, user, generation):
+        # Chamado com o lock adquirido
+        return generation < self._floor or generation < self._user_generations.get(user, 0)
+
+    def _bump_user(self, user):
+        # Chamado com o lock adquirido
+        self._user_generations[user] = self._generation
+        self._user_generations.move_to_end(user)
+
+        # Esquecer um usuário é seguro: o piso sobe até a geração dele e descarta as gravações de todos
+        while len(self._user_generations) > self.max_generations:
+            _, oldest = self._user_generations.popitem(last=False)
+            self._floor = max(self._floor, oldest)
+
+    def _remove(self, key):
+        # Chamado com o lock adquirido
+        self._entries.pop(key, None)
+
+        for index, part in ((self._by_user, key[0]), (self._by_topic, base_topic(key[1]))):
+            keys = index.get(part)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[part]
+
+acl_cache = ACLDecisionCache()
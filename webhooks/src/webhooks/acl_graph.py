@@ -0,0 +1,324 @@
+"""
+Índice em memória do grafo de autorização: "U é membro de G?" e
+"U e V são amigos aprovados?" sem ir ao banco.
+
+UUIDs são internados como inteiros. As adjacências ficam em formato CSR
+(um array de offsets por usuário e um array único de vizinhos ordenados),
+carregado de user_groups e friendships na inicialização. Usuários alterados
+depois da carga recebem listas próprias (overrides) e as notificações do
+backend apenas os marcam como sujos; a releitura acontece na próxima consulta.
+"""
+import os
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+
+ACL_GRAPH_ENABLED = os.getenv("ACL_GRAPH_ENABLED", "false").lower() in ("1", "true", "yes")
+
+def _contains(values, item, lo=0, hi=None):
+    if hi is None:
+        hi = len(values)
+    i = bisect_left(values, item, lo, hi)
+    return i < hi and values[i] == item
+
+class _Interner:
+    """Mapeia UUIDs (strings minúsculas) para inteiros sequenciais."""
+
+    def __init__(self):
+        self.ids = {}
+        self.uuids = []
+
+    def intern(self, uuid):
+        uuid = str(uuid).lower()
+        index = self.ids.get(uuid)
+        if index is None:
+            index = len(self.uuids)
+            self.ids[uuid] = index
+            self.uuids.append(uuid)
+        return index
+
+    def get(self, uuid):
+        return self.ids.get(str(uuid).lower())
+
+    def memory_usage(self):
+        return (sys.getsizeof(self.ids) + sys.getsizeof(self.uuids)
+                + sum(sys.getsizeof(u) for u in self.uuids))
+
+class _Adjacency:
+    """Listas de adjacência ordenadas: base CSR + overrides por usuário."""
+
+    def __init__(self):
+        self.offsets = array('Q', [0])
+        self.values = array('I')
+        self.overrides = {}
+
+    @classmethod
+    def build(cls, sources, targets, n_sources):
+        """Monta o CSR a partir de pares (sources[i], targets[i]) com counting sort."""
+        adjacency = cls()
+
+        counts = array('Q', bytes(8 * (n_sources + 1)))
+        for s in sources:
+            counts[s + 1] += 1
+        for i in range(n_sources):
+            counts[i + 1] += counts[i]
+
+        values = array('I', bytes(4 * len(sources)))
+        cursor = array('Q', counts)
+        for s, t in zip(sources, targets):
+            values[cursor[s]] = t
+            cursor[s] += 1
+
+        for i in range(n_sources):
+            lo, hi = counts[i], counts[i + 1]
+            if hi - lo > 1:
+                values[lo:hi] = array('I', sorted(values[lo:hi]))
+
+        adjacency.offsets = counts
+        adjacency.values = values
+        return adjacency
+
+    def neighbours(self, source):
+        """Retorna (values, lo, hi) com os vizinhos ordenados de source."""
+        override = self.overrides.get(source)
+        if override is not None:
+            return override, 0, len(override)
+        if source + 1 < len(self.offsets):
+            return self.values, self.offsets[source], self.offsets[source + 1]
+        return self.values, 0, 0
+
+    def contains(self, source, target):
+        values, lo, hi = self.neighbours(source)
+        return _contains(values, target, lo, hi)
+
+    def set(self, source, targets):
+        self.overrides[source] = array('I', sorted(set(targets)))
+
+    def memory_usage(self):
+        return (sys.getsizeof(self.offsets) + sys.getsizeof(self.values) + sys.getsizeof(self.overrides)
+                + sum(sys.getsizeof(v) for v in self.overrides.values()))
+
+class GraphBuilder:
+    """Acumula as arestas de uma carga completa antes de montar o CSR."""
+
+    def __init__(self):
+        self.users = _Interner()
+        self.groups = _Interner()
+        self._member_users, self._member_groups = array('I'), array('I')
+        self._friend_a, self._friend_b = array('I'), array('I')
+
+    def add_membership(self, user_uuid, group_uuid):
+        self._member_users.append(self.users.intern(user_uuid))
+        self._member_groups.append(self.groups.intern(group_uuid))
+
+    def add_friendship(self, user1_uuid, user2_uuid):
+        # Cada amizade entra nos dois sentidos
+        a, b = self.users.intern(user1_uuid), self.users.intern(user2_uuid)
+        self._friend_a.append(a)
+        self._friend_b.append(b)
+        self._friend_a.append(b)
+        self._friend_b.append(a)
+
+    def build(self):
+        n_users = len(self.users.uuids)
+        return (_Adjacency.build(self._member_users, self._member_groups, n_users),
+                _Adjacency.build(self._friend_a, self._friend_b, n_users))
+
+class AuthorizationGraph:
+    def __init__(self, enabled=ACL_GRAPH_ENABLED):
+        self.enabled = enabled
+        self.ready = False
+
+        self._users = _Interner()
+        self._groups = _Interner()
+        self._memberships = _Adjacency()
+        self._friendships = _Adjacency()
+        self._deleted_groups = set()
+        self._dirty_groups = set()
+        self._dirty_friends = set()
+        self._lock = threading.Lock()
+
+        # Notificações recebidas durante uma carga, reaplicadas por install(); None fora de uma carga
+        self._pending = None
+
+        # Incrementada a cada notificação; releituras iniciadas antes dela não limpam o estado sujo
+        self.version = 0
+
+    # Carga ---------------------------------------------------------------------------------------------------------
+
+    def load(self, memberships, friendships):
+        """
+        (Re)constrói o índice inteiro.
+
+        Args:
+            memberships: iterável de (user_uuid, group_uuid) com convite aprovado
+            friendships: iterável de (user_uuid, user_uuid) com amizade aprovada
+        """
+        builder = GraphBuilder()
+        for user_uuid, group_uuid in memberships:
+            builder.add_membership(user_uuid, group_uuid)
+        for user1, user2 in friendships:
+            builder.add_friendship(user1, user2)
+        self.install(builder)
+
+    def reset(self):
+        """
+        Descarta o índice (ex.: notificações perdidas) até a próxima carga. A
+        partir daqui as notificações ficam guardadas e install() as reaplica:
+        a carga pode ter lido as linhas antes da mudança que elas anunciam.
+        """
+        with self._lock:
+            self.ready = False
+            self._pending = []
+
+    def install(self, builder):
+        """Troca o índice atual pelo construído em builder."""
+        memberships_csr, friendships_csr = builder.build()
+
+        with self._lock:
+            self._users, self._groups = builder.users, builder.groups
+            self._memberships, self._friendships = memberships_csr, friendships_csr
+            self._deleted_groups = set()
+            self._dirty_groups = set()
+            self._dirty_friends = set()
+
+            pending, self._pending = self._pending or [], None
+            for user_uuid, topic in pending:
+                self._apply(user_uuid, topic)
+
+            self.version += 1
+            self.ready = True
+
+    # Atualização incremental ---------------------------------------------------------------------------------------
+
+    def invalidate(self, user_uuid=None, topic=None):
+        """
+        Aplica uma notificação do backend (mesmo payload do cache de decisões).
+        Só marca usuários como sujos; os dados são relidos na próxima consulta.
+        """
+        with self._lock:
+            if self.ready:
+                self._apply(user_uuid, topic)
+            elif self._pending is not None:
+                self._pending.append((user_uuid, topic))
+
+    def _apply(self, user_uuid, topic):
+        # Chamado com o lock adquirido
+        kind, target = _split_topic(topic)
+
+        self.version += 1
+        user = self._users.intern(user_uuid) if user_uuid else None
+
+        if user is not None and kind == "groups":
+            self._dirty_groups.add(user)
+        elif user is not None and kind == "dms":
+            self._dirty_friends.add(user)
+        elif user is not None:
+            self._dirty_groups.add(user)
+            self._dirty_friends.add(user)
+        elif kind == "groups":
+            group = self._groups.get(target)
+            if group is not None:
+                self._deleted_groups.add(group)
+        elif kind == "dms":
+            # Usuário removido: ele e todos os seus amigos precisam ser relidos
+            other = self._users.intern(target)
+            values, lo, hi = self._friendships.neighbours(other)
+            self._dirty_friends.add(other)
+            self._dirty_friends.update(values[lo:hi])
+
+    def needs_refresh(self, user_uuid):
+        """Retorna (grupos_sujos, amigos_sujos) para o usuário."""
+        user = self._users.get(user_uuid)
+        if user is None:
+            return False, False
+        return user in self._dirty_groups, user in self._dirty_friends
+
+    def set_user_groups(self, user_uuid, group_uuids, version):
+        """Grava os grupos relidos do banco; version é o valor de self.version antes da leitura."""
+        with self._lock:
+            user = self._users.intern(user_uuid)
+            self._memberships.set(user, (self._groups.intern(g) for g in group_uuids))
+            if version == self.version:
+                self._dirty_groups.discard(user)
+
+    def set_user_friends(self, user_uuid, friend_uuids, version):
+        """Grava os amigos relidos do banco; version é o valor de self.version antes da leitura."""
+        with self._lock:
+            user = self._users.intern(user_uuid)
+            self._friendships.set(user, (self._users.intern(f) for f in friend_uuids))
+            if version == self.version:
+                self._dirty_friends.discard(user)
+
+    # Consultas -----------------------------------------------------------------------------------------------------
+
+    def member_groups(self, user_uuid, group_uuids):
+        """Dentre group_uuids, retorna o set dos grupos dos quais o usuário é membro."""
+        user = self._users.get(user_uuid)
+        if user is None:
+            return set()
+
+        result = set()
+        for group_uuid in group_uuids:
+            group = self._groups.get(group_uuid)
+            if group is not None and group not in self._deleted_groups and self._memberships.contains(user, group):
+                result.add(str(group_uuid).lower())
+        return result
+
+    def approved_friends(self, user_uuid, friend_uuids):
+        """Dentre friend_uuids, retorna o set dos amigos aprovados do usuário."""
+        user = self._users.get(user_uuid)
+        if user is None:
+            return set()
+
+        result = set()
+        for friend_uuid in friend_uuids:
+            friend = self._users.get(friend_uuid)
+            if friend is not None and self._friendships.contains(user, friend):
+                result.add(str(friend_uuid).lower())
+        return result
+
+    def all_groups(self, user_uuid):
+        user = self._users.get(user_uuid)
+        if user is None:
+            return []
+        values, lo, hi = self._memberships.neighbours(user)
+        return [self._groups.uuids[g] for g in values[lo:hi] if g not in self._deleted_groups]
+
+    def all_friends(self, user_uuid):
+        user = self._users.get(user_uuid)
+        if user is None:
+            return []
+        values, lo, hi = self._friendships.neighbours(user)
+        return [self._users.uuids[f] for f in values[lo:hi]]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "ready": self.ready,
+                "users": len(self._users.uuids),
+                "groups": len(self._groups.uuids),
+                "memberships": len(self._memberships.values),
+                "friendships": len(self._friendships.values) // 2,
+                "overrides": len(self._memberships.overrides) + len(self._friendships.overrides),
+                "dirty_users": len(self._dirty_groups | self._dirty_friends),
+                "memory_bytes": self.memory_usage(),
+            }
+
+    def memory_usage(self):
+        """Estimativa em bytes do índice (arrays, overrides e tabelas de UUIDs)."""
+        return (self._users.memory_usage() + self._groups.memory_usage()
+                + self._memberships.memory_usage() + self._friendships.memory_usage()
+                + sys.getsizeof(self._deleted_groups))
+
+def _split_topic(topic):
+    if not topic:
+        return None, None
+    parts = topic.strip("/").split("/")
+    if len(parts) != 2:
+        return None, None
+    return parts[0], parts[1].lower()
+
+acl_graph = AuthorizationGraph()
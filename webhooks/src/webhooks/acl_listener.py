@@ -0,0 +1,155 @@
+"""
+Recebe as notificações de invalidação de ACL enviadas pelo backend via
+Postgres LISTEN/NOTIFY e as aplica no cache de decisões e no acl_graph.
+
+Payload esperado (JSON): {"user": "<uuid>" | null, "topic": "<tópico>" | null}
+"""
+import json
+import os
+import select
+import threading
+import time
+from shared.schema import db
+from logger import logger
+
+ACL_NOTIFY_CHANNEL = os.getenv("ACL_NOTIFY_CHANNEL", "acl_invalidation")
+RECONNECT_DELAY = 5
+GRAPH_LOAD_BATCH = 10000
+
+def handle_notification(cache, raw_payload, graph=None):
+    try:
+        data = json.loads(raw_payload)
+    except ValueError:
+        logger.warning(f"Malformed ACL invalidation payload: {raw_payload}")
+        return
+
+    removed = cache.invalidate(user_uuid=data.get("user"), topic=data.get("topic"))
+    logger.debug(f"ACL invalidation {data} removed {removed} cached decisions")
+
+    if graph is not None:
+        graph.invalidate(user_uuid=data.get("user"), topic=data.get("topic"))
+
+def _load_graph(app, graph):
+    from .acl_logic import approved_memberships_query, approved_friendships_query
+
+    start = time.perf_counter()
+    with app.app_context():
+        memberships = db.session.execute(approved_memberships_query().execution_options(yield_per=GRAPH_LOAD_BATCH))
+        friendships = db.session.execute(approved_friendships_query().execution_options(yield_per=GRAPH_LOAD_BATCH))
+        graph.load(memberships, friendships)
+
+    stats = graph.stats()
+    logger.info(f"ACL graph loaded in {time.perf_counter() - start:.2f}s: {stats['users']} users, "
+                f"{stats['memberships']} memberships, {stats['friendships']} friendships, {stats['memory_bytes']} bytes")
+
+def _lost_notifications(cache, graph):
+    # Notificações perdidas enquanto estávamos desconectados não voltam
+    cache.clear()
+    if graph is not None:
+        # As notificações que chegarem durante a nova carga ficam guardadas e são reaplicadas no fim
+        graph.reset()
+
+def _listen_loop(app, cache, graph):
+    while True:
+        conn = None
+        try:
+            with app.app_context():
+                conn = db.engine.raw_connection()
+
+            # Conexão dedicada: não volta para o pool com LISTEN ativo
+            conn.detach()
+            pg_conn = conn.driver_connection
+            pg_conn.autocommit = True
+            with pg_conn.cursor() as cursor:
+                cursor.execute(f'LISTEN "{ACL_NOTIFY_CHANNEL}"')
+
+            _lost_notifications(cache, graph)
+            logger.info(f"Listening for ACL invalidations on channel '{ACL_NOTIFY_CHANNEL}'")
+
+            # Carga depois do LISTEN: mudanças feitas durante a carga chegam como notificações
+            if graph is not None:
+                _load_graph(app, graph)
+
+            while True:
+                ready, _, _ = select.select([pg_conn], [], [], RECONNECT_DELAY)
+                if not ready:
+                    continue
+
+                pg_conn.poll()
+                while pg_conn.notifies:
+                    notify = pg_conn.notifies.pop(0)
+                    handle_notification(cache, notify.payload, graph)
+
+        except Exception as e:
+            logger.error(f"ACL invalidation listener error: {e}")
+            _lost_notifications(cache, graph)
+            time.sleep(RECONNECT_DELAY)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+def start_invalidation_listener(app, cache, graph=None):
+    """
+    Inicia a thread de escuta. Só funciona com Postgres; em outros bancos o
+    cache depende apenas do TTL e o acl_graph não é usado.
+    """
+    if graph is not None and not graph.enabled:
+        graph = None
+
+    if not cache.enabled and graph is None:
+        return None
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+
+    if dialect != "postgresql":
+        logger.warning(f"ACL invalidation listener disabled for '{dialect}' database, relying on cache TTL")
+        return None
+
+    thread = threading.Thread(target=_listen_loop, args=(app, cache, graph), name="acl-invalidation-listener", daemon=True)
+    thread.start()
+    return thread
+
+async def listen_async(database_url, cache, graph=None, session_factory=None):
+    """
+    Versão asyncio da escuta, usada pelo servidor ASGI. Usa uma conexão
+    asyncpg dedicada, fora do pool.
+    """
+    import asyncio
+    import asyncpg
+    from .acl_async import load_graph_async
+
+    if graph is not None and not graph.enabled:
+        graph = None
+
+    dsn = "postgresql://" + database_url.split("://", 1)[1]
+
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(dsn)
+            await conn.add_listener(ACL_NOTIFY_CHANNEL, lambda _conn, _pid, _channel, payload: handle_notification(cache, payload, graph))
+
+            _lost_notifications(cache, graph)
+            logger.info(f"Listening for ACL invalidations on channel '{ACL_NOTIFY_CHANNEL}'")
+
+            if graph is not None:
+                await load_graph_async(session_factory, graph)
+                logger.info(f"ACL graph loaded: {graph.stats()}")
+
+            while not conn.is_closed():
+                await asyncio.sleep(RECONNECT_DELAY)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"ACL invalidation listener error: {e}")
+        finally:
+            _lost_notifications(cache, graph)
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+
+        await asyncio.sleep(RECONNECT_DELAY)
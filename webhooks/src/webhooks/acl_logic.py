@@ -3,13 +3,144 @@ Lógica de autorização ACL para tópicos MQTT.
 Implementa as regras de negócio definidas na arquitetura.
 """
 from shared.schema import db, UserGroup, Friendship, FriendshipStatus
-from logger import logger
-import re
+from logger import logger, log_decision
+from .acl_cache import acl_cache
+from .acl_graph import acl_graph
+from .topic_rules import TopicRouter, TopicRule, EVENT_ENCODINGS
+from sqlalchemy import select, or_, and_
+import logging
 from uuid import UUID
 
+def group_memberships_query(user_uuid, group_uuids):
+    """Query com os grupos (dentre group_uuids) em que o usuário tem convite aprovado."""
+    return select(UserGroup.group_id).where(
+        UserGroup.user_id == UUID(user_uuid),
+        UserGroup.group_id.in_([UUID(g) for g in group_uuids]),
+        UserGroup.invite_status == FriendshipStatus.APPROVED
+    )
+
+def friendships_query(user_uuid, friend_uuids):
+    """Query com as amizades aprovadas entre o usuário e friend_uuids (uma busca pela PK por par)."""
+    pairs = [Friendship.pair_key(user_uuid, f) for f in friend_uuids]
+
+    # OR de igualdades em vez de (a, b) IN (...): o SQLite só usa o índice nessa forma
+    return select(Friendship.user_low_id, Friendship.user_high_id).where(
+        or_(*(and_(Friendship.user_low_id == low, Friendship.user_high_id == high) for low, high in pairs)),
+        Friendship.status == FriendshipStatus.APPROVED
+    )
+
+def read_friendships(user_uuid, rows):
+    """Converte linhas (user_low_id, user_high_id) no set de UUIDs dos amigos."""
+    user_id = UUID(user_uuid)
+    return {str(high_id if low_id == user_id else low_id) for low_id, high_id in rows}
+
+def approved_memberships_query():
+    """Query com todos os pares (user_id, group_id) aprovados, para a carga do acl_graph."""
+    return select(UserGroup.user_id, UserGroup.group_id).where(
+        UserGroup.invite_status == FriendshipStatus.APPROVED
+    )
+
+def approved_friendships_query():
+    """Query com todos os pares de amigos aprovados, para a carga do acl_graph."""
+    return select(Friendship.user_low_id, Friendship.user_high_id).where(
+        Friendship.status == FriendshipStatus.APPROVED
+    )
+
+def refresh_graph_user(user_uuid):
+    """Relê do banco as adjacências do usuário marcadas como sujas no acl_graph."""
+    groups_dirty, friends_dirty = acl_graph.needs_refresh(user_uuid)
+    version = acl_graph.version
+
+    if groups_dirty:
+        groups = [str(g) for g in db.session.execute(user_groups_query(user_uuid)).scalars()]
+        acl_graph.set_user_groups(user_uuid, groups, version)
+
+    if friends_dirty:
+        friends = read_friendships(user_uuid, db.session.execute(user_friends_query(user_uuid)))
+        acl_graph.set_user_friends(user_uuid, friends, version)
+
+def fetch_group_memberships(user_uuid, group_uuids):
+    """
+    Busca, em uma única query, de quais grupos o usuário é membro.
+
+    Args:
+        user_uuid: UUID do usuário (string)
+        group_uuids: coleção de UUIDs de grupos (strings)
+
+    Returns:
+        set: UUIDs (strings, minúsculas) dos grupos com convite aprovado
+    """
+    if not group_uuids:
+        return set()
+
+    if acl_graph.ready:
+        refresh_graph_user(user_uuid)
+        return acl_graph.member_groups(user_uuid, group_uuids)
+
+    stmt = group_memberships_query(user_uuid, group_uuids)
+    return {str(group_id) for group_id in db.session.execute(stmt).scalars()}
+
+def fetch_friendships(user_uuid, friend_uuids):
+    """
+    Busca, em uma única query, quais dos usuários são amigos aprovados.
+
+    Args:
+        user_uuid: UUID do usuário (string)
+        friend_uuids: coleção de UUIDs de possíveis amigos (strings)
+
+    Returns:
+        set: UUIDs (strings, minúsculas) dos amigos aprovados
+    """
+    if not friend_uuids:
+        return set()
+
+    if acl_graph.ready:
+        refresh_graph_user(user_uuid)
+        return acl_graph.approved_friends(user_uuid, friend_uuids)
+
+    stmt = friendships_query(user_uuid, friend_uuids)
+    return read_friendships(user_uuid, db.session.execute(stmt))
+
+def user_groups_query(user_uuid):
+    """Query com todos os grupos em que o usuário tem convite aprovado."""
+    return select(UserGroup.group_id).where(
+        UserGroup.user_id == UUID(user_uuid),
+        UserGroup.invite_status == FriendshipStatus.APPROVED
+    )
+
+def user_friends_query(user_uuid):
+    """Query com todas as amizades aprovadas do usuário."""
+    user_id = UUID(user_uuid)
+    return select(Friendship.user_low_id, Friendship.user_high_id).where(
+        Friendship.status == FriendshipStatus.APPROVED,
+        or_(Friendship.user_low_id == user_id, Friendship.user_high_id == user_id)
+    )
+
+def compute_user_permissions(user_uuid):
+    """
+    Regras de ACL do EMQX ({permission, action, topic}) anexadas ao cliente MQTT
+    na conexão.
+
+    Só entram as que não podem ser revogadas: assinar as próprias DMs e o próprio
+    tópico de usuário. As regras anexadas valem até a desconexão e o EMQX as
+    consulta antes das fontes de autorização, então grupos e DMs de amigos ficam
+    com o webhook de ACL, que enxerga remoções de membros e de amizades.
+
+    Args:
+        user_uuid: UUID do usuário (string)
+
+    Returns:
+        list: regras no formato de ACL do EMQX
+    """
+    me = str(UUID(user_uuid))
+    topics = [f"/dms/{me}", f"/users/{me}"]
+    # Também as cópias em formato compacto desses tópicos
+    topics += [f"{topic}/{encoding}" for topic in topics for encoding in EVENT_ENCODINGS]
+    return [{"permission": "allow", "action": "subscribe", "topic": topic} for topic in topics]
+
 def check_group_access(user_uuid, group_uuid):
     """
-    Verifica se o usuário é membro do grupo.
+    Verifica se o usuário é membro (convite aprovado) do grupo.
 
     Args:
         user_uuid: UUID do usuário (string)
@@ -19,15 +150,7 @@ def check_group_access(user_uuid, group_uuid):
         bool: True se o usuário é membro, False caso contrário
     """
     try:
-        user_id = UUID(user_uuid)
-        group_id = UUID(group_uuid)
-
-        membership = db.session.query(UserGroup).filter_by(
-            user_id=user_id,
-            group_id=group_id
-        ).first()
-
-        return membership is not None
+        return group_uuid.lower() in fetch_group_memberships(user_uuid, {group_uuid})
     except (ValueError, Exception) as e:
         logger.error(f"Error checking group access: {e}")
         return False
@@ -44,91 +167,234 @@ def check_friendship(user_uuid, friend_uuid):
         bool: True se são amigos aprovados, False caso contrário
     """
     try:
-        user_id = UUID(user_uuid)
-        friend_id = UUID(friend_uuid)
-
-        friendship = Friendship.get_between(user_id, friend_id)
-
-        if friendship and friendship.status == FriendshipStatus.APPROVED:
-            return True
-        return False
+        return friend_uuid.lower() in fetch_friendships(user_uuid, {friend_uuid})
     except (ValueError, Exception) as e:
         logger.error(f"Error checking friendship: {e}")
         return False
 
-def authorize_topic_access(user_uuid, topic, action):
+# REGRA 1: Tópico de grupo /groups/{group_uuid}
+def group_policy(user_uuid, target_uuid, action, groups, friends):
+    # Tanto PUBLISH quanto SUBSCRIBE requerem ser membro do grupo
+    if target_uuid in groups:
+        log_decision("User %s authorized to %s on group %s", user_uuid, action, target_uuid)
+        return True, f"User is member of group {target_uuid}"
+    else:
+        log_decision("User %s denied %s on group %s - not a member", user_uuid, action, target_uuid, level=logging.WARNING)
+        return False, f"User is not a member of group {target_uuid}"
+
+# REGRA 2: Tópico de DM /dms/{user_uuid}
+def dm_policy(user_uuid, target_uuid, action, groups, friends):
+    if action == 'subscribe':
+        # SUBSCRIBE: apenas o próprio usuário
+        if user_uuid.lower() == target_uuid:
+            log_decision("User %s authorized to subscribe to own DMs", user_uuid)
+            return True, "User can subscribe to own DM topic"
+        else:
+            log_decision("User %s denied subscribe to DM %s", user_uuid, target_uuid, level=logging.WARNING)
+            return False, "Can only subscribe to own DM topic"
+
+    elif action == 'publish':
+        # PUBLISH: apenas amigos aprovados
+        if target_uuid in friends:
+            log_decision("User %s authorized to publish DM to friend %s", user_uuid, target_uuid)
+            return True, f"User is friend with {target_uuid}"
+        else:
+            log_decision("User %s denied publish to DM %s - not friends", user_uuid, target_uuid, level=logging.WARNING)
+            return False, f"User is not friend with {target_uuid}"
+
+    return None
+
+# REGRA 3: Tópico de usuário /users/{user_uuid}
+def user_policy(user_uuid, target_uuid, action, groups, friends):
+    if action == 'subscribe':
+        # SUBSCRIBE: apenas o próprio usuário
+        if user_uuid.lower() == target_uuid:
+            log_decision("User %s authorized to subscribe to own user topic", user_uuid)
+            return True, "User can subscribe to own user topic"
+        else:
+            log_decision("User %s denied subscribe to user topic %s", user_uuid, target_uuid, level=logging.WARNING)
+            return False, "Can only subscribe to own user topic"
+
+    elif action == 'publish':
+        # PUBLISH: apenas o sistema (negar todos)
+        log_decision("User %s denied publish to user topic - system only", user_uuid, level=logging.WARNING)
+        return False, "Only system can publish to user topics"
+
+    return None
+
+# REGRA 4: Cópias em formato compacto {tópico}/{formato} (ex.: /users/{user_uuid}/msgpack)
+def encoded_policy(policy):
+    def decide(user_uuid, target_uuid, action, groups, friends):
+        if action == 'publish':
+            # PUBLISH: apenas o sistema (o backend e as regras do EMQX publicam as cópias)
+            log_decision("User %s denied publish to encoded topic - system only", user_uuid, level=logging.WARNING)
+            return False, "Only system can publish to encoded topics"
+        # SUBSCRIBE: a mesma regra do tópico base
+        return policy(user_uuid, target_uuid, action, groups, friends)
+    return decide
+
+# Famílias de tópicos conhecidas. Uma nova família (ex.: presença) é uma nova
+# regra aqui, com a sua política e o que ela precisa do banco por ação
+TOPIC_ROUTER = TopicRouter([
+    TopicRule("/groups/{uuid}", "group", group_policy, {"publish": "groups", "subscribe": "groups"}),
+    TopicRule("/dms/{uuid}", "dm", dm_policy, {"publish": "friends"}),
+    TopicRule("/users/{uuid}", "user", user_policy),
+])
+# O cliente escolhe o formato dos eventos pelo tópico que assina; sem sufixo é JSON
+for _rule in list(TOPIC_ROUTER.rules.values()):
+    for _encoding in EVENT_ENCODINGS:
+        TOPIC_ROUTER.register(TopicRule(
+            f"{_rule.pattern}/{_encoding}", f"{_rule.kind}.{_encoding}", encoded_policy(_rule.policy),
+            {"subscribe": _rule.lookups["subscribe"]} if "subscribe" in _rule.lookups else None
+        ))
+
+def parse_topic(topic):
     """
-    Autoriza acesso a um tópico baseado nas regras de negócio.
+    Identifica o tipo do tópico e o UUID alvo.
+
+    Returns:
+        tuple: (tipo, uuid) ou (None, None) se o tópico não for reconhecido
+    """
+    rule, target = TOPIC_ROUTER.match(topic)
+    if rule is None:
+        return None, None
+    return rule.kind, target
+
+def decide_topic_access(user_uuid, kind, target_uuid, topic, action, groups, friends):
+    """
+    Aplica as regras de negócio a um tópico já identificado, delegando para a
+    política da família do tópico.
 
     Args:
         user_uuid: UUID do usuário fazendo a requisição (extraído do JWT)
-        topic: Tópico MQTT (ex: /groups/{uuid})
+        kind: tipo do tópico retornado por parse_topic
+        target_uuid: UUID extraído do tópico
+        topic: Tópico MQTT original
         action: 'publish' ou 'subscribe'
+        groups: set de grupos dos quais o usuário é membro
+        friends: set de amigos aprovados do usuário
 
     Returns:
         tuple: (bool, str) - (permitido, mensagem)
     """
+    rule = TOPIC_ROUTER.rules.get(kind)
 
-    # Regex patterns para cada tipo de tópico
-    group_pattern = r'^/groups/([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$'
-    dm_pattern = r'^/dms/([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$'
-    user_pattern = r'^/users/([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$'
-
-    # REGRA 1: Tópico de grupo /groups/{group_uuid}
-    group_match = re.match(group_pattern, topic, re.IGNORECASE)
-    if group_match:
-        group_uuid = group_match.group(1)
+    if rule is not None:
+        decision = rule.policy(user_uuid, target_uuid, action, groups, friends)
+        if decision is not None:
+            return decision
 
-        # Tanto PUBLISH quanto SUBSCRIBE requerem ser membro do grupo
-        if check_group_access(user_uuid, group_uuid):
-            logger.info(f"User {user_uuid} authorized to {action} on group {group_uuid}")
-            return True, f"User is member of group {group_uuid}"
-        else:
-            logger.warning(f"User {user_uuid} denied {action} on group {group_uuid} - not a member")
-            return False, f"User is not a member of group {group_uuid}"
-
-    # REGRA 2: Tópico de DM /dms/{user_uuid}
-    dm_match = re.match(dm_pattern, topic, re.IGNORECASE)
-    if dm_match:
-        target_user_uuid = dm_match.group(1)
-
-        if action == 'subscribe':
-            # SUBSCRIBE: apenas o próprio usuário
-            if user_uuid.lower() == target_user_uuid.lower():
-                logger.info(f"User {user_uuid} authorized to subscribe to own DMs")
-                return True, "User can subscribe to own DM topic"
-            else:
-                logger.warning(f"User {user_uuid} denied subscribe to DM {target_user_uuid}")
-                return False, "Can only subscribe to own DM topic"
-
-        elif action == 'publish':
-            # PUBLISH: apenas amigos aprovados
-            if check_friendship(user_uuid, target_user_uuid):
-                logger.info(f"User {user_uuid} authorized to publish DM to friend {target_user_uuid}")
-                return True, f"User is friend with {target_user_uuid}"
-            else:
-                logger.warning(f"User {user_uuid} denied publish to DM {target_user_uuid} - not friends")
-                return False, f"User is not friend with {target_user_uuid}"
-
-    # REGRA 3: Tópico de usuário /users/{user_uuid}
-    user_match = re.match(user_pattern, topic, re.IGNORECASE)
-    if user_match:
-        target_user_uuid = user_match.group(1)
-
-        if action == 'subscribe':
-            # SUBSCRIBE: apenas o próprio usuário
-            if user_uuid.lower() == target_user_uuid.lower():
-                logger.info(f"User {user_uuid} authorized to subscribe to own user topic")
-                return True, "User can subscribe to own user topic"
-            else:
-                logger.warning(f"User {user_uuid} denied subscribe to user topic {target_user_uuid}")
-                return False, "Can only subscribe to own user topic"
-
-        elif action == 'publish':
-            # PUBLISH: apenas o sistema (negar todos)
-            logger.warning(f"User {user_uuid} denied publish to user topic - system only")
-            return False, "Only system can publish to user topics"
+        logger.warning(f"Unknown action '{action}' on topic {topic}")
+        return False, f"Action {action} is not allowed on topic {topic}"
 
     # Tópico não reconhecido
     logger.warning(f"Unknown topic pattern: {topic}")
     return False, f"Topic {topic} does not match any known pattern"
+
+def plan_topic_checks(checks):
+    """
+    Identifica os tópicos de uma lista de checks e o que precisa ser buscado.
+
+    Returns:
+        tuple: (parsed, group_uuids, friend_uuids), onde parsed é uma lista
+        de ((tipo, uuid), topic, action) na mesma ordem de checks
+    """
+    parsed = [(parse_topic(topic), topic, action) for topic, action in checks]
+
+    needed = {"groups": set(), "friends": set()}
+    for (kind, target), _, action in parsed:
+        if kind is not None:
+            lookup = TOPIC_ROUTER.rules[kind].lookups.get(action)
+            if lookup is not None:
+                needed[lookup].add(target)
+
+    return parsed, needed["groups"], needed["friends"]
+
+def decide_planned_checks(user_uuid, parsed, groups, friends):
+    return [
+        decide_topic_access(user_uuid, kind, target, topic, action, groups, friends)
+        for (kind, target), topic, action in parsed
+    ]
+
+def evaluate_topic_access_batch(user_uuid, checks):
+    """
+    Avalia vários pares (tópico, ação) de um mesmo usuário de uma vez.
+    Todos os grupos são resolvidos com uma query e todas as amizades com outra.
+
+    Args:
+        user_uuid: UUID do usuário fazendo a requisição (extraído do JWT)
+        checks: lista de tuplas (topic, action)
+
+    Returns:
+        list: lista de (bool, str) na mesma ordem de checks
+    """
+    parsed, group_uuids, friend_uuids = plan_topic_checks(checks)
+
+    groups = fetch_group_memberships(user_uuid, group_uuids)
+    friends = fetch_friendships(user_uuid, friend_uuids)
+
+    return decide_planned_checks(user_uuid, parsed, groups, friends)
+
+def evaluate_topic_access(user_uuid, topic, action):
+    """
+    Autoriza acesso a um tópico baseado nas regras de negócio.
+
+    Args:
+        user_uuid: UUID do usuário fazendo a requisição (extraído do JWT)
+        topic: Tópico MQTT (ex: /groups/{uuid})
+        action: 'publish' ou 'subscribe'
+
+    Returns:
+        tuple: (bool, str) - (permitido, mensagem)
+    """
+    return evaluate_topic_access_batch(user_uuid, [(topic, action)])[0]
+
+def authorize_topic_access_batch(user_uuid, checks):
+    """
+    Autoriza vários pares (tópico, ação), consultando antes o cache de decisões.
+    Apenas os pares que não estão em cache vão para o banco.
+
+    Args:
+        user_uuid: UUID do usuário fazendo a requisição (extraído do JWT)
+        checks: lista de tuplas (topic, action)
+
+    Returns:
+        list: lista de (bool, str) na mesma ordem de checks
+    """
+    results = [acl_cache.get(user_uuid, topic, action) for topic, action in checks]
+    missing = [i for i, decision in enumerate(results) if decision is None]
+
+    if not missing:
+        return results
+
+    # Antes da leitura: uma invalidação que chegar durante a avaliação descarta a gravação no cache
+    generation = acl_cache.generation()
+    try:
+        decisions = evaluate_topic_access_batch(user_uuid, [checks[i] for i in missing])
+    except (ValueError, Exception) as e:
+        # Erros de banco não entram no cache
+        logger.error(f"Error evaluating ACL for user {user_uuid}: {e}")
+        for i in missing:
+            results[i] = (False, "Could not evaluate access")
+        return results
+
+    for i, decision in zip(missing, decisions):
+        topic, action = checks[i]
+        acl_cache.set(user_uuid, topic, action, decision, generation)
+        results[i] = decision
+
+    return results
+
+def authorize_topic_access(user_uuid, topic, action):
+    """
+    Autoriza acesso a um tópico, consultando antes o cache de decisões.
+
+    Args:
+        user_uuid: UUID do usuário fazendo a requisição (extraído do JWT)
+        topic: Tópico MQTT (ex: /groups/{uuid})
+        action: 'publish' ou 'subscribe'
+
+    Returns:
+        tuple: (bool, str) - (permitido, mensagem)
+    """
+    return authorize_topic_access_batch(user_uuid, [(topic, action)])[0]
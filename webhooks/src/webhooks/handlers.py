@@ -0,0 +1,178 @@
+"""
+Validação dos pedidos e montagem das respostas dos webhooks do EMQX.
+
+Comum aos dois servidores: o Flask (routes.py) e o ASGI (asgi.py) só leem o
+JSON, chamam estas funções e devolvem (corpo, status) no formato de cada um.
+A única parte que muda entre eles é a avaliação das ACLs (síncrona ou não).
+"""
+import os
+from shared.validate import validate_jwt, token_cache
+from .acl_cache import acl_cache
+from .acl_graph import acl_graph
+from .acl_logic import compute_user_permissions
+from logger import logger, log_decision, log_pipeline
+
+ACL_BATCH_MAX = 500
+
+# Anexa as permissões fixas do usuário ao cliente MQTT na conexão (EMQX >= 5.7)
+ACL_ON_CONNECT = os.getenv("ACL_ON_CONNECT", "true").lower() in ("1", "true", "yes")
+
+class WebhookRequestError(Exception):
+    """Pedido recusado antes da avaliação; carrega a resposta pronta."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.body = {"result": "deny", "message": message}
+        self.status = status
+
+def _require_body(data, webhook):
+    if not data:
+        logger.warning(f"{webhook} webhook called with no JSON body")
+        raise WebhookRequestError("No JSON body provided", 400)
+
+def _authenticate(jwt_token, warning):
+    is_valid, payload = validate_jwt(jwt_token)
+
+    if not is_valid:
+        logger.warning(warning)
+        raise WebhookRequestError("JWT expired or invalid", 401)
+
+    return payload.get("sub")
+
+def handle_connect(data):
+    """
+    Autenticação da conexão MQTT. Não consulta o banco.
+
+    Returns:
+        tuple: (corpo, status)
+    """
+    try:
+        _require_body(data, "Connect")
+
+        clientid = data.get("clientid")
+        username = data.get("username")
+        jwt_token = data.get("password")  # JWT vem no campo password
+
+        if not all([clientid, username, jwt_token]):
+            logger.warning(f"Connect webhook missing fields - clientid: {clientid}, username: {username}")
+            raise WebhookRequestError("Missing required fields", 400)
+
+        user_uuid = _authenticate(jwt_token, f"Invalid JWT for client {clientid}")
+
+        # O username identifica o usuário para o EMQX (ACL de contas de serviço, /clients?username=)
+        if username != user_uuid:
+            logger.warning(f"Client {clientid} connected as {username} with a JWT of user {user_uuid}")
+            raise WebhookRequestError("Username must be the user id", 403)
+    except WebhookRequestError as e:
+        return e.body, e.status
+
+    log_decision("Client %s (user %s) authenticated successfully", clientid, user_uuid)
+
+    response = {
+        "result": "allow",
+        "message": "Connection authorized",
+        "is_superuser": False,
+        # Remetente autenticado que a regra do EMQX passa ao ingester (EMQX >= 5.7)
+        "client_attrs": {"user_id": user_uuid}
+    }
+
+    if ACL_ON_CONNECT:
+        try:
+            response["acl"] = compute_user_permissions(user_uuid)
+        except ValueError as e:
+            # Sem regras anexadas o webhook de ACL continua respondendo por tudo
+            logger.error(f"Error computing permissions for user {user_uuid} on connect: {e}")
+
+    return response, 200
+
+def parse_acl_auth(data):
+    """
+    Valida um pedido de /acl_auth.
+
+    Returns:
+        tuple: (user_uuid, [(topic, action)])
+
+    Raises:
+        WebhookRequestError: pedido inválido ou JWT recusado
+    """
+    _require_body(data, "ACL")
+
+    clientid = data.get("clientid")
+    username = data.get("username")
+    jwt_token = data.get("password")
+    topic = data.get("topic")
+    action = data.get("action")  # 'publish' ou 'subscribe'
+
+    if not all([clientid, username, jwt_token, topic, action]):
+        logger.warning(f"ACL webhook missing fields")
+        raise WebhookRequestError("Missing required fields", 400)
+
+    user_uuid = _authenticate(jwt_token, f"Invalid JWT for ACL check on topic {topic}")
+    return user_uuid, [(topic, action)]
+
+def acl_auth_response(decisions):
+    allowed, message = decisions[0]
+    if allowed:
+        return {"result": "allow", "message": message}, 200
+    return {"result": "deny", "message": message}, 403
+
+def parse_acl_auth_batch(data):
+    """
+    Valida um pedido de /acl_auth/batch.
+
+    Returns:
+        tuple: (user_uuid, [(topic, action)])
+
+    Raises:
+        WebhookRequestError: pedido inválido ou JWT recusado
+    """
+    _require_body(data, "ACL batch")
+
+    clientid = data.get("clientid")
+    username = data.get("username")
+    jwt_token = data.get("password")
+    checks = data.get("checks")
+
+    if not all([clientid, username, jwt_token, checks]) or not isinstance(checks, list):
+        logger.warning(f"ACL batch webhook missing fields")
+        raise WebhookRequestError("Missing required fields", 400)
+
+    if len(checks) > ACL_BATCH_MAX:
+        raise WebhookRequestError(f"At most {ACL_BATCH_MAX} checks per batch", 400)
+
+    pairs = []
+    for check in checks:
+        topic = check.get("topic") if isinstance(check, dict) else None
+        action = check.get("action") if isinstance(check, dict) else None
+        if not topic or not action:
+            raise WebhookRequestError("Every check needs 'topic' and 'action'", 400)
+        pairs.append((topic, action))
+
+    user_uuid = _authenticate(jwt_token, f"Invalid JWT for ACL batch check from client {clientid}")
+    return user_uuid, pairs
+
+def acl_auth_batch_response(pairs, decisions):
+    return {
+        "results": [
+            {
+                "topic": topic,
+                "action": action,
+                "result": "allow" if allowed else "deny",
+                "message": message
+            }
+            for (topic, action), (allowed, message) in zip(pairs, decisions)
+        ]
+    }, 200
+
+def internal_error(webhook, e):
+    logger.error(f"Error in {webhook} webhook: {e}")
+    return {"result": "deny", "message": "Internal server error"}, 500
+
+def stats_response():
+    """Contadores dos caches de decisões ACL, de JWTs verificados, do acl_graph e dos logs deste worker"""
+    return {
+        "acl_cache": acl_cache.stats(),
+        "jwt_cache": token_cache.stats(),
+        "acl_graph": acl_graph.stats(),
+        "logging": log_pipeline.stats(),
+    }, 200
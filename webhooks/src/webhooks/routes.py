@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
-from shared.validate import validate_jwt
-from .acl_logic import authorize_topic_access
-from logger import logger
+from .acl_logic import authorize_topic_access_batch
+from .handlers import (
+    WebhookRequestError, handle_connect, parse_acl_auth, acl_auth_response,
+    parse_acl_auth_batch, acl_auth_batch_response, internal_error, stats_response
+)
 
 webhooks_bp = Blueprint("webhooks", __name__, url_prefix="/webhooks/v1")
 
@@ -13,49 +15,28 @@ def connect():
     Body esperado:
     {
         "clientid": "string",
-        "username": "string",
+        "username": "uuid do usuário (o sub do JWT)",
         "password": "JWT_TOKEN"
     }
 
     Response:
     {
         "result": "allow" | "deny",
-        "message": "..."
+        "message": "...",
+        "is_superuser": false,
+        "client_attrs": {"user_id": "{uuid}"},
+        "acl": [{"permission": "allow", "action": "subscribe", "topic": "/dms/{uuid}"}, ...]
     }
+
+    O campo "acl" só aparece quando a conexão é autorizada e traz apenas as
+    regras que não podem ser revogadas (assinar os próprios tópicos); grupos e
+    DMs de amigos continuam passando pelo webhook de ACL.
     """
     try:
-        data = request.get_json()
-
-        if not data:
-            logger.warning("Connect webhook called with no JSON body")
-            return jsonify({"result": "deny", "message": "No JSON body provided"}), 400
-
-        clientid = data.get("clientid")
-        username = data.get("username")
-        jwt_token = data.get("password")  # JWT vem no campo password
-
-        if not all([clientid, username, jwt_token]):
-            logger.warning(f"Connect webhook missing fields - clientid: {clientid}, username: {username}")
-            return jsonify({"result": "deny", "message": "Missing required fields"}), 400
-
-        # Validar JWT
-        is_valid, payload = validate_jwt(jwt_token)
-
-        if not is_valid:
-            logger.warning(f"Invalid JWT for client {clientid}")
-            return jsonify({"result": "deny", "message": "JWT expired or invalid"}), 401
-
-        user_uuid = payload.get("sub")
-        logger.info(f"Client {clientid} (user {user_uuid}) authenticated successfully")
-
-        return jsonify({
-            "result": "allow",
-            "message": "Connection authorized"
-        }), 200
-
+        response, status = handle_connect(request.get_json(silent=True))
     except Exception as e:
-        logger.error(f"Error in connect webhook: {e}")
-        return jsonify({"result": "deny", "message": "Internal server error"}), 500
+        response, status = internal_error("connect", e)
+    return jsonify(response), status
 
 @webhooks_bp.route("/acl_auth", methods=["POST"])
 def acl_auth():
@@ -78,50 +59,54 @@ def acl_auth():
     }
     """
     try:
-        data = request.get_json()
-
-        if not data:
-            logger.warning("ACL webhook called with no JSON body")
-            return jsonify({"result": "deny", "message": "No JSON body provided"}), 400
-
-        clientid = data.get("clientid")
-        username = data.get("username")
-        jwt_token = data.get("password")
-        topic = data.get("topic")
-        action = data.get("action")  # 'publish' ou 'subscribe'
-
-        if not all([clientid, username, jwt_token, topic, action]):
-            logger.warning(f"ACL webhook missing fields")
-            return jsonify({"result": "deny", "message": "Missing required fields"}), 400
-
-        # Validar JWT
-        is_valid, payload = validate_jwt(jwt_token)
-
-        if not is_valid:
-            logger.warning(f"Invalid JWT for ACL check on topic {topic}")
-            return jsonify({"result": "deny", "message": "JWT expired or invalid"}), 401
-
-        user_uuid = payload.get("sub")
+        user_uuid, pairs = parse_acl_auth(request.get_json(silent=True))
+        response, status = acl_auth_response(authorize_topic_access_batch(user_uuid, pairs))
+    except WebhookRequestError as e:
+        response, status = e.body, e.status
+    except Exception as e:
+        response, status = internal_error("ACL", e)
+    return jsonify(response), status
 
-        # Verificar autorização no tópico
-        allowed, message = authorize_topic_access(user_uuid, topic, action)
+@webhooks_bp.route("/acl_auth/batch", methods=["POST"])
+def acl_auth_batch():
+    """
+    Autorização ACL em lote para um mesmo usuário (ex: assinaturas ao reconectar).
 
-        if allowed:
-            return jsonify({
-                "result": "allow",
-                "message": message
-            }), 200
-        else:
-            return jsonify({
-                "result": "deny",
-                "message": message
-            }), 403
+    Body esperado:
+    {
+        "clientid": "string",
+        "username": "string",
+        "password": "JWT_TOKEN",
+        "checks": [
+            {"topic": "/groups/{uuid}", "action": "publish" | "subscribe"},
+            ...
+        ]
+    }
 
+    Response:
+    {
+        "results": [
+            {"topic": "...", "action": "...", "result": "allow" | "deny", "message": "..."},
+            ...
+        ]
+    }
+    """
+    try:
+        user_uuid, pairs = parse_acl_auth_batch(request.get_json(silent=True))
+        response, status = acl_auth_batch_response(pairs, authorize_topic_access_batch(user_uuid, pairs))
+    except WebhookRequestError as e:
+        response, status = e.body, e.status
     except Exception as e:
-        logger.error(f"Error in ACL webhook: {e}")
-        return jsonify({"result": "deny", "message": "Internal server error"}), 500
+        response, status = internal_error("ACL batch", e)
+    return jsonify(response), status
 
 @webhooks_bp.route("/ping", methods=["GET"])
 def ping():
     """Endpoint de health check"""
     return jsonify({"message": "Webhooks server is active"}), 200
+
+@webhooks_bp.route("/stats", methods=["GET"])
+def stats():
+    """Contadores dos caches de decisões ACL, de JWTs verificados, do acl_graph e dos logs deste worker"""
+    response, status = stats_response()
+    return jsonify(response), status
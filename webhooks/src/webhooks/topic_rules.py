@@ -0,0 +1,77 @@
+"""
+Registro declarativo das famílias de tópicos MQTT.
+
+Cada regra descreve um padrão de tópico ("/groups/{uuid}"), o tipo (kind)
+usado pelo resto da ACL, a função de política que decide o acesso e quais
+dados do banco a decisão precisa por ação. As regras são compiladas uma vez
+numa única expressão (uma alternativa por regra, cada uma com um grupo para o
+UUID): identificar um tópico é um único match, e o grupo que casou indexa a
+tabela de regras.
+"""
+import re
+
+UUID_PLACEHOLDER = "{uuid}"
+UUID_PATTERN = r'([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})'
+
+# Formatos compactos dos eventos do backend (backend/src/app/emqx/event_codec.py,
+# COMPACT_ENCODINGS): cada um sai numa cópia em {tópico}/{formato}
+EVENT_ENCODINGS = ("msgpack", "cbor")
+
+def base_topic(topic):
+    """Tópico sem o sufixo de formato: /groups/{id}/msgpack -> /groups/{id}"""
+    head, _, last = topic.rpartition("/")
+    return head if last in EVENT_ENCODINGS and head.count("/") == 2 else topic
+
+class TopicRule:
+    """
+    Args:
+        pattern: padrão do tópico, com segmentos literais e um "{uuid}"
+        kind: nome do tipo do tópico (ex.: "group")
+        policy: função (user_uuid, target_uuid, action, groups, friends) -> (bool, str),
+            ou None se a ação não se aplica à família
+        lookups: dict ação -> "groups" | "friends", o que precisa ser buscado para decidir
+    """
+
+    __slots__ = ("pattern", "kind", "policy", "lookups")
+
+    def __init__(self, pattern, kind, policy, lookups=None):
+        self.pattern = pattern
+        self.kind = kind
+        self.policy = policy
+        self.lookups = lookups or {}
+
+class TopicRouter:
+    """Tabela de despacho compilada a partir de uma lista de TopicRule."""
+
+    def __init__(self, rules=()):
+        self.rules = {}
+        self._table = []
+        self._pattern = None
+        for rule in rules:
+            self.register(rule)
+
+    def register(self, rule):
+        if rule.kind in self.rules:
+            raise ValueError(f"Topic kind '{rule.kind}' registered twice")
+        if not rule.pattern.startswith("/") or rule.pattern.count(UUID_PLACEHOLDER) != 1:
+            raise ValueError(f"Topic pattern '{rule.pattern}' must start with '/' and contain exactly one {UUID_PLACEHOLDER}")
+
+        self.rules[rule.kind] = rule
+        # O índice do grupo de captura na expressão é a posição da regra + 1
+        self._table.append(rule)
+        self._pattern = re.compile("|".join(
+            re.escape(r.pattern.lower()).replace(re.escape(UUID_PLACEHOLDER), UUID_PATTERN) for r in self._table
+        ))
+
+    def match(self, topic):
+        """
+        Identifica a regra do tópico e o UUID alvo com um único match.
+        O tópico é comparado em minúsculas (sem re.IGNORECASE, que é mais lento).
+
+        Returns:
+            tuple: (TopicRule, uuid em minúsculas) ou (None, None)
+        """
+        match = self._pattern.fullmatch(topic.lower()) if self._pattern is not None else None
+        if match is None:
+            return None, None
+        return self._table[match.lastindex - 1], match.group(match.lastindex)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Mesmos caminhos do Docker: o código dos webhooks e o backend (schema, tokencache, logpipeline)
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.append(os.path.join(HERE, "..", "..", "backend", "src"))
@@ -0,0 +1,58 @@
+"""
+Tópicos com sufixo de formato ({tópico}/{formato}): o cliente assina com a
+mesma regra do tópico base, e só o sistema publica neles.
+"""
+import os
+import uuid
+import pytest
+
+@pytest.fixture(scope="module")
+def acl_logic(tmp_path_factory):
+    # O logger dos webhooks grava em logs/ relativo ao diretório atual
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("encoded_topics"))
+    try:
+        from webhooks import acl_logic
+    finally:
+        os.chdir(cwd)
+    return acl_logic
+
+def decide(acl_logic, user, topic, action, groups=frozenset()):
+    kind, target = acl_logic.parse_topic(topic)
+    allowed, _ = acl_logic.decide_topic_access(user, kind, target, topic, action, set(groups), set())
+    return allowed
+
+@pytest.mark.parametrize("encoding", ["msgpack", "cbor"])
+def test_group_copy_follows_group_membership(acl_logic, encoding):
+    user, group = str(uuid.uuid4()), str(uuid.uuid4())
+    topic = f"/groups/{group}/{encoding}"
+
+    assert acl_logic.parse_topic(topic) == (f"group.{encoding}", group)
+    assert decide(acl_logic, user, topic, "subscribe", {group})
+    assert not decide(acl_logic, user, topic, "subscribe")
+    assert not decide(acl_logic, user, topic, "publish", {group})
+
+def test_own_user_and_dm_copies(acl_logic):
+    me, other = str(uuid.uuid4()), str(uuid.uuid4())
+
+    assert decide(acl_logic, me, f"/users/{me}/msgpack", "subscribe")
+    assert decide(acl_logic, me, f"/dms/{me}/cbor", "subscribe")
+    assert not decide(acl_logic, me, f"/users/{other}/msgpack", "subscribe")
+    assert not decide(acl_logic, me, f"/dms/{other}/msgpack", "publish")
+
+    topics = {rule["topic"] for rule in acl_logic.compute_user_permissions(me)}
+    assert {f"/users/{me}", f"/users/{me}/msgpack", f"/dms/{me}/cbor"} <= topics
+
+def test_unknown_suffix_is_not_a_copy(acl_logic):
+    assert acl_logic.parse_topic(f"/groups/{uuid.uuid4()}/json") == (None, None)
+
+def test_invalidating_a_topic_drops_its_copies():
+    from webhooks.acl_cache import ACLDecisionCache
+
+    cache = ACLDecisionCache(enabled=True)
+    user, group = str(uuid.uuid4()), str(uuid.uuid4())
+    for topic in (f"/groups/{group}", f"/groups/{group}/msgpack"):
+        cache.set(user, topic, "subscribe", (True, "member"))
+
+    assert cache.invalidate(topic=f"/groups/{group}") == 2
+    assert cache.get(user, f"/groups/{group}/msgpack", "subscribe") is None
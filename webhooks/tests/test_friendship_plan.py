@@ -0,0 +1,84 @@
+"""
+Confere no plano de execução que as consultas de amizade usam a PK canônica
+(user_low_id, user_high_id) como busca por índice, e não uma varredura.
+
+Usa um SQLite temporário, ou o banco de TEST_DATABASE_URL (ex.: Postgres).
+"""
+import os
+import uuid
+import pytest
+from flask import Flask
+from sqlalchemy import select, text
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp("friendship_plan")
+    # O logger dos webhooks grava em logs/ relativo ao diretório atual
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        from shared.schema import db, User, Friendship, FriendshipStatus
+    finally:
+        os.chdir(cwd)
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("TEST_DATABASE_URL", f"sqlite:///{workdir / 'plan.db'}")
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        users = [User(username=f"plan{i}", password="x", name=f"Plan {i}", email=f"plan{i}@test.local") for i in range(50)]
+        db.session.add_all(users)
+        db.session.flush()
+        for i, user in enumerate(users):
+            friend = users[(i + 1) % len(users)]
+            db.session.add(Friendship(requester_id=user.id, addressee_id=friend.id, status=FriendshipStatus.APPROVED))
+        db.session.commit()
+
+        yield db
+
+        db.session.rollback()
+        if "TEST_DATABASE_URL" not in os.environ:
+            db.drop_all()
+
+def explain(db, statement):
+    dialect = db.engine.dialect
+    compiled = statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+
+    if dialect.name == "postgresql":
+        # Sem isso o planner pode preferir seq scan numa tabela pequena
+        db.session.execute(text("SET LOCAL enable_seqscan = off"))
+        rows = db.session.execute(text(f"EXPLAIN {compiled}")).scalars()
+    else:
+        rows = (row[-1] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+
+    return "\n".join(rows)
+
+def assert_uses_pair_index(db, statement):
+    plan = explain(db, statement)
+    if db.engine.dialect.name == "postgresql":
+        assert "friendships_pkey" in plan and "Seq Scan" not in plan, plan
+    else:
+        assert "SEARCH friendships USING" in plan and "user_low_id=? AND user_high_id=?" in plan, plan
+
+def test_get_between_seeks_the_pair_key(db):
+    from shared.schema import Friendship
+
+    user, friend = db.session.execute(select(Friendship.requester_id, Friendship.addressee_id).limit(1)).one()
+    low, high = Friendship.pair_key(user, friend)
+
+    # Mesma consulta gerada por Friendship.get_between (session.get pela PK)
+    assert_uses_pair_index(db, select(Friendship).where(Friendship.user_low_id == low, Friendship.user_high_id == high))
+    assert Friendship.get_between(friend, user) is not None
+
+def test_acl_friendships_query_seeks_the_pair_key(db):
+    from shared.schema import Friendship
+    from webhooks.acl_logic import friendships_query, read_friendships
+
+    user, friend = (str(u) for u in db.session.execute(select(Friendship.requester_id, Friendship.addressee_id).limit(1)).one())
+    # Um amigo e vários ids que não são amigos do usuário
+    others = [friend] + [str(uuid.uuid4()) for _ in range(20)]
+
+    query = friendships_query(user, others)
+    assert_uses_pair_index(db, query)
+    assert read_friendships(user, db.session.execute(query)) == {friend}